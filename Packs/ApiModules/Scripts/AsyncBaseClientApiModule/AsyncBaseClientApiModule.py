@@ -0,0 +1,295 @@
+from CommonServerPython import *
+
+''' IMPORTS '''
+import asyncio
+import aiohttp
+from urllib.parse import urlparse
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+''' GLOBALS '''
+# Maximal number of requests which are sent at the same time by a client
+DEFAULT_MAX_CONCURRENCY = 10
+
+
+class HostRateLimiter:
+    """Spaces the requests to each host, so no more than the given number of requests per second is sent to it.
+    Args:
+        rate_limit(float): The default number of requests per second to each host. If None, not limited.
+        host_rate_limits(dict): The number of requests per second to specific hosts, by the host name.
+    """
+
+    def __init__(self, rate_limit: Optional[float] = None, host_rate_limits: Optional[Dict[str, float]] = None):
+        self.rate_limit = rate_limit
+        self.host_rate_limits = host_rate_limits or {}
+        # the loop time in which the next request to each host can be sent
+        self._next_request_times: Dict[str, float] = {}
+
+    def get_rate_limit(self, host: str) -> Optional[float]:
+        return self.host_rate_limits.get(host, self.rate_limit)
+
+    async def wait(self, host: str):
+        """Waits until a request can be sent to the given host.
+        Args:
+            host(str): The host the request is sent to.
+        """
+        rate_limit = self.get_rate_limit(host)
+        if not rate_limit:
+            return
+        now = asyncio.get_event_loop().time()
+        request_time = max(now, self._next_request_times.get(host, now))
+        # the time slot is reserved before sleeping, so concurrent requests are queued one after the other
+        self._next_request_times[host] = request_time + 1 / rate_limit
+        if request_time > now:
+            await asyncio.sleep(request_time - now)
+
+
+class AsyncBaseClient:
+    """Asynchronous client to use in integrations which send many independent requests, for example
+    reputation commands which enrich a list of indicators. The requests are sent concurrently, and are
+    handled like in the ``_http_request`` of the ``BaseClient``.
+    The client should be used as an asynchronous context manager, which opens and closes its session:
+
+        async with AsyncBaseClient('https://example.com/api/') as client:
+            await client._http_request('GET', 'ip/8.8.8.8')
+
+    Args:
+        base_url(str): Base server address with suffix, for example: https://example.com/api/v2/.
+        verify(bool): Whether the request should verify the SSL certificate.
+        proxy(bool): Whether to run the integration using the system proxy.
+        ok_codes(tuple): The request codes to accept as OK, for example: (200, 201, 204).
+            If empty, will accept all the codes lower than 400.
+        headers(dict): The request headers, for example: {'Accept`: `application/json`}.
+        auth(tuple): The request authorization, for example: (username, password).
+        max_concurrency(int): The maximal number of requests which are sent at the same time.
+        rate_limit(float): The maximal number of requests per second to each host. If None, not limited.
+        host_rate_limits(dict): The maximal number of requests per second to specific hosts, by the host name.
+    """
+
+    def __init__(self, base_url: str, verify: bool = True, proxy: bool = False, ok_codes: tuple = tuple(),
+                 headers: Optional[Dict] = None, auth: Optional[Union[Tuple, aiohttp.BasicAuth]] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, rate_limit: Optional[float] = None,
+                 host_rate_limits: Optional[Dict[str, float]] = None):
+        self._base_url = base_url
+        self._verify = verify
+        self._proxy = proxy
+        self._ok_codes = ok_codes
+        self._headers = headers
+        self._auth = auth
+        self._max_concurrency = max_concurrency
+        self._rate_limiter = HostRateLimiter(rate_limit, host_rate_limits)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        self._open_session()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _open_session(self) -> aiohttp.ClientSession:
+        # the session and the semaphore are created here, as they must be created in the running event loop
+        if self._session is None or self._session.closed:
+            connector_kwargs = {} if self._verify else {'ssl': False}
+            connector = aiohttp.TCPConnector(limit=self._max_concurrency, **connector_kwargs)
+            # the system proxy is taken from the environment variables, like in the requests session
+            self._session = aiohttp.ClientSession(connector=connector, trust_env=self._proxy)
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._session
+
+    async def close(self):
+        """Closes the session of the client and its connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _http_request(self, method: str, url_suffix: str = '', full_url: Optional[str] = None,
+                            headers: Optional[Dict] = None, auth: Optional[Union[Tuple, aiohttp.BasicAuth]] = None,
+                            json_data: Optional[Any] = None, params: Optional[Dict] = None, data: Optional[Any] = None,
+                            timeout: Union[float, Tuple[float, float]] = 10, resp_type: str = 'json',
+                            ok_codes: Optional[tuple] = None, return_empty_response: bool = False, **kwargs) -> Any:
+        """Sends a request and handles its response and errors like the ``_http_request`` of the ``BaseClient``.
+        Args:
+            method(str): The HTTP method, for example: GET, POST, and so on.
+            url_suffix(str): The API endpoint.
+            full_url(str): Bypasses the use of self._base_url + url_suffix.
+            headers(dict): Headers to send in the request. If None, will use self._headers.
+            auth(tuple): The authorization tuple (username, password). If None, will use self._auth.
+            json_data(dict): The dictionary to send in a 'POST' request.
+            params(dict): URL parameters to specify the query.
+            data(dict): The data to send in a 'POST' request.
+            timeout(float): The timeout of the request in seconds, or a tuple of the connection and read timeouts.
+            resp_type(str): Determines which data format to return from the HTTP request. The default
+                is 'json'. Other options are 'text', 'content' or 'response'. Use 'response' to return the
+                response object, which body is already read.
+            ok_codes(tuple): The request codes to accept as OK. If None, will use self._ok_codes.
+            return_empty_response(bool): Whether to return the response object of a 204 response.
+        Returns:
+            dict, str, bytes or aiohttp.ClientResponse. Depends on the resp_type argument.
+        """
+        address = full_url if full_url else urljoin(self._base_url, url_suffix)
+        headers = headers if headers else self._headers
+        auth = auth if auth else self._auth
+        if isinstance(auth, tuple):
+            auth = aiohttp.BasicAuth(*auth)
+        if isinstance(timeout, tuple):
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+        session = self._open_session()
+        await self._rate_limiter.wait(urlparse(address).netloc)
+        try:
+            async with self._semaphore:  # type: ignore[union-attr]
+                async with session.request(method, address, params=params, data=data, json=json_data,
+                                           headers=headers, auth=auth, timeout=client_timeout, **kwargs) as res:
+                    # the body is read before the connection is released, so it is available afterwards
+                    content = await res.read()
+        except asyncio.TimeoutError as exception:
+            err_msg = 'Connection Timeout Error - potential reasons might be that the Server URL parameter' \
+                      ' is incorrect or that the Server is not accessible from your host.'
+            raise DemistoException(err_msg, exception)
+        except aiohttp.ClientSSLError as exception:
+            err_msg = 'SSL Certificate Verification Failed - try selecting \'Trust any certificate\' checkbox in' \
+                      ' the integration configuration.'
+            raise DemistoException(err_msg, exception)
+        except aiohttp.ClientProxyConnectionError as exception:
+            err_msg = 'Proxy Error - if the \'Use system proxy\' checkbox in the integration configuration is' \
+                      ' selected, try clearing the checkbox.'
+            raise DemistoException(err_msg, exception)
+        except aiohttp.ClientConnectionError as exception:
+            err_type = '<{}.{}>'.format(exception.__class__.__module__, exception.__class__.__name__)
+            err_msg = '\nError Type: {}\nError Number: [{}]\nMessage: {}\n' \
+                      'Verify that the server URL parameter' \
+                      ' is correct and that you have access to the server from your host.' \
+                .format(err_type, getattr(exception, 'errno', None), getattr(exception, 'strerror', str(exception)))
+            raise DemistoException(err_msg, exception)
+
+        if not self._is_status_code_valid(res, ok_codes):
+            err_msg = 'Error in API call [{}] - {}'.format(res.status, res.reason)
+            try:
+                # Try to parse json error response
+                err_msg += '\n{}'.format(json.dumps(json.loads(content)))
+            except ValueError:
+                err_msg += '\n{}'.format(content.decode(res.get_encoding(), errors='replace'))
+            raise DemistoException(err_msg)
+
+        if res.status == 204 and return_empty_response:
+            return res
+
+        resp_type = resp_type.lower()
+        try:
+            if resp_type == 'json':
+                return json.loads(content)
+            if resp_type == 'text':
+                return content.decode(res.get_encoding())
+            if resp_type == 'content':
+                return content
+            return res
+        except ValueError as exception:
+            raise DemistoException('Failed to parse json object from response: {!r}'.format(content), exception)
+
+    def _is_status_code_valid(self, response: aiohttp.ClientResponse, ok_codes: Optional[tuple] = None) -> bool:
+        """If the status code is OK, return 'True'.
+        Args:
+            response(aiohttp.ClientResponse): Response from API after the request for which to check the status.
+            ok_codes(tuple): The request codes to accept as OK. If None, will use self._ok_codes.
+        Returns:
+            bool. Whether the status of the response is valid.
+        """
+        status_codes = ok_codes if ok_codes else self._ok_codes
+        if status_codes:
+            return response.status in status_codes
+        return response.ok
+
+
+async def gather_indicators_results(client: AsyncBaseClient,
+                                    indicator_command: Callable[..., Awaitable[CommandResults]],
+                                    indicators: Iterable[str], *args, **kwargs) -> List[Union[CommandResults, Exception]]:
+    """Runs the command of each of the indicators concurrently, in the session of the client.
+    Args:
+        client(AsyncBaseClient): The client to send the requests with.
+        indicator_command(function): A coroutine function which gets the client, an indicator and the
+            given args and kwargs, and returns the CommandResults of the indicator.
+        indicators(list): The indicators to run the command for.
+    Returns:
+        list. The CommandResults of each of the indicators, or the exception raised for it, by the indicators order.
+    """
+    async with client:
+        return await asyncio.gather(*(indicator_command(client, indicator, *args, **kwargs)
+                                      for indicator in indicators), return_exceptions=True)
+
+
+def merge_command_results(indicators: List[str], results: List[Union[CommandResults, Exception]]) -> CommandResults:
+    """Merges the CommandResults of several indicators into a single CommandResults. The indicators which
+    failed are listed in the readable output. If no indicators were given, only a readable output is returned.
+    Args:
+        indicators(list): The indicators.
+        results(list): The CommandResults of each of the indicators, or the exception raised for it.
+    Returns:
+        CommandResults. The merged results.
+    """
+    succeeded = [result for result in results if isinstance(result, CommandResults)]
+    failed = [(indicator, result) for indicator, result in zip(indicators, results)
+              if not isinstance(result, CommandResults)]
+    if failed and not succeeded:
+        indicator, exception = failed[0]
+        raise DemistoException('Failed to enrich {}: {}'.format(indicator, exception), exception)
+    if not succeeded:
+        return CommandResults(outputs_prefix=None, outputs_key_field=None, outputs=None,
+                              readable_output='No indicators were given.')
+
+    outputs: List[Any] = []
+    raw_responses: List[Any] = []
+    merged_indicators: List[Any] = []
+    readable_outputs: List[str] = []
+    for result in succeeded:
+        if result.outputs:
+            outputs.extend(result.outputs if isinstance(result.outputs, list) else [result.outputs])
+        raw_response = result.raw_response or result.outputs
+        if raw_response:
+            raw_responses.extend(raw_response if isinstance(raw_response, list) else [raw_response])
+        merged_indicators.extend(result.indicators or [])
+        if result.readable_output:
+            readable_outputs.append(result.readable_output)
+    for indicator, exception in failed:
+        demisto.debug('Failed to enrich {}: {}'.format(indicator, exception))
+        readable_outputs.append('Failed to enrich {}: {}'.format(indicator, exception))
+
+    first_result = succeeded[0]
+    return CommandResults(
+        outputs_prefix=first_result.outputs_prefix,
+        outputs_key_field=first_result.outputs_key_field,
+        outputs=outputs,
+        indicators=merged_indicators,
+        readable_output='\n'.join(readable_outputs) if readable_outputs else None,
+        raw_response=raw_responses
+    )
+
+
+def run_indicators_command(client: AsyncBaseClient, indicator_command: Callable[..., Awaitable[CommandResults]],
+                           indicators: List[str], *args, **kwargs) -> CommandResults:
+    """Runs the command of each of the indicators concurrently and merges their results, for example:
+
+        async def ip_command(client, ip):
+            raw_response = await client._http_request('GET', 'ip/{}'.format(ip))
+            return CommandResults(...)
+
+        return_results(run_indicators_command(client, ip_command, argToList(args.get('ip'))))
+
+    Args:
+        client(AsyncBaseClient): The client to send the requests with.
+        indicator_command(function): A coroutine function which gets the client, an indicator and the
+            given args and kwargs, and returns the CommandResults of the indicator.
+        indicators(list): The indicators to run the command for.
+    Returns:
+        CommandResults. The merged results of the indicators.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(gather_indicators_results(client, indicator_command, indicators,
+                                                                    *args, **kwargs))
+    finally:
+        loop.close()
+    return merge_command_results(indicators, results)
@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+from AsyncBaseClientApiModule import AsyncBaseClient, HostRateLimiter, run_indicators_command
+from CommonServerPython import *
+from aioresponses import aioresponses
+import pytest
+
+BASE_URL = 'https://example.com/api/'
+
+
+async def ip_command(client, ip):
+    raw_response = await client._http_request('GET', 'ip/{}'.format(ip))
+    return CommandResults(outputs_prefix='Example.IP', outputs_key_field='ip', outputs=raw_response,
+                          readable_output='IP {} score: {}'.format(ip, raw_response['score']))
+
+
+@pytest.mark.asyncio
+async def test_http_request():
+    """
+    Given
+        - An API which returns a JSON response
+    When
+        - Sending requests with the different response types
+    Then
+        - Ensure the response is returned in the requested format
+    """
+    with aioresponses() as mocked:
+        mocked.get(BASE_URL + 'ip/1.1.1.1', payload={'score': 1}, repeat=True)
+        async with AsyncBaseClient(BASE_URL) as client:
+            assert await client._http_request('GET', 'ip/1.1.1.1') == {'score': 1}
+            assert await client._http_request('GET', 'ip/1.1.1.1', resp_type='text') == '{"score": 1}'
+            assert await client._http_request('GET', 'ip/1.1.1.1', resp_type='content') == b'{"score": 1}'
+            response = await client._http_request('GET', 'ip/1.1.1.1', resp_type='response')
+            assert response.status == 200
+
+
+@pytest.mark.asyncio
+async def test_http_request_error():
+    """
+    Given
+        - An API which returns an error status code, and an API which returns invalid JSON
+    When
+        - Sending requests to the APIs
+    Then
+        - Ensure the errors are raised like in the BaseClient
+    """
+    with aioresponses() as mocked:
+        mocked.get(BASE_URL + 'error', status=404, reason='Not Found', payload={'error': 'not found'})
+        mocked.get(BASE_URL + 'invalid', body='not json')
+        async with AsyncBaseClient(BASE_URL) as client:
+            with pytest.raises(DemistoException, match=r'Error in API call \[404\] - Not Found\n{"error": "not found"}'):
+                await client._http_request('GET', 'error')
+            with pytest.raises(DemistoException, match='Failed to parse json object from response'):
+                await client._http_request('GET', 'invalid')
+
+
+@pytest.mark.asyncio
+async def test_http_request_concurrency():
+    """
+    Given
+        - A client with a maximal concurrency of 2
+    When
+        - Sending 6 requests, which take 0.1 seconds each
+    Then
+        - Ensure no more than 2 requests are sent at the same time
+    """
+    running = []
+    max_running = []
+
+    async def slow_response(url, **kwargs):
+        running.append(url)
+        max_running.append(len(running))
+        await asyncio.sleep(0.1)
+        running.remove(url)
+
+    with aioresponses() as mocked:
+        mocked.get(BASE_URL + 'ip/1.1.1.1', payload={'score': 1}, callback=slow_response, repeat=True)
+        async with AsyncBaseClient(BASE_URL, max_concurrency=2) as client:
+            await asyncio.gather(*(client._http_request('GET', 'ip/1.1.1.1') for _ in range(6)))
+    assert max(max_running) == 2
+
+
+@pytest.mark.asyncio
+async def test_host_rate_limiter():
+    """
+    Given
+        - A rate limiter of 20 requests per second to example.com, which does not limit other hosts
+    When
+        - Waiting for 5 requests to each host
+    Then
+        - Ensure the requests to example.com are spaced by 0.05 seconds
+        - Ensure the requests to other hosts are not delayed
+    """
+    rate_limiter = HostRateLimiter(host_rate_limits={'example.com': 20})
+    start = time.monotonic()
+    await asyncio.gather(*(rate_limiter.wait('other.com') for _ in range(5)))
+    assert time.monotonic() - start < 0.05
+    await asyncio.gather(*(rate_limiter.wait('example.com') for _ in range(5)))
+    assert time.monotonic() - start >= 0.2
+
+
+def test_run_indicators_command():
+    """
+    Given
+        - An API which fails for one of the IPs
+    When
+        - Enriching 3 IPs concurrently
+    Then
+        - Ensure the results of the IPs are merged by the IPs order
+        - Ensure the failed IP is listed in the readable output
+    """
+    with aioresponses() as mocked:
+        mocked.get(BASE_URL + 'ip/1.1.1.1', payload={'ip': '1.1.1.1', 'score': 1})
+        mocked.get(BASE_URL + 'ip/2.2.2.2', status=500, reason='Internal Server Error', body='error')
+        mocked.get(BASE_URL + 'ip/3.3.3.3', payload={'ip': '3.3.3.3', 'score': 3})
+        results = run_indicators_command(AsyncBaseClient(BASE_URL), ip_command, ['1.1.1.1', '2.2.2.2', '3.3.3.3'])
+
+    assert results.outputs == [{'ip': '1.1.1.1', 'score': 1}, {'ip': '3.3.3.3', 'score': 3}]
+    assert results.outputs_prefix == 'Example.IP'
+    assert results.readable_output.splitlines() == [
+        'IP 1.1.1.1 score: 1',
+        'IP 3.3.3.3 score: 3',
+        'Failed to enrich 2.2.2.2: Error in API call [500] - Internal Server Error',
+        'error'
+    ]
+
+
+def test_run_indicators_command_all_failed():
+    """
+    Given
+        - An API which fails for all the IPs
+    When
+        - Enriching the IPs concurrently
+    Then
+        - Ensure an error is raised
+    """
+    with aioresponses() as mocked:
+        mocked.get(BASE_URL + 'ip/1.1.1.1', status=500, reason='Internal Server Error', body='error')
+        with pytest.raises(DemistoException, match='Failed to enrich 1.1.1.1'):
+            run_indicators_command(AsyncBaseClient(BASE_URL), ip_command, ['1.1.1.1'])
+
+
+def test_run_indicators_command_no_indicators():
+    """
+    Given
+        - No IPs
+    When
+        - Enriching the IPs concurrently
+    Then
+        - Ensure a readable output without outputs is returned
+    """
+    results = run_indicators_command(AsyncBaseClient(BASE_URL), ip_command, [])
+    assert results.readable_output == 'No indicators were given.'
+    assert results.outputs is None
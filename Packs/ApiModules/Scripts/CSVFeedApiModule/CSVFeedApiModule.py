@@ -4,21 +4,31 @@ from CommonServerUserPython import *
 
 ''' IMPORTS '''
 import csv
-import gzip
+import zlib
+import codecs
 import urllib3
+import concurrent.futures
 from dateutil.parser import parse
 from typing import Optional, Pattern, Dict, Any, Tuple, Union
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
+''' GLOBALS '''
+# Number of indicators sent in each createIndicators call
+DEFAULT_INDICATORS_BATCH_SIZE = 2000
+# Size in bytes of the chunks read from the feed response while streaming it
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Maximal number of feed URLs requested concurrently
+DEFAULT_MAX_FETCH_WORKERS = 10
+
 
 class Client(BaseClient):
     def __init__(self, url: str, feed_url_to_config: Optional[Dict[str, dict]] = None, fieldnames: str = '',
                  insecure: bool = False, credentials: dict = None, ignore_regex: str = None, encoding: str = 'latin-1',
                  delimiter: str = ',', doublequote: bool = True, escapechar: str = '',
                  quotechar: str = '"', skipinitialspace: bool = False, polling_timeout: int = 20, proxy: bool = False,
-                 **kwargs):
+                 max_fetch_workers: int = DEFAULT_MAX_FETCH_WORKERS, **kwargs):
         """
         :param url: URL of the feed.
         :param feed_url_to_config: for each URL, a configuration of the feed that contains
@@ -59,6 +69,7 @@ class Client(BaseClient):
             <https://docs.python.org/2/library/csv.html#dialects-and-formatting-parameters>`. Default False
         :param polling_timeout: timeout of the polling request in seconds. Default: 20
         :param proxy: Sets whether use proxy when sending requests
+        :param max_fetch_workers: Maximal number of feed URLs to request concurrently. Default: 10
         """
         if not credentials:
             credentials = {}
@@ -96,6 +107,20 @@ class Client(BaseClient):
             'quotechar': quotechar,
             'skipinitialspace': skipinitialspace
         }
+        try:
+            self.max_fetch_workers = max(int(max_fetch_workers), 1)
+        except (ValueError, TypeError):
+            self.max_fetch_workers = DEFAULT_MAX_FETCH_WORKERS
+        # a single session is shared by all the feed's URLs, with a connection pool large enough for all the workers
+        self._feed_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_fetch_workers,
+                                                pool_maxsize=self.max_fetch_workers)
+        self._feed_session.mount('http://', adapter)
+        self._feed_session.mount('https://', adapter)
+        # validators of the previous fetch by URL, set only when fetching conditionally
+        self.stored_feed_validators: Optional[Dict[str, dict]] = None
+        self.feed_validators: Dict[str, dict] = {}
+        self.feed_not_modified = False
 
     def _build_request(self, url):
         r = requests.Request(
@@ -111,38 +136,27 @@ class Client(BaseClient):
         urls = self._base_url
         if not isinstance(urls, list):
             urls = [urls]
-        for url in urls:
-            _session = requests.Session()
-
-            prepreq = self._build_request(url)
-
-            # this is to honour the proxy environment variables
-            kwargs.update(_session.merge_environment_settings(
-                prepreq.url,
-                {}, None, None, None  # defaults
-            ))
-            kwargs['stream'] = True
-            kwargs['verify'] = self._verify
-            kwargs['timeout'] = self.polling_timeout
-
-            if self.headers:
-                if 'headers' in kwargs:
-                    kwargs['headers'].update(self.headers)
-                else:
-                    kwargs['headers'] = self.headers
 
-            try:
-                r = _session.send(prepreq, **kwargs)
-            except requests.ConnectionError:
-                raise requests.ConnectionError('Failed to establish a new connection.'
-                                               ' Please make sure your URL is valid.')
-            try:
-                r.raise_for_status()
-            except Exception:
-                return_error('Exception in request: {} {}'.format(r.status_code, r.content))
-                raise
-
-            response = self.get_feed_content_divided_to_lines(url, r)
+        url_to_response = list(zip(urls, self.send_requests(urls, **kwargs)))
+        if self.stored_feed_validators is not None:
+            unchanged = [not isinstance(r, Exception) and self.update_feed_validators(url, r)
+                         for url, r in url_to_response]
+            if all(unchanged):
+                demisto.info('The feed content has not changed since the last fetch.')
+                self.feed_not_modified = True
+                return results
+            # the indicators of all the URLs are submitted, so the content of not modified URLs is needed as well,
+            # and the content of URLs which were compared by their content hash was consumed by the hash
+            for i, (url, r) in enumerate(url_to_response):
+                if not isinstance(r, Exception) and (r.status_code == 304 or 'content_hash' in self.feed_validators[url]):
+                    url_to_response[i] = (url, self.send_requests([url], conditional=False, **kwargs)[0])
+
+        failed_results = []
+        for url, r in url_to_response:
+            if isinstance(r, Exception):
+                failed_results.append({url: iter_failed_request(r)})
+                continue
+            response = self.iter_feed_content_lines(url, r)
             if self.feed_url_to_config:
                 fieldnames = self.feed_url_to_config.get(url, {}).get('fieldnames', [])
             else:
@@ -161,7 +175,79 @@ class Client(BaseClient):
 
             results.append({url: csvreader})
 
-        return results
+        # the errors of the failing URLs are raised only after the content of the other URLs is processed
+        return results + failed_results
+
+    def send_requests(self, urls, conditional=True, **kwargs):
+        """Requests all the feed's URLs concurrently, using a bounded pool of workers and a shared session.
+        The requests are streamed, so only the response headers are fetched concurrently. The response bodies are
+        read later, one URL after the other, while the feed is parsed.
+
+        Args:
+            urls: The URLs of the feed.
+            conditional: Whether to send the validators of the previous fetch, when fetching conditionally.
+            kwargs: Arguments to send in each request.
+
+        Returns:
+            List. The response of each URL, in the same order as the URLs. The request of a failing URL is replaced by
+            its error, so the error can be reported after the other URLs are processed.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(self.max_fetch_workers, len(urls)), 1)) as executor:
+            futures = [executor.submit(self._send_request, url, dict(kwargs), conditional) for url in urls]
+
+        responses = []
+        for future in futures:
+            try:
+                r = future.result()
+                r.raise_for_status()
+            except requests.ConnectionError:
+                responses.append(requests.ConnectionError('Failed to establish a new connection.'
+                                                          ' Please make sure your URL is valid.'))
+            except requests.HTTPError as e:
+                responses.append(e)
+            else:
+                responses.append(r)
+        return responses
+
+    def _send_request(self, url, kwargs, conditional=False):
+        prepreq = self._build_request(url)
+
+        # this is to honour the proxy environment variables
+        kwargs.update(self._feed_session.merge_environment_settings(
+            prepreq.url,
+            {}, None, None, None  # defaults
+        ))
+        kwargs['stream'] = True
+        kwargs['verify'] = self._verify
+        kwargs['timeout'] = self.polling_timeout
+
+        # the headers are set on the prepared request, since Session.send does not accept them
+        headers = {**(kwargs.pop('headers', None) or {}), **self.headers}
+        if conditional and self.stored_feed_validators:
+            headers.update(get_conditional_headers(self.stored_feed_validators.get(url, {})))
+        prepreq.headers.update(headers)
+
+        return self._feed_session.send(prepreq, **kwargs)
+
+    def update_feed_validators(self, url, response):
+        """Keeps the validators of the URL's response, to be stored for the next conditional fetch.
+
+        Args:
+            url: The feed's url.
+            response: The response of a conditional request to the url.
+
+        Returns:
+            bool. True if the content of the URL has not changed since the previous fetch.
+        """
+        stored_validators = self.stored_feed_validators.get(url, {}) if self.stored_feed_validators else {}
+        if response.status_code == 304:
+            self.feed_validators[url] = {**stored_validators, **get_response_validators(response, not_modified=True)}
+            return True
+
+        validators = get_response_validators(response)
+        self.feed_validators[url] = validators
+        return bool(validators.get('content_hash')) and validators.get('content_hash') == \
+            stored_validators.get('content_hash')
 
     def get_feed_content_divided_to_lines(self, url, raw_response):
         """Fetch feed data and divides its content to lines
@@ -173,12 +259,69 @@ class Client(BaseClient):
         Returns:
             List. List of lines from the feed content.
         """
-        if self.feed_url_to_config and self.feed_url_to_config.get(url).get('is_zipped_file'):  # type: ignore
-            response_content = gzip.decompress(raw_response.content)
-        else:
-            response_content = raw_response.content
+        return list(self.iter_feed_content_lines(url, raw_response))
 
-        return response_content.decode(self.encoding).split('\n')
+    def iter_feed_content_lines(self, url, raw_response):
+        """Lazily reads the feed response and yields its content line by line.
+        The response body is read in chunks, decompressed (if zipped) and decoded incrementally, so only a single
+        chunk of the feed is held in memory at a time.
+
+        Args:
+            url: Current feed's url.
+            raw_response: The raw (streamed) response from the feed's url.
+
+        Returns:
+            Generator. The lines of the feed content, split exactly like ``content.split('\\n')``.
+        """
+        chunks = raw_response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+        if self.feed_url_to_config and self.feed_url_to_config.get(url, {}).get('is_zipped_file'):
+            chunks = gunzip_chunks(chunks)
+
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        pending = ''
+        for chunk in chunks:
+            pending += decoder.decode(chunk)
+            lines = pending.split('\n')
+            pending = lines.pop()
+            yield from lines
+        yield pending + decoder.decode(b'', final=True)
+
+
+def iter_failed_request(error):
+    """Reports the error of a failing feed URL once the content of the URL is iterated.
+
+    Args:
+        error: The error of the URL's request.
+
+    Returns:
+        Generator. Nothing is yielded, the error is raised on the first iteration.
+    """
+    if isinstance(error, requests.HTTPError):
+        return_error('Exception in request: {} {}'.format(error.response.status_code, error.response.content))
+    raise error
+    yield  # makes this function a generator, so the error is raised only when the content is iterated
+
+
+def gunzip_chunks(chunks):
+    """Incrementally decompresses a stream of gzip compressed chunks, including multi-member gzip files.
+
+    Args:
+        chunks: Iterable of gzip compressed bytes.
+
+    Returns:
+        Generator. Decompressed bytes chunks.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            yield decompressor.decompress(chunk)
+            if not decompressor.eof:
+                break
+            # the current gzip member has ended, the rest of the chunk belongs to the next member
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    if not decompressor.eof:
+        yield decompressor.flush()
 
 
 def determine_indicator_type(indicator_type, default_indicator_type, value):
@@ -241,14 +384,27 @@ def create_fields_mapping(raw_json: Dict[str, Any], mapping: Dict[str, Union[Tup
 
 
 def fetch_indicators_command(client: Client, default_indicator_type: str, **kwargs):
+    return list(generate_indicators(client, default_indicator_type, **kwargs))
+
+
+def generate_indicators(client: Client, default_indicator_type: str, **kwargs):
+    """Lazily creates the indicators of all the feed's URLs, one row at a time.
+
+    Args:
+        client: Client of a CSV feed.
+        default_indicator_type: The indicator type to use when no type is configured for the URL.
+
+    Returns:
+        Generator. The indicators of the feed.
+    """
     iterator = client.build_iterator(**kwargs)
-    indicators = []
     config = client.feed_url_to_config or {}
     for url_to_reader in iterator:
         for url, reader in url_to_reader.items():
             mapping = config.get(url, {}).get('mapping', {})
             for item in reader:
-                raw_json = dict(item)
+                # each row is a new dict created by the csv reader, so it is used as the raw JSON without copying
+                raw_json = item
                 value = item.get('value')
                 if not value and len(item) > 1:
                     value = next(iter(item.values()))
@@ -263,9 +419,7 @@ def fetch_indicators_command(client: Client, default_indicator_type: str, **kwar
                         'rawJSON': raw_json,
                         'fields': create_fields_mapping(raw_json, mapping) if mapping else {}
                     }
-                    indicators.append(indicator)
-
-    return indicators
+                    yield indicator
 
 
 def get_indicators_command(client, args):
@@ -294,10 +448,24 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
-            indicators = fetch_indicators_command(client, params.get('indicator_type'))
-            # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
+            conditional_fetch = argToBoolean(params.get('conditional_fetch', False))
+            if conditional_fetch:
+                signature = get_params_signature(params)
+                client.stored_feed_validators = load_feed_validators(signature)
+            indicators = generate_indicators(client, params.get('indicator_type'))
+            batch_size = int(params.get('indicators_batch_size') or DEFAULT_INDICATORS_BATCH_SIZE)
+            delta_fetch = argToBoolean(params.get('delta_fetch', False))
+            if delta_fetch:
+                feed_delta = load_feed_delta()
+                indicators = feed_delta.filter_indicators(indicators)
+            # we stream the indicators and submit them in batches, so only one batch is held in memory
+            for b in batch(indicators, batch_size=batch_size):
                 demisto.createIndicators(b)  # type: ignore
+            if delta_fetch and not client.feed_not_modified:
+                submit_feed_delta(feed_delta, batch_size)
+            if conditional_fetch:
+                # the validators are stored only after all the indicators were submitted successfully
+                save_feed_validators(signature, client.feed_validators)
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
@@ -1,4 +1,6 @@
+import pytest
 import requests
+import threading
 import requests_mock
 from CSVFeedApiModule import *
 
@@ -156,3 +158,161 @@ def test_date_format_parsing():
 
     formatted_date = date_format_parsing('2020-02-01 12:13:14.11111')
     assert formatted_date == '2020-02-01T12:13:14Z'
+
+
+def test_gunzip_chunks():
+    """Test that zipped content is decompressed correctly when it's split to arbitrary chunks and has several members"""
+    with open('test_data/ip_ranges.txt', 'rb') as ip_ranges_txt:
+        ip_ranges_unzipped = ip_ranges_txt.read()
+
+    with open('test_data/ip_ranges.gz', 'rb') as ip_ranges_gz:
+        ip_ranges_zipped = ip_ranges_gz.read()
+
+    multi_member_zipped = ip_ranges_zipped + ip_ranges_zipped
+    chunks = [multi_member_zipped[i:i + 7] for i in range(0, len(multi_member_zipped), 7)]
+
+    assert b''.join(gunzip_chunks(chunks)) == ip_ranges_unzipped + ip_ranges_unzipped
+
+
+def test_iter_feed_content_lines_multibyte_across_chunks(mocker):
+    """Test that lines and multi-byte characters which are split between chunks are decoded correctly"""
+    content = 'first line\nsecond l€ne\n\nlast line'
+    encoded = content.encode('utf8')
+    raw_response = mocker.Mock()
+    raw_response.iter_content.return_value = [encoded[i:i + 3] for i in range(0, len(encoded), 3)]
+    client = Client(url='https://ipstack.com', encoding='utf8')
+
+    assert list(client.iter_feed_content_lines('https://ipstack.com', raw_response)) == content.split('\n')
+
+
+def test_feed_main_fetch_indicators_in_batches(mocker):
+    """Test that fetch-indicators submits the indicators in batches of the configured size"""
+    with open('test_data/ip_ranges.txt') as ip_ranges_txt:
+        ip_ranges = ip_ranges_txt.read()
+    expected_values = [line.split(',')[0] for line in ip_ranges.split('\n') if line]
+
+    feed_url_to_config = {
+        'https://ipstack.com': {
+            'fieldnames': ['value'],
+            'indicator_type': 'IP'
+        }
+    }
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+
+    with requests_mock.Mocker() as m:
+        m.get('https://ipstack.com', content=ip_ranges.encode('utf8'))
+        feed_main('CSV', params={
+            'url': 'https://ipstack.com',
+            'feed_url_to_config': feed_url_to_config,
+            'indicator_type': 'IP',
+            'indicators_batch_size': 10
+        })
+
+    batches = [call_args[0][0] for call_args in create_indicators.call_args_list]
+    assert all(len(b) <= 10 for b in batches)
+    assert [indicator['value'] for b in batches for indicator in b] == expected_values
+
+
+def test_build_iterator_concurrent_urls(mocker):
+    """Test that all the URLs are requested concurrently and that the results are kept in the order of the URLs"""
+    urls = [f'https://ipstack{i}.com/' for i in range(3)]
+    barrier = threading.Barrier(len(urls), timeout=5)
+
+    def wait_for_all_requests(request, **kwargs):
+        barrier.wait()
+        response = mocker.Mock()
+        response.iter_content.return_value = [request.url.encode()]
+        return response
+
+    client = Client(url=urls, feed_url_to_config={url: {'fieldnames': ['value']} for url in urls})
+    mocker.patch.object(client._feed_session, 'send', side_effect=wait_for_all_requests)
+    results = client.build_iterator()
+
+    assert [list(result.keys())[0] for result in results] == urls
+    assert [[row['value'] for row in list(result.values())[0]] for result in results] == [[url] for url in urls]
+
+
+def test_build_iterator_failing_url(mocker):
+    """Test that the error of a failing URL is raised only after the content of the other URLs is processed"""
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    urls = [f'https://ipstack{i}.com/' for i in range(3)]
+    client = Client(url=urls, feed_url_to_config={url: {'fieldnames': ['value']} for url in urls})
+
+    with requests_mock.Mocker() as m:
+        m.get(urls[0], content=b'1.1.1.1')
+        m.get(urls[1], status_code=500, content=b'error')
+        m.get(urls[2], content=b'2.2.2.2')
+        results = client.build_iterator()
+
+        assert [list(result.keys())[0] for result in results] == [urls[0], urls[2], urls[1]]
+        assert [[row['value'] for row in list(result.values())[0]] for result in results[:2]] == \
+            [['1.1.1.1'], ['2.2.2.2']]
+        with pytest.raises(Exception, match='Exception in request: 500'):
+            list(list(results[2].values())[0])
+
+
+def test_send_requests_no_urls():
+    """Test that requesting an empty list of URLs returns no responses"""
+    client = Client(url='https://ipstack.com', feed_url_to_config={'https://ipstack.com': {'fieldnames': ['value']}})
+    assert client.send_requests([]) == []
+
+
+def test_feed_main_conditional_fetch(mocker, requests_mock):
+    """Test that a feed whose content has not changed since the last fetch is not parsed or submitted again"""
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    params = {
+        'url': 'https://ipstack.com',
+        'feed_url_to_config': {'https://ipstack.com': {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+        'indicator_type': 'IP',
+        'conditional_fetch': True
+    }
+
+    requests_mock.get('https://ipstack.com', [
+        {'content': b'1.1.1.1', 'headers': {'ETag': '"v1"'}},
+        {'status_code': 304, 'headers': {'ETag': '"v1"'}},
+        {'content': b'2.2.2.2', 'headers': {'ETag': '"v2"'}},
+    ])
+
+    feed_main('CSV', params=params)
+    feed_main('CSV', params=params)
+    assert requests_mock.last_request.headers['If-None-Match'] == '"v1"'
+    assert create_indicators.call_count == 1
+
+    feed_main('CSV', params=params)
+    assert create_indicators.call_count == 2
+    assert create_indicators.call_args[0][0][0]['value'] == '2.2.2.2'
+    assert integration_context['feed_validators']['validators'] == {'https://ipstack.com': {'etag': '"v2"'}}
+
+
+def test_feed_main_delta_fetch(mocker, requests_mock):
+    """Test that only new indicators are submitted, and removed indicators are expired, when fetching the delta"""
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    params = {
+        'url': 'https://ipstack.com',
+        'feed_url_to_config': {'https://ipstack.com': {'fieldnames': ['value'], 'indicator_type': 'IP'}},
+        'indicator_type': 'IP',
+        'delta_fetch': True
+    }
+
+    requests_mock.get('https://ipstack.com', [
+        {'content': b'1.1.1.1\n2.2.2.2'},
+        {'content': b'2.2.2.2\n3.3.3.3'},
+    ])
+
+    feed_main('CSV', params=params)
+    assert [indicator['value'] for indicator in create_indicators.call_args[0][0]] == ['1.1.1.1', '2.2.2.2']
+
+    feed_main('CSV', params=params)
+    new_indicators, expired_indicators = [call_args[0][0] for call_args in create_indicators.call_args_list[1:]]
+    assert [indicator['value'] for indicator in new_indicators] == ['3.3.3.3']
+    assert [indicator['value'] for indicator in expired_indicators] == ['1.1.1.1']
+    assert expired_indicators[0]['expiration']
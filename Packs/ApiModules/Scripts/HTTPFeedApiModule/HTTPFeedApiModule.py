@@ -6,21 +6,79 @@ from CommonServerUserPython import *
 import urllib3
 import requests
 import traceback
+import concurrent.futures
 from dateutil.parser import parse
-from typing import Optional, Pattern, List
+from typing import Optional, Pattern, List, Dict, Tuple, Callable, NamedTuple, Union
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
 ''' GLOBALS '''
+# Number of indicators sent in each createIndicators call
+DEFAULT_INDICATORS_BATCH_SIZE = 2000
 TAGS = 'feedTags'
+# Maximal number of feed URLs requested concurrently
+DEFAULT_MAX_FETCH_WORKERS = 10
+# Matches transform templates which are a single group reference, e.g. \1 or \g<name>
+SINGLE_GROUP_TRANSFORM_REGEX = re.compile(r'^\\(?:([1-9][0-9]?)|g<(\w+)>)$')
+# Matches the field values which may be integers, a superset of the strings accepted by int()
+INTEGER_CANDIDATE_REGEX = re.compile(r'\s*[-+]?\d[\d_]*\s*\Z')
+
+
+class FieldExtractor(NamedTuple):
+    """A compiled extraction dictionary: the regex to search for and the compiled transform of its match"""
+    name: str
+    regex: Pattern
+    transform: Callable
+
+
+class ExtractionPlan(NamedTuple):
+    """The compiled extraction configuration of a single feed URL, built once and reused for every line"""
+    indicator_type: str
+    indicator: Optional[FieldExtractor]
+    fields: Tuple[FieldExtractor, ...]
+
+
+def compile_transform(regex: Pattern, transform: str) -> Callable:
+    """
+    Compiles a transform template to a function that generates the final value from a match of the regex.
+    Templates which are a single group reference are resolved directly, avoiding the template parsing of
+    ``Match.expand`` for every match.
+    :param regex: The compiled regex the template is applied on.
+    :param transform: The transform template, for example: \1
+    :return: A function which gets a match of the regex and returns the transformed value.
+    """
+    single_group = SINGLE_GROUP_TRANSFORM_REGEX.match(transform)
+    if single_group:
+        group_ref = single_group.group(1) or single_group.group(2)
+        group: Union[int, str] = int(group_ref) if group_ref.isdigit() else group_ref
+        if group in regex.groupindex or isinstance(group, int) and group <= regex.groups:
+            # unmatched groups are expanded to an empty string
+            return lambda match: match.group(group) or ''
+    return lambda match: match.expand(transform)
+
+
+def coerce_integer(value: str) -> Union[int, str]:
+    """
+    Converts a field value to an integer if it is one. Values which cannot be integers are filtered out by a
+    precompiled regex, so most of them do not pay for raising and catching a ValueError.
+    :param value: The extracted field value.
+    :return: The value as an integer, or the value itself if it is not an integer.
+    """
+    if value.isdigit() or INTEGER_CANDIDATE_REGEX.match(value):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return value
 
 
 class Client(BaseClient):
     def __init__(self, url: str, feed_name: str = 'http', insecure: bool = False, credentials: dict = None,
                  ignore_regex: str = None, encoding: str = None, indicator_type: str = '',
                  indicator: str = '', fields: str = '{}', feed_url_to_config: dict = None, polling_timeout: int = 20,
-                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None, **kwargs):
+                 headers: dict = None, proxy: bool = False, custom_fields_mapping: dict = None,
+                 max_fetch_workers: int = DEFAULT_MAX_FETCH_WORKERS, **kwargs):
         """Implements class for miners of plain text feeds over HTTP.
         **Config parameters**
         :param: url: URL of the feed.
@@ -60,6 +118,7 @@ class Client(BaseClient):
             }]
         }
         :param: proxy: Use proxy in requests.
+        :param: max_fetch_workers: Maximal number of feed URLs to request concurrently. Default: 10
         **Extraction dictionary**
             Extraction dictionaries contain the following keys:
             :regex: Python regular expression for searching the text.
@@ -136,6 +195,22 @@ class Client(BaseClient):
         if custom_fields_mapping is None:
             custom_fields_mapping = {}
         self.custom_fields_mapping = custom_fields_mapping
+        self._extraction_plans: Dict[str, ExtractionPlan] = {}
+
+        try:
+            self.max_fetch_workers = max(int(max_fetch_workers), 1)
+        except (ValueError, TypeError):
+            self.max_fetch_workers = DEFAULT_MAX_FETCH_WORKERS
+        # a single session is shared by all the feed's URLs, with a connection pool large enough for all the workers
+        self._feed_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_fetch_workers,
+                                                pool_maxsize=self.max_fetch_workers)
+        self._feed_session.mount('http://', adapter)
+        self._feed_session.mount('https://', adapter)
+        # validators of the previous fetch by URL, set only when fetching conditionally
+        self.stored_feed_validators: Optional[Dict[str, dict]] = None
+        self.feed_validators: Dict[str, dict] = {}
+        self.feed_not_modified = False
 
     def get_feed_config(self, fields_json: str = '', indicator_json: str = ''):
         """
@@ -188,6 +263,38 @@ class Client(BaseClient):
 
         return config
 
+    def get_extraction_plan(self, url: str) -> ExtractionPlan:
+        """
+        Get the compiled extraction plan of the URL. The plan is built from the URL's feed configuration on the
+        first call and cached for the following lines, the feed configuration itself is not modified.
+        :param url: The feed URL.
+        :return: The extraction plan of the URL.
+        """
+        plan = self._extraction_plans.get(url)
+        if plan is None:
+            feed_config = self.feed_url_to_config.get(url, {})
+            indicator = None
+            if 'indicator' in feed_config:
+                indicator = self._compile_extractor('indicator', feed_config['indicator'])
+            fields = []
+            for field in feed_config.get('fields', []):
+                for f, fattrs in field.items():
+                    fields.append(self._compile_extractor(f, fattrs))
+            plan = ExtractionPlan(
+                indicator_type=feed_config.get('indicator_type', self.indicator_type),
+                indicator=indicator,
+                fields=tuple(fields)
+            )
+            self._extraction_plans[url] = plan
+        return plan
+
+    def _compile_extractor(self, name: str, extraction_dict: dict) -> FieldExtractor:
+        if 'regex' not in extraction_dict:
+            raise ValueError(f'{self.feed_name} - {name} extraction dictionary does not have a regex')
+        regex = re.compile(extraction_dict['regex'])
+        transform = extraction_dict.get('transform', r'\g<0>')
+        return FieldExtractor(name=name, regex=regex, transform=compile_transform(regex, transform))
+
     def build_iterator(self, **kwargs):
         """
         For each URL (service), send an HTTP request to get indicators and return them after filtering by Regex
@@ -203,47 +310,103 @@ class Client(BaseClient):
 
         if self.username is not None and self.password is not None:
             kwargs['auth'] = (self.username, self.password)
-        try:
-            urls = self._base_url
-            url_to_response_list: List[dict] = []
-            if not isinstance(urls, list):
-                urls = [urls]
-            for url in urls:
-                r = requests.get(
-                    url,
-                    **kwargs
-                )
-                try:
-                    r.raise_for_status()
-                except Exception:
-                    LOG(f'{self.feed_name!r} - exception in request:'
-                        f' {r.status_code!r} {r.content!r}')
-                    raise
-                url_to_response_list.append({url: r})
-        except requests.ConnectionError:
-            raise requests.ConnectionError('Failed to establish a new connection. Please make sure your URL is valid.')
+        urls = self._base_url
+        if not isinstance(urls, list):
+            urls = [urls]
+        url_to_response = list(zip(urls, self.send_requests(urls, **kwargs)))
+        if self.stored_feed_validators is not None:
+            unchanged = [not isinstance(r, Exception) and self.update_feed_validators(url, r)
+                         for url, r in url_to_response]
+            if all(unchanged):
+                demisto.info(f'{self.feed_name!r} - the feed content has not changed since the last fetch.')
+                self.feed_not_modified = True
+                return []
+            # the indicators of all the URLs are submitted, so the content of not modified URLs is needed as well,
+            # and the content of URLs which were compared by their content hash was consumed by the hash
+            for i, (url, r) in enumerate(url_to_response):
+                if not isinstance(r, Exception) and (r.status_code == 304 or 'content_hash' in self.feed_validators[url]):
+                    url_to_response[i] = (url, self.send_requests([url], conditional=False, **kwargs)[0])
 
         results = []
-        for url_to_response in url_to_response_list:
-            for url, lines in url_to_response.items():
-                result = lines.iter_lines()
-                if self.encoding is not None:
-                    result = map(
-                        lambda x: x.decode(self.encoding).encode('utf_8'),
-                        result
-                    )
-                else:
-                    result = map(
-                        lambda x: x.decode('utf_8'),
-                        result
-                    )
-                if self.ignore_regex is not None:
-                    result = filter(
-                        lambda x: self.ignore_regex.match(x) is None,  # type: ignore[union-attr]
-                        result
-                    )
-                results.append({url: result})
-        return results
+        failed_results = []
+        for url, lines in url_to_response:
+            if isinstance(lines, Exception):
+                failed_results.append({url: iter_failed_request(lines)})
+                continue
+            result = lines.iter_lines()
+            if self.encoding is not None:
+                result = map(
+                    lambda x: x.decode(self.encoding).encode('utf_8'),
+                    result
+                )
+            else:
+                result = map(
+                    lambda x: x.decode('utf_8'),
+                    result
+                )
+            if self.ignore_regex is not None:
+                result = filter(
+                    lambda x: self.ignore_regex.match(x) is None,  # type: ignore[union-attr]
+                    result
+                )
+            results.append({url: result})
+        # the errors of the failing URLs are raised only after the content of the other URLs is processed
+        return results + failed_results
+
+    def send_requests(self, urls: List[str], conditional: bool = True,
+                      **kwargs) -> List[Union[requests.Response, Exception]]:
+        """
+        Sends the requests to all the URLs concurrently, using a bounded pool of workers and a shared session.
+        The requests are streamed, so only the response headers are fetched concurrently. The response bodies are
+        read later, one URL after the other, while the feed is parsed.
+        :param urls: The feed URLs.
+        :param conditional: Whether to send the validators of the previous fetch, when fetching conditionally.
+        :param kwargs: Arguments to send in each request.
+        :return: The responses, in the order of the URLs. The response of a failing URL is replaced by its error,
+            so the error can be reported after the other URLs are processed.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(min(self.max_fetch_workers, len(urls)), 1)) as executor:
+            futures = [executor.submit(self._send_request, url, dict(kwargs), conditional) for url in urls]
+        responses: List[Union[requests.Response, Exception]] = []
+        for future in futures:
+            try:
+                r = future.result()
+                r.raise_for_status()
+            except requests.ConnectionError:
+                responses.append(requests.ConnectionError('Failed to establish a new connection. '
+                                                          'Please make sure your URL is valid.'))
+            except requests.HTTPError as e:
+                LOG(f'{self.feed_name!r} - exception in request:'
+                    f' {e.response.status_code!r} {e.response.content!r}')
+                responses.append(e)
+            else:
+                responses.append(r)
+        return responses
+
+    def _send_request(self, url: str, kwargs: dict, conditional: bool) -> requests.Response:
+        if conditional and self.stored_feed_validators:
+            kwargs['headers'] = {
+                **(kwargs.get('headers') or {}),
+                **get_conditional_headers(self.stored_feed_validators.get(url, {}))
+            }
+        return self._feed_session.get(url, **kwargs)
+
+    def update_feed_validators(self, url: str, response: requests.Response) -> bool:
+        """
+        Keeps the validators of the URL's response, to be stored for the next conditional fetch.
+        :param url: The feed URL.
+        :param response: The response of a conditional request to the URL.
+        :return: True if the content of the URL has not changed since the previous fetch.
+        """
+        stored_validators = self.stored_feed_validators.get(url, {}) if self.stored_feed_validators else {}
+        if response.status_code == 304:
+            self.feed_validators[url] = {**stored_validators, **get_response_validators(response, not_modified=True)}
+            return True
+
+        validators = get_response_validators(response)
+        self.feed_validators[url] = validators
+        return bool(validators.get('content_hash')) and validators.get('content_hash') == \
+            stored_validators.get('content_hash')
 
     def custom_fields_creator(self, attributes: dict):
         created_custom_fields = {}
@@ -257,6 +420,16 @@ class Client(BaseClient):
         return created_custom_fields
 
 
+def iter_failed_request(error: Exception):
+    """
+    Reports the error of a failing feed URL once the content of the URL is iterated.
+    :param error: The error of the URL's request.
+    :return: A generator which yields nothing, the error is raised on the first iteration.
+    """
+    raise error
+    yield  # makes this function a generator, so the error is raised only when the content is iterated
+
+
 def datestring_to_millisecond_timestamp(datestring):
     date = parse(str(datestring))
     return int(date.timestamp() * 1000)
@@ -271,59 +444,29 @@ def get_indicator_fields(line, url, feed_tags: list, client: Client):
     :param feed_tags: The indicator tags.
     :return: The indicator
     """
-    attributes = None
+    attributes: Optional[dict] = None
     value: str = ''
-    indicator = None
-    fields_to_extract = []
-    feed_config = client.feed_url_to_config.get(url, {})
-    if feed_config:
-        if 'indicator' in feed_config:
-            indicator = feed_config['indicator']
-            if 'regex' in indicator:
-                indicator['regex'] = re.compile(indicator['regex'])
-            if 'transform' not in indicator:
-                indicator['transform'] = r'\g<0>'
-
-    if 'fields' in feed_config:
-        fields = feed_config['fields']
-        for field in fields:
-            for f, fattrs in field.items():
-                field = {f: {}}
-                if 'regex' in fattrs:
-                    field[f]['regex'] = re.compile(fattrs['regex'])
-                if 'transform' not in fattrs:
-                    field[f]['transform'] = r'\g<0>'
-                else:
-                    field[f]['transform'] = fattrs['transform']
-                fields_to_extract.append(field)
+    plan = client.get_extraction_plan(url)
 
     line = line.strip()
     if line:
-        extracted_indicator = line.split()[0]
-        if indicator:
-            extracted_indicator = indicator['regex'].search(line)
-            if extracted_indicator is None:
+        if plan.indicator:
+            match = plan.indicator.regex.search(line)
+            if match is None:
                 return attributes, value
-            if 'transform' in indicator:
-                extracted_indicator = extracted_indicator.expand(indicator['transform'])
+            extracted_indicator = plan.indicator.transform(match)
+        else:
+            extracted_indicator = line.split()[0]
         attributes = {}
-        for field in fields_to_extract:
-            for f, fattrs in field.items():
-                m = fattrs['regex'].search(line)
-
-                if m is None:
-                    continue
+        for field in plan.fields:
+            m = field.regex.search(line)
 
-                attributes[f] = m.expand(fattrs['transform'])
+            if m is None:
+                continue
 
-                try:
-                    i = int(attributes[f])
-                except Exception:
-                    pass
-                else:
-                    attributes[f] = i
+            attributes[field.name] = coerce_integer(field.transform(m))
         attributes['value'] = value = extracted_indicator
-        attributes['type'] = feed_config.get('indicator_type', client.indicator_type)
+        attributes['type'] = plan.indicator_type
         attributes['tags'] = feed_tags
     return attributes, value
 
@@ -402,10 +545,24 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
+            conditional_fetch = argToBoolean(params.get('conditional_fetch', False))
+            if conditional_fetch:
+                signature = get_params_signature(params)
+                client.stored_feed_validators = load_feed_validators(signature)
             indicators = fetch_indicators_command(client, feed_tags, params.get('indicator_type'))
+            batch_size = int(params.get('indicators_batch_size') or DEFAULT_INDICATORS_BATCH_SIZE)
+            delta_fetch = argToBoolean(params.get('delta_fetch', False))
+            if delta_fetch:
+                feed_delta = load_feed_delta()
+                indicators = feed_delta.filter_indicators(indicators)
             # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
+            for b in batch(indicators, batch_size=batch_size):
                 demisto.createIndicators(b)
+            if delta_fetch and not client.feed_not_modified:
+                submit_feed_delta(feed_delta, batch_size)
+            if conditional_fetch:
+                # the validators are stored only after all the indicators were submitted successfully
+                save_feed_validators(signature, client.feed_validators)
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
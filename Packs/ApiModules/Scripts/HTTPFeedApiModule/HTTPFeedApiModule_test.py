@@ -1,4 +1,10 @@
-from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_millisecond_timestamp, feed_main
+from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_millisecond_timestamp, feed_main, \
+    get_indicator_fields, compile_transform, coerce_integer
+import re
+import pytest
+import timeit
+import requests
+import threading
 import requests_mock
 import demistomock as demisto
 
@@ -287,3 +293,317 @@ def test_feed_main_test_module(mocker, requests_mock):
     assert demisto.results.call_count == 1
     results = demisto.results.call_args[0][0]
     assert results['HumanReadable'] == 'ok'
+
+
+def test_build_iterator_concurrent_urls(mocker):
+    """
+    Given
+    - A feed with several URLs.
+
+    When
+    - Building the iterator.
+
+    Then
+    - Ensure all the URLs are requested concurrently (each request waits for all the requests to be sent).
+    - Ensure the results are returned in the order of the URLs.
+    """
+    urls = [f'https://feed{i}.com/list.txt' for i in range(3)]
+    barrier = threading.Barrier(len(urls), timeout=5)
+
+    def wait_for_all_requests(url, **kwargs):
+        barrier.wait()
+        response = mocker.Mock()
+        response.iter_lines.return_value = [url.encode()]
+        return response
+
+    client = Client(url=urls, feed_url_to_config={url: {} for url in urls})
+    mocker.patch.object(client._feed_session, 'get', side_effect=wait_for_all_requests)
+    results = client.build_iterator()
+
+    assert [list(result.keys())[0] for result in results] == urls
+    assert [list(list(result.values())[0]) for result in results] == [[url] for url in urls]
+
+
+def test_send_requests_no_urls():
+    """
+    Given
+    - An empty list of URLs.
+
+    When
+    - Sending the requests.
+
+    Then
+    - Ensure no responses are returned.
+    """
+    client = Client(url='https://feed.com/list.txt')
+    assert client.send_requests([]) == []
+
+
+def test_http_request(requests_mock):
+    """
+    Given
+    - A feed client, which has its own method for sending the feed requests.
+
+    When
+    - Sending a request with the BaseClient's _http_request method.
+
+    Then
+    - Ensure the request is sent by the BaseClient and its response is returned.
+    """
+    requests_mock.get('https://feed.com/api', json={'a': 1})
+    client = Client(url='https://feed.com/list.txt')
+    assert client._http_request('GET', '', full_url='https://feed.com/api') == {'a': 1}
+
+
+def test_build_iterator_failing_url(requests_mock):
+    """
+    Given
+    - A feed with several URLs, where one of them fails.
+
+    When
+    - Building the iterator.
+
+    Then
+    - Ensure the content of the other URLs is returned first.
+    - Ensure the error of the failing URL is raised only after the content of the other URLs is processed.
+    """
+    urls = [f'https://feed{i}.com/list.txt' for i in range(3)]
+    requests_mock.get(urls[0], content=b'1.1.1.1')
+    requests_mock.get(urls[1], status_code=500, content=b'error')
+    requests_mock.get(urls[2], content=b'2.2.2.2')
+
+    client = Client(url=urls, feed_url_to_config={url: {} for url in urls})
+    results = client.build_iterator()
+
+    assert [list(result.keys())[0] for result in results] == [urls[0], urls[2], urls[1]]
+    assert [list(list(result.values())[0]) for result in results[:2]] == [['1.1.1.1'], ['2.2.2.2']]
+    with pytest.raises(requests.HTTPError):
+        list(list(results[2].values())[0])
+
+
+def test_get_indicator_fields_extraction_plan(mocker):
+    """
+    Given
+    - A feed configuration with indicator and fields extraction dictionaries.
+
+    When
+    - Extracting the indicator fields of many lines.
+
+    Then
+    - Ensure the regexes are compiled only once, when the extraction plan is built.
+    - Ensure the feed configuration is not modified.
+    - Ensure the fields are extracted as expected.
+    """
+    url = 'https://www.spamhaus.org/drop/asndrop.txt'
+    feed_url_to_config = {
+        url: {
+            'indicator_type': 'ASN',
+            'indicator': {
+                'regex': '^AS[0-9]+'
+            },
+            'fields': [
+                {
+                    'asndrop_country': {
+                        'regex': r'^.*;\W([a-zA-Z]+)\W+',
+                        'transform': r'\1'
+                    }
+                },
+                {
+                    'asndrop_id': {
+                        'regex': r'^AS([0-9]+)'
+                    }
+                }
+            ]
+        }
+    }
+    client = Client(url=url, feed_url_to_config=feed_url_to_config)
+    compile_spy = mocker.spy(re, 'compile')
+
+    for _ in range(100):
+        attributes, value = get_indicator_fields('AS397539 ; US | LAKSH CYBERSECURITY', url, ['tag'], client)
+
+    assert compile_spy.call_count == 3
+    assert feed_url_to_config[url]['indicator'] == {'regex': '^AS[0-9]+'}
+    assert value == 'AS397539'
+    assert attributes == {
+        'asndrop_country': 'US',
+        'asndrop_id': 'AS397539',
+        'value': 'AS397539',
+        'type': 'ASN',
+        'tags': ['tag']
+    }
+
+
+@pytest.mark.parametrize('regex, transform', [
+    (r'^(\w+)-(\w+)?', r'\1'),
+    (r'^(\w+)-(\w+)?', r'\2'),
+    (r'^(?P<first>\w+)-(\w+)?', r'\g<first>'),
+    (r'^(\w+)-(\w+)?', r'\g<0>'),
+    (r'^(\w+)-(\w+)?', r'\1-\g<2>!'),
+    (r'^(\w+)-(\w+)?', r'\01')
+])
+def test_compile_transform(regex, transform):
+    """
+    Given
+    - A regex and a transform template.
+
+    When
+    - Compiling the transform.
+
+    Then
+    - Ensure the compiled transform returns the same value as Match.expand.
+    """
+    pattern = re.compile(regex)
+    for line in ('abc-def', 'abc-'):
+        match = pattern.search(line)
+        assert compile_transform(pattern, transform)(match) == match.expand(transform)
+
+
+@pytest.mark.parametrize('value', ['12', ' -3 ', '+7', '1_000', '1__0', '\u0663', '\u00b2', 'US', 'AS397539', ''])
+def test_coerce_integer(value):
+    """
+    Given
+    - An extracted field value.
+
+    When
+    - Coercing the value to an integer.
+
+    Then
+    - Ensure the value is converted exactly when int() accepts it.
+    """
+    try:
+        expected = int(value)
+    except ValueError:
+        expected = value
+    assert coerce_integer(value) == expected
+
+
+def extract_without_plan(line, feed_config):
+    """The extraction of a line as it was done before the extraction plans, compiling the configuration per line"""
+    indicator = re.compile(feed_config['indicator']['regex']).search(line).group(0)
+    attributes = {}
+    for field in feed_config['fields']:
+        for name, attrs in field.items():
+            m = re.compile(attrs['regex']).search(line)
+            if m is None:
+                continue
+            field_value = m.expand(attrs.get('transform', r'\g<0>'))
+            try:
+                attributes[name] = int(field_value)
+            except ValueError:
+                attributes[name] = field_value
+    return indicator, attributes
+
+
+def test_get_indicator_fields_benchmark():
+    """
+    Given
+    - A feed configuration with indicator and fields extraction dictionaries, and a feed line.
+
+    When
+    - Measuring the time it takes to extract the indicator fields of the line many times.
+
+    Then
+    - Ensure extracting with the extraction plan is faster than compiling the configuration per line.
+    """
+    url = 'https://www.spamhaus.org/drop/asndrop.txt'
+    feed_config = {
+        'indicator_type': 'ASN',
+        'indicator': {'regex': '^AS[0-9]+'},
+        'fields': [
+            {'asndrop_country': {'regex': r'^.*;\W([a-zA-Z]+)\W+', 'transform': r'\1'}},
+            {'asndrop_org': {'regex': r'^.*\|\W+(.*)', 'transform': r'\1'}}
+        ]
+    }
+    line = 'AS397539 ; US | LAKSH CYBERSECURITY'
+    client = Client(url=url, feed_url_to_config={url: feed_config})
+
+    with_plan = min(timeit.repeat(lambda: get_indicator_fields(line, url, [], client), number=2000, repeat=5))
+    without_plan = min(timeit.repeat(lambda: extract_without_plan(line, feed_config), number=2000, repeat=5))
+
+    assert with_plan < without_plan
+
+
+def test_feed_main_conditional_fetch_content_hash(mocker, requests_mock):
+    """
+    Given
+    - A feed with two URLs configured to fetch conditionally.
+    - The first URL supports Last-Modified, the second URL does not support validators.
+
+    When
+    - Fetching indicators three times, where only the second URL changes before the third fetch.
+
+    Then
+    - Ensure the indicators are not submitted again in the second fetch.
+    - Ensure the indicators of both URLs are submitted in the third fetch.
+    - Ensure the second URL is requested again to be parsed only when its content hash has changed.
+    """
+    urls = ['https://feed1.com/list.txt', 'https://feed2.com/list.txt']
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'params', return_value={
+        'url': urls,
+        'feed_url_to_config': {url: {'indicator_type': 'IP'} for url in urls},
+        'conditional_fetch': 'true'
+    })
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    last_modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+
+    def first_url_content(request, context):
+        if request.headers.get('If-Modified-Since') == last_modified:
+            context.status_code = 304
+            return b''
+        context.headers['Last-Modified'] = last_modified
+        return b'1.1.1.1'
+
+    requests_mock.get(urls[0], content=first_url_content)
+    second_url_mock = requests_mock.get(urls[1], [{'content': b'2.2.2.2'}, {'content': b'2.2.2.2'},
+                                                  {'content': b'2.2.2.2'}, {'content': b'3.3.3.3'}])
+
+    feed_main('great_feed_name')
+    assert create_indicators.call_count == 1
+
+    feed_main('great_feed_name')
+    assert create_indicators.call_count == 1
+
+    feed_main('great_feed_name')
+    assert create_indicators.call_count == 2
+    assert [indicator['value'] for indicator in create_indicators.call_args[0][0]] == ['1.1.1.1', '3.3.3.3']
+    assert second_url_mock.call_count == 5
+
+
+def test_feed_main_delta_fetch_not_modified(mocker, requests_mock):
+    """
+    Given
+    - A feed configured to fetch conditionally and to submit only the delta of the indicators.
+
+    When
+    - Fetching indicators twice, where the feed is not modified between the fetches.
+
+    Then
+    - Ensure no indicators are submitted or expired in the second fetch.
+    - Ensure the fingerprints of the first fetch are kept.
+    """
+    url = 'https://feed1.com/list.txt'
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'params', return_value={
+        'url': url,
+        'feed_url_to_config': {url: {'indicator_type': 'IP'}},
+        'conditional_fetch': True,
+        'delta_fetch': True
+    })
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    requests_mock.get(url, [{'content': b'1.1.1.1\n2.2.2.2', 'headers': {'ETag': '"v1"'}}, {'status_code': 304}])
+
+    feed_main('great_feed_name')
+    assert create_indicators.call_count == 1
+    state = integration_context['feed_indicators_delta']
+
+    feed_main('great_feed_name')
+    assert create_indicators.call_count == 1
+    assert integration_context['feed_indicators_delta'] == state
@@ -1,14 +1,153 @@
 from CommonServerPython import *
 
 ''' IMPORTS '''
+import codecs
 import urllib3
 import jmespath
 import tldextract
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Union, Optional, Iterator, Iterable, Any
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
+''' GLOBALS '''
+# Number of indicators sent in each createIndicators call
+DEFAULT_INDICATORS_BATCH_SIZE = 2000
+# Extractors which are an array projection of a (possibly nested) field, e.g. items[*] or data.objects[*].
+# The items of such extractors are parsed incrementally from the response instead of loading the whole JSON.
+STREAMABLE_EXTRACTOR_REGEX = re.compile(r'^(?:[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)?\[\*\]$')
+# Size in bytes of the chunks read from the response while streaming it
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Characters which can continue a JSON number
+NUMBER_CHARS = '0123456789.eE+-'
+
+
+def get_streamable_extractor_path(extractor: Optional[str]) -> Optional[List[str]]:
+    """Gets the path of the array of a streamable extractor.
+    Args:
+        extractor(str): The JMESPath extractor of the feed.
+    Returns:
+        list. The keys leading to the array of the extractor (empty for a top level array),
+        or None if the extractor is not streamable.
+    """
+    if not extractor or not STREAMABLE_EXTRACTOR_REGEX.match(extractor):
+        return None
+    path = extractor[:-len('[*]')]
+    return path.split('.') if path else []
+
+
+class JSONStreamParser:
+    """Parses a JSON document incrementally from an iterable of text chunks."""
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _read(self, min_size: int) -> bool:
+        """Reads chunks until at least min_size characters are buffered after the current position.
+        Returns whether any data was read."""
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        read = False
+        while not self._eof and len(self._buffer) < min_size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+                read = True
+        return read
+
+    def _peek(self) -> str:
+        """Skips whitespaces and returns the next character, or an empty string at the end of the document."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\n\r':
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._read(1):
+                return self._buffer[self._pos:self._pos + 1]
+
+    def _consume(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f'Expected {char!r} at position {self._pos} of the JSON stream')
+        self._pos += 1
+
+    def _decode_value(self) -> Any:
+        """Decodes the next JSON value. Values which are not fully buffered are retried with a doubled buffer,
+        so the total parsing work stays linear in the size of the value."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._read(2 * (len(self._buffer) - self._pos)):
+                    raise
+                continue
+            # a number at the end of the buffer might continue in the next chunk, also when the buffer ends in the
+            # middle of its fraction or exponent (e.g. '12.' is decoded as 12, followed by '.')
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and \
+                    not self._buffer[end:].strip(NUMBER_CHARS) and self._read(2 * (len(self._buffer) - self._pos)):
+                continue
+            self._pos = end
+            return value
+
+    def _find_key(self, key: str) -> bool:
+        """Moves to the value of the key in the current object. Returns False if the object does not have the key."""
+        self._consume('{')
+        if self._peek() == '}':
+            return False
+        while True:
+            current_key = self._decode_value()
+            self._consume(':')
+            if current_key == key:
+                return True
+            self._decode_value()
+            if self._peek() == '}':
+                return False
+            self._consume(',')
+
+    def iter_array_items(self, path: List[str]) -> Iterator[Any]:
+        """Yields the items of the array in the path, one at a time, the same way a JMESPath projection of the
+        path would return them (null items are omitted, and nothing is returned if the path does not lead to an array).
+        Args:
+            path(list): The keys leading to the array.
+        Returns:
+            Iterator. The items of the array.
+        """
+        for key in path:
+            if self._peek() != '{' or not self._find_key(key):
+                return
+        if self._peek() != '[':
+            return
+        self._consume('[')
+        if self._peek() == ']':
+            return
+        while True:
+            item = self._decode_value()
+            if item is not None:
+                yield item
+            if self._peek() == ']':
+                return
+            self._consume(',')
+
+
+def iter_response_array_items(response: requests.Response, path: List[str]) -> Iterator[Any]:
+    """Parses the items of the array in the path incrementally from a streamed response.
+    Args:
+        response(requests.Response): The streamed response of the feed.
+        path(list): The keys leading to the array.
+    Returns:
+        Iterator. The items of the array.
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+    chunks = (decoder.decode(chunk) for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+    try:
+        yield from JSONStreamParser(chunks).iter_array_items(path)
+    except ValueError as VE:
+        raise ValueError(f'Could not parse returned data to Json. \n\nError massage: {VE}')
+
 
 def auto_detect_indicator_type(indicator_value):
     """Infer the type of the indicator.
@@ -116,23 +255,36 @@ class Client:
                     self.auth = (username, password)
 
         self.cert = (cert_file, key_file) if cert_file and key_file else None
+        # validators of the previous fetch by feed name, set only when fetching conditionally
+        self.stored_feed_validators: Optional[Dict[str, dict]] = None
+        self.feed_validators: Dict[str, dict] = {}
+        self.feed_not_modified = False
 
     def build_iterator(self, **kwargs) -> List:
-        results = []
-        for feed_name, feed in self.feed_name_to_config.items():
-            r = requests.get(
-                url=feed.get('url', self.url),
-                verify=self.verify,
-                auth=self.auth,
-                cert=self.cert,
-                headers=self.headers,
-                **kwargs
-            )
+        responses = {feed_name: self.send_request(feed_name, **kwargs) for feed_name in self.feed_name_to_config}
+        if self.stored_feed_validators is not None:
+            unchanged = [self.update_feed_validators(feed_name, r) for feed_name, r in responses.items()]
+            if all(unchanged):
+                demisto.info(f'{self.source_name} - the feed content has not changed since the last fetch.')
+                self.feed_not_modified = True
+                return []
+            # the indicators of all the feeds are submitted, so the content of not modified feeds is needed as well,
+            # and the content of feeds which were compared by their content hash was consumed by the hash
+            for feed_name, r in responses.items():
+                if r.status_code == 304 or 'content_hash' in self.feed_validators[feed_name]:
+                    responses[feed_name] = self.send_request(feed_name, conditional=False, **kwargs)
 
+        results = []
+        for feed_name, r in responses.items():
+            feed = self.feed_name_to_config[feed_name]
             try:
                 r.raise_for_status()
-                data = r.json()
-                result = jmespath.search(expression=feed.get('extractor'), data=data)
+                path = get_streamable_extractor_path(feed.get('extractor'))
+                if path is not None:
+                    result = iter_response_array_items(r, path)
+                else:
+                    data = r.json()
+                    result = jmespath.search(expression=feed.get('extractor'), data=data)
                 results.append({feed_name: result})
 
             except ValueError as VE:
@@ -140,6 +292,39 @@ class Client:
 
         return results
 
+    def send_request(self, feed_name: str, conditional: bool = True, **kwargs) -> requests.Response:
+        feed = self.feed_name_to_config[feed_name]
+        headers = self.headers
+        if conditional and self.stored_feed_validators:
+            headers = {**(headers or {}), **get_conditional_headers(self.stored_feed_validators.get(feed_name, {}))}
+        return requests.get(
+            url=feed.get('url', self.url),
+            verify=self.verify,
+            auth=self.auth,
+            cert=self.cert,
+            headers=headers,
+            stream=True,
+            **kwargs
+        )
+
+    def update_feed_validators(self, feed_name: str, response: requests.Response) -> bool:
+        """
+        Keeps the validators of the feed's response, to be stored for the next conditional fetch.
+        :param feed_name: The name of the feed.
+        :param response: The response of a conditional request to the feed's URL.
+        :return: True if the content of the feed has not changed since the previous fetch.
+        """
+        stored_validators = self.stored_feed_validators.get(feed_name, {}) if self.stored_feed_validators else {}
+        if response.status_code == 304:
+            self.feed_validators[feed_name] = {**stored_validators,
+                                               **get_response_validators(response, not_modified=True)}
+            return True
+
+        validators = get_response_validators(response)
+        self.feed_validators[feed_name] = validators
+        return bool(validators.get('content_hash')) and validators.get('content_hash') == \
+            stored_validators.get('content_hash')
+
 
 def test_module(client, params) -> str:
     client.build_iterator()
@@ -153,7 +338,16 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
     :param indicator_type: the default indicator type
     :param feedTags: the indicator tags
     """
-    indicators = []
+    return list(generate_indicators(client, indicator_type, feedTags, **kwargs))
+
+
+def generate_indicators(client: Client, indicator_type: str, feedTags: list, **kwargs) -> Iterator[Dict]:
+    """
+    Lazily creates the indicators of the client's feeds, one item at a time.
+    :param client: Client of a JSON Feed
+    :param indicator_type: the default indicator type
+    :param feedTags: the indicator tags
+    """
     for result in client.build_iterator(**kwargs):
         for service_name, items in result.items():
             feed_config = client.feed_name_to_config.get(service_name, {})
@@ -184,9 +378,7 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
 
                 indicator['rawJSON'] = item
 
-                indicators.append(indicator)
-
-    return indicators
+                yield indicator
 
 
 def extract_all_fields_from_indicator(indicator, indicator_key):
@@ -241,9 +433,24 @@ def feed_main(params, feed_name, prefix):
             return_outputs(test_module(client, params))
 
         elif command == 'fetch-indicators':
-            indicators = fetch_indicators_command(client, indicator_type, feedTags)
-            for b in batch(indicators, batch_size=2000):
+            conditional_fetch = argToBoolean(params.get('conditional_fetch', False))
+            if conditional_fetch:
+                signature = get_params_signature(params)
+                client.stored_feed_validators = load_feed_validators(signature)
+            # the indicators are generated lazily, so only one batch is held in memory
+            indicators = generate_indicators(client, indicator_type, feedTags)
+            batch_size = int(params.get('indicators_batch_size') or DEFAULT_INDICATORS_BATCH_SIZE)
+            delta_fetch = argToBoolean(params.get('delta_fetch', False))
+            if delta_fetch:
+                feed_delta = load_feed_delta()
+                indicators = feed_delta.filter_indicators(indicators)
+            for b in batch(indicators, batch_size=batch_size):
                 demisto.createIndicators(b)
+            if delta_fetch and not client.feed_not_modified:
+                submit_feed_delta(feed_delta, batch_size)
+            if conditional_fetch:
+                # the validators are stored only after all the indicators were submitted successfully
+                save_feed_validators(signature, client.feed_validators)
 
         elif command == f'{prefix}get-indicators':
             # dummy command for testing
@@ -1,5 +1,7 @@
-from JSONFeedApiModule import Client, fetch_indicators_command, jmespath
+from JSONFeedApiModule import Client, fetch_indicators_command, jmespath, get_streamable_extractor_path, \
+    JSONStreamParser
 from CommonServerPython import *
+import pytest
 import requests_mock
 
 
@@ -118,3 +120,135 @@ def test_list_of_indicators_with_no_json_object():
         assert indicators[0].get('value') == '1.1.1.1'
         assert indicators[0].get('type') == 'IP'
         assert indicators[1].get('rawJSON') == {'indicator': '2.2.2.2'}
+
+
+def test_feed_main_conditional_fetch(mocker):
+    """
+    Given
+    - A feed configured to fetch conditionally, whose server supports ETag.
+
+    When
+    - Fetching indicators twice, where the feed content has not changed between the fetches.
+
+    Then
+    - Ensure the validators are stored after the first fetch and sent in the second fetch.
+    - Ensure the indicators are not submitted again in the second fetch.
+    """
+    from JSONFeedApiModule import feed_main
+    import demistomock as demisto
+    with open('test_data/amazon_ip_ranges.json') as ip_ranges_json:
+        ip_ranges = json.load(ip_ranges_json)
+
+    url = 'https://ip-ranges.amazonaws.com/ip-ranges.json'
+    params = {
+        'url': url,
+        'extractor': "prefixes[?service=='AMAZON']",
+        'indicator': 'ip_prefix',
+        'indicator_type': 'CIDR',
+        'conditional_fetch': True
+    }
+    integration_context: dict = {}
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+
+    with requests_mock.Mocker() as m:
+        m.get(url, [{'json': ip_ranges, 'headers': {'ETag': '"v1"'}}, {'status_code': 304}])
+        feed_main(params, 'JSON', 'json')
+        assert create_indicators.call_count == 1
+        assert integration_context['feed_validators']['validators'] == {'JSON': {'etag': '"v1"'}}
+
+        feed_main(params, 'JSON', 'json')
+        assert m.last_request.headers['If-None-Match'] == '"v1"'
+        assert create_indicators.call_count == 1
+
+
+@pytest.mark.parametrize('extractor, expected_path', [
+    ('[*]', []),
+    ('items[*]', ['items']),
+    ('data.objects[*]', ['data', 'objects']),
+    ("prefixes[?service=='AMAZON']", None),
+    ('items[*].value', None),
+    ('@', None),
+    (None, None)
+])
+def test_get_streamable_extractor_path(extractor, expected_path):
+    assert get_streamable_extractor_path(extractor) == expected_path
+
+
+@pytest.mark.parametrize('data, extractor', [
+    ({'data': {'other': [1, {'objects': []}], 'objects': [{'a': 1}, None, 'b', 12345678, [1, 2], {'c': {'d': '}]'}}]}},
+     'data.objects[*]'),
+    ([{'a': 1}, {'a': 2}], '[*]'),
+    ({'items': []}, 'items[*]'),
+    ({'items': {'a': 1}}, 'items[*]'),
+    ({'other': [1]}, 'items[*]'),
+    ({'data': [1]}, 'data.objects[*]'),
+])
+@pytest.mark.parametrize('chunk_size', [1, 3, 1000])
+def test_json_stream_parser(data, extractor, chunk_size):
+    """
+    Given
+    - A JSON document split to chunks.
+
+    When
+    - Parsing the items of a streamable extractor incrementally.
+
+    Then
+    - Ensure the items are the same as the items of the JMESPath search of the whole document.
+    """
+    text = json.dumps(data, indent=1)
+    chunks = (text[i:i + chunk_size] for i in range(0, len(text), chunk_size))
+
+    items = list(JSONStreamParser(chunks).iter_array_items(get_streamable_extractor_path(extractor)))
+
+    assert items == (jmespath.search(extractor, data) or [])
+
+
+@pytest.mark.parametrize('text, extractor, expected_items', [
+    ('{"total": 12.5, "items": ["a","b"]}', 'items[*]', ['a', 'b']),
+    ('[1.5, 2E-3, -0.25e+2, 7]', '[*]', [1.5, 0.002, -25.0, 7]),
+])
+def test_json_stream_parser_split_number(text, extractor, expected_items):
+    """
+    Given
+    - A JSON document with floats, split to 2 chunks at every index, including inside the fractions and exponents.
+
+    When
+    - Parsing the items of a streamable extractor incrementally.
+
+    Then
+    - Ensure the numbers are not cut at the chunk boundary, and the items are parsed.
+    """
+    for i in range(len(text) + 1):
+        items = list(JSONStreamParser([text[:i], text[i:]]).iter_array_items(get_streamable_extractor_path(extractor)))
+        assert items == expected_items, f'split at {i}'
+
+
+def test_json_feed_streamed_extractor():
+    """
+    Given
+    - A feed whose extractor is an array projection.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure the indicators are the same as the indicators of an equivalent extractor which is not streamed.
+    """
+    with open('test_data/amazon_ip_ranges.json') as ip_ranges_json:
+        ip_ranges = json.load(ip_ranges_json)
+
+    with requests_mock.Mocker() as m:
+        m.get('https://ip-ranges.amazonaws.com/ip-ranges.json', json=ip_ranges)
+
+        streamed_client = Client(url='https://ip-ranges.amazonaws.com/ip-ranges.json', extractor='prefixes[*]',
+                                 indicator='ip_prefix')
+        client = Client(url='https://ip-ranges.amazonaws.com/ip-ranges.json', extractor='prefixes[]',
+                        indicator='ip_prefix')
+
+        streamed_indicators = fetch_indicators_command(client=streamed_client, indicator_type='CIDR', feedTags=[])
+        indicators = fetch_indicators_command(client=client, indicator_type='CIDR', feedTags=[])
+        assert streamed_indicators == indicators
+        assert len(indicators) == len(ip_ranges['prefixes'])
@@ -6,14 +6,21 @@ Note that adding code to CommonServerUserPython can override functions in Common
 from __future__ import print_function
 
 import base64
+import email.utils
+import hashlib
+import itertools
 import json
 import logging
 import os
 import re
 import socket
 import sys
+import threading
 import time
 import traceback
+import types
+import weakref
+import zlib
 import xml.etree.cElementTree as ET
 from collections import OrderedDict
 from datetime import datetime, timedelta
@@ -32,6 +39,13 @@ except Exception:
 CONTENT_RELEASE_VERSION = '0.0.0'
 CONTENT_BRANCH_NAME = 'master'
 IS_PY3 = sys.version_info[0] == 3
+PROCESS_CACHES_MODULE_NAME = '__demisto_process_caches__'
+# Integration context key of the validators (ETag, Last-Modified or content hash) of the last fetched feed content
+FEED_VALIDATORS_CONTEXT_KEY = 'feed_validators'
+# Size of the chunks of feed content read when computing its hash
+FEED_CONTENT_HASH_CHUNK_SIZE = 1024 * 1024
+# Integration context key of the fingerprints of the last fetched indicators, used when fetching only the delta
+FEED_DELTA_CONTEXT_KEY = 'feed_indicators_delta'
 
 # pylint: disable=undefined-variable
 if IS_PY3:
@@ -3278,6 +3292,244 @@ H || val.SSDeep && val.SSDeep == obj.SSDeep)': {'Malicious': {'Vendor': 'Vendor'
                                .format(indicator_type, INDICATOR_TYPE_TO_CONTEXT_KEY.keys()))
 
 
+class PaginationStyle(object):
+    """The pagination styles supported by ``BaseClient._paginate``.
+
+    OFFSET: The offset of the first record and the page size are sent as URL parameters. The pagination stops
+        when a page returns fewer records than the page size.
+    PAGE_TOKEN: The token of the next page is read from the response and sent as a URL parameter.
+    CURSOR: The cursor of the next page is read from the response and sent in the JSON body of the request
+        (when the request has a JSON body) or as a URL parameter.
+    LINK_HEADER: The URL of the next page is read from the ``rel="next"`` entry of the response Link header.
+    """
+    OFFSET = 'offset'
+    PAGE_TOKEN = 'page_token'
+    CURSOR = 'cursor'
+    LINK_HEADER = 'link_header'
+
+
+class PrefetchedCall(object):
+    """Runs a function on a background thread, so its result can be collected later.
+
+    :type func: ``function``
+    :param func: The function to run.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+
+    def __init__(self, func, *args, **kwargs):
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(func, args, kwargs))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._result = func(*args, **kwargs)
+        except Exception as exception:
+            self._error = exception
+
+    def result(self):
+        """Waits for the function to finish and returns its result, raising its exception if it failed.
+
+        :return: The result of the function.
+        :rtype: ``any``
+        """
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class TokenBucketRateLimiter(object):
+    """Limits the rate of the requests of a client with a token bucket, which is refilled with ``rate`` tokens
+    per second up to ``capacity`` tokens, and takes one token for each request.
+    The limiter also follows the quota of the API: after a throttled response it waits for the time given in the
+    ``Retry-After`` header, and it never exceeds the remaining requests given in the ``X-RateLimit-Remaining``
+    header until the time given in the ``X-RateLimit-Reset`` header.
+
+    :type rate: ``float``
+    :param rate: The number of requests per second.
+
+    :type capacity: ``float``
+    :param capacity: The maximal number of requests which can be sent in a burst. Default is the rate (at least 1).
+
+    :type context_key: ``str``
+    :param context_key:
+        The integration context key in which to keep the state of the limiter, so consecutive executions of the
+        integration share the same budget. If None, the state is kept only for the current execution.
+
+    :type max_retries: ``int``
+    :param max_retries: The number of times to resend a throttled (429) request. Default is 3.
+
+    :type max_wait: ``float``
+    :param max_wait:
+        The maximal number of seconds to wait before resending a throttled request. If the API asks to wait longer,
+        the throttled response is returned. Default is 60.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    # the minimal interval in seconds between saves of the state to the integration context
+    SAVE_INTERVAL = 5
+
+    def __init__(self, rate, capacity=None, context_key=None, max_retries=3, max_wait=60):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(self.rate, 1))
+        self.context_key = context_key
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.blocked_until = 0.0
+        self._last_saved = None
+        self._lock = threading.Lock()
+        if context_key:
+            self._load_state()
+
+    def _load_state(self):
+        state = (demisto.getIntegrationContext() or {}).get(self.context_key)
+        if state:
+            self.tokens = min(self.capacity, state.get('tokens', self.capacity))
+            self.updated = state.get('updated', self.updated)
+            self.blocked_until = state.get('blocked_until', 0.0)
+
+    def save_state(self):
+        """Saves the state of the limiter to the integration context.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        if not self.context_key:
+            return
+        integration_context = demisto.getIntegrationContext() or {}
+        integration_context[self.context_key] = {
+            'tokens': self.tokens,
+            'updated': self.updated,
+            'blocked_until': self.blocked_until
+        }
+        demisto.setIntegrationContext(integration_context)
+        self._last_saved = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + max(now - self.updated, 0) * self.rate)
+        self.updated = now
+
+    def get_wait_time(self):
+        """Gets the number of seconds to wait until a request can be sent.
+
+        :return: The number of seconds to wait.
+        :rtype: ``float``
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            return max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+
+    def acquire(self):
+        """Waits until a request can be sent, and takes a token for it.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            wait_time = max(self.blocked_until - now, (1 - self.tokens) / self.rate, 0)
+            # the token is taken before waiting, so concurrent requests wait for the following tokens
+            self.tokens -= 1
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def update_from_response(self, response):
+        """Updates the budget of the limiter according to the rate limit headers of a response.
+
+        :type response: ``requests.Response``
+        :param response: The response of a request which was sent after ``acquire``.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        now = time.time()
+        blocked_until = None
+        headers = response.headers
+        retry_after = self.parse_retry_after(headers.get('Retry-After'), now)
+        if response.status_code in (429, 503) and retry_after is not None:
+            blocked_until = now + retry_after
+
+        remaining = headers.get('X-RateLimit-Remaining', headers.get('RateLimit-Remaining'))
+        try:
+            remaining = float(remaining) if remaining is not None else None
+        except ValueError:
+            remaining = None
+        if remaining is not None:
+            with self._lock:
+                self._refill(now)
+                self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and blocked_until is None:
+                blocked_until = self.parse_rate_limit_reset(
+                    headers.get('X-RateLimit-Reset', headers.get('RateLimit-Reset')), now)
+
+        if response.status_code == 429 and blocked_until is None:
+            # throttled without a hint of when to retry - wait for the next token
+            blocked_until = now + 1 / self.rate
+
+        if blocked_until is not None and blocked_until > self.blocked_until:
+            self.blocked_until = blocked_until
+            self.save_state()
+        elif self._last_saved is None or now - self._last_saved >= self.SAVE_INTERVAL:
+            self.save_state()
+
+    @staticmethod
+    def parse_retry_after(retry_after, now):
+        """Parses the value of a Retry-After header, which is either a number of seconds or an HTTP date.
+
+        :type retry_after: ``str``
+        :param retry_after: The value of the header.
+
+        :type now: ``float``
+        :param now: The current epoch time.
+
+        :return: The number of seconds to wait, or None if the value is missing or invalid.
+        :rtype: ``float``
+        """
+        if not retry_after:
+            return None
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            retry_date = email.utils.parsedate_tz(retry_after)
+            if retry_date is None:
+                return None
+            return max(email.utils.mktime_tz(retry_date) - now, 0)
+
+    @staticmethod
+    def parse_rate_limit_reset(reset, now):
+        """Parses the value of a X-RateLimit-Reset header, which is either an epoch time (in seconds or
+        milliseconds) or a number of seconds.
+
+        :type reset: ``str``
+        :param reset: The value of the header.
+
+        :type now: ``float``
+        :param now: The current epoch time.
+
+        :return: The epoch time in which the quota is reset, or None if the value is missing or invalid.
+        :rtype: ``float``
+        """
+        try:
+            reset = float(reset)
+        except (TypeError, ValueError):
+            return None
+        if reset > 1e12:
+            return reset / 1000
+        if reset > 1e9:
+            return reset
+        return now + reset
+
+
 # Will add only if 'requests' module imported
 if 'requests' in sys.modules:
     class BaseClient(object):
@@ -3306,19 +3558,68 @@ if 'requests' in sys.modules:
             The request authorization, for example: (username, password).
             Can be None.
 
+        :type pool_connections: ``int``
+        :param pool_connections: The number of connection pools (one per host) to cache. Default is 10.
+
+        :type pool_maxsize: ``int``
+        :param pool_maxsize:
+            The maximum number of connections to keep open in each pool, for example when the client
+            is used from several threads. Default is 10.
+
+        :type keep_alive: ``bool``
+        :param keep_alive:
+            Whether to keep the connections open between requests. When set to False, every request
+            opens a new connection. Default is True.
+
+        :type share_session: ``bool``
+        :param share_session:
+            Whether to reuse the session (including its open connections and cookies) of other clients of
+            the same base URL, with the same verify, proxy and keep alive settings and the same auth and headers,
+            in the current execution. Default is False.
+
+        :type rate_limiter: ``TokenBucketRateLimiter``
+        :param rate_limiter:
+            The rate limiter of the requests of the client. Throttled (429) requests are resent after the wait
+            time given by the API, up to the retries of the limiter. If None, the requests are not limited.
+
         :return: No data returned
         :rtype: ``None``
         """
 
-        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None):
+        _shared_sessions = {}  # type: dict
+        # the retry adapters of each session by their retry policy, and the retry policy mounted on the session
+        _session_retry_adapters = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+        _pool_connections = 10
+        _pool_maxsize = 10
+
+        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None,
+                     pool_connections=10, pool_maxsize=10, keep_alive=True, share_session=False, rate_limiter=None):
             self._base_url = base_url
+            self._rate_limiter = rate_limiter
             self._verify = verify
             self._ok_codes = ok_codes
             self._headers = headers
             self._auth = auth
-            self._session = requests.Session()
+            self._pool_connections = pool_connections
+            self._pool_maxsize = pool_maxsize
+            if share_session:
+                # clients with different credentials never share a session, as the session keeps the cookies
+                credentials = hashlib.sha256(repr((auth, sorted((headers or {}).items()))).encode('utf-8')).hexdigest()
+                session_key = (base_url, verify, proxy, keep_alive, credentials)
+                self._session = BaseClient._shared_sessions.get(session_key)
+                if self._session is None:
+                    self._session = BaseClient._shared_sessions[session_key] = self._create_session(proxy, keep_alive)
+            else:
+                self._session = self._create_session(proxy, keep_alive)
+
+        @staticmethod
+        def _create_session(proxy, keep_alive):
+            session = requests.Session()
             if not proxy:
-                self._session.trust_env = False
+                session.trust_env = False
+            if not keep_alive:
+                session.headers['Connection'] = 'close'
+            return session
 
         def _implement_retry(self, retries=0,
                              status_list_to_retry=None,
@@ -3362,21 +3663,33 @@ if 'requests' in sys.modules:
                 if status falls in ``status_forcelist`` range and retries have
                 been exhausted.
             """
+            retry_policy = (retries, tuple(status_list_to_retry) if status_list_to_retry else None, backoff_factor,
+                            raise_on_redirect, raise_on_status)
+            # the adapter of each retry policy is created once and kept mounted, so its connection pool is reused
+            session_retry = BaseClient._session_retry_adapters.setdefault(
+                self._session, {'mounted_policy': None, 'adapters': {}})
+            if session_retry['mounted_policy'] == retry_policy:
+                return
             try:
-                retry = Retry(
-                    total=retries,
-                    read=retries,
-                    connect=retries,
-                    backoff_factor=backoff_factor,
-                    status=retries,
-                    status_forcelist=status_list_to_retry,
-                    method_whitelist=frozenset(['GET', 'POST', 'PUT']),
-                    raise_on_status=raise_on_status,
-                    raise_on_redirect=raise_on_redirect
-                )
-                adapter = HTTPAdapter(max_retries=retry)
+                adapter = session_retry['adapters'].get(retry_policy)
+                if adapter is None:
+                    retry = Retry(
+                        total=retries,
+                        read=retries,
+                        connect=retries,
+                        backoff_factor=backoff_factor,
+                        status=retries,
+                        status_forcelist=status_list_to_retry,
+                        method_whitelist=frozenset(['GET', 'POST', 'PUT']),
+                        raise_on_status=raise_on_status,
+                        raise_on_redirect=raise_on_redirect
+                    )
+                    adapter = HTTPAdapter(max_retries=retry, pool_connections=self._pool_connections,
+                                          pool_maxsize=self._pool_maxsize)
+                    session_retry['adapters'][retry_policy] = adapter
                 self._session.mount('http://', adapter)
                 self._session.mount('https://', adapter)
+                session_retry['mounted_policy'] = retry_policy
             except NameError:
                 pass
 
@@ -3478,7 +3791,7 @@ if 'requests' in sys.modules:
                 auth = auth if auth else self._auth
                 self._implement_retry(retries, status_list_to_retry, backoff_factor, raise_on_redirect, raise_on_status)
                 # Execute
-                res = self._session.request(
+                res = self._send_rate_limited_request(
                     method,
                     address,
                     verify=self._verify,
@@ -3551,6 +3864,21 @@ if 'requests' in sys.modules:
                 err_msg = 'Max Retries Error- Request attempts with {} retries failed. \n{}'.format(retries, reason)
                 raise DemistoException(err_msg, exception)
 
+        def _send_rate_limited_request(self, method, address, **kwargs):
+            """Sends a request through the rate limiter of the client, and resends it while it is throttled."""
+            if not self._rate_limiter:
+                return self._session.request(method, address, **kwargs)
+            rate_limit_retries = 0
+            while True:
+                self._rate_limiter.acquire()
+                res = self._session.request(method, address, **kwargs)
+                self._rate_limiter.update_from_response(res)
+                if res.status_code != 429 or rate_limit_retries >= self._rate_limiter.max_retries \
+                        or self._rate_limiter.get_wait_time() > self._rate_limiter.max_wait:
+                    return res
+                rate_limit_retries += 1
+                demisto.debug('Request to {} was throttled, retry {} of {}'.format(
+                    address, rate_limit_retries, self._rate_limiter.max_retries))
 
         def _is_status_code_valid(self, response, ok_codes=None):
             """If the status code is OK, return 'True'.
@@ -3572,12 +3900,147 @@ if 'requests' in sys.modules:
                 return response.status_code in status_codes
             return response.ok
 
+        def _paginate(self, method, url_suffix='', records_path=None, pagination_style=PaginationStyle.OFFSET,
+                      page_size=50, limit=None, offset_param='offset', page_size_param='limit', start_offset=0,
+                      next_token_path=None, token_param=None, prefetch=False, params=None, json_data=None,
+                      full_url=None, **kwargs):
+            """Sends paginated requests and lazily yields the records of the pages, so callers can stop early
+            without requesting the remaining pages and without holding all the records in memory.
+
+            :type method: ``str``
+            :param method: The HTTP method, for example: GET, POST, and so on.
+
+            :type url_suffix: ``str``
+            :param url_suffix: The API endpoint.
+
+            :type records_path: ``str``
+            :param records_path:
+                The path of the records list in the JSON response, in dot notation, for example: 'result.items'.
+                If None, the response itself should be the records list.
+
+            :type pagination_style: ``str``
+            :param pagination_style: The pagination style, one of the ``PaginationStyle`` values. Default is offset.
+
+            :type page_size: ``int``
+            :param page_size:
+                The number of records to request in each page, sent in the ``page_size_param`` URL parameter.
+                If None, the page size is not sent. Required for the offset pagination style.
+
+            :type limit: ``int``
+            :param limit: The maximum number of records to yield. If None, all the records are yielded.
+
+            :type offset_param: ``str``
+            :param offset_param: The name of the URL parameter of the offset of the page. Default is 'offset'.
+
+            :type page_size_param: ``str``
+            :param page_size_param: The name of the URL parameter of the page size. Default is 'limit'.
+
+            :type start_offset: ``int``
+            :param start_offset: The offset of the first page, in the offset pagination style. Default is 0.
+
+            :type next_token_path: ``str``
+            :param next_token_path:
+                The path of the next page token (or cursor) in the JSON response, in dot notation, for example:
+                'meta.pagination.next'. Required for the page token and cursor pagination styles.
+
+            :type token_param: ``str``
+            :param token_param:
+                The name of the parameter in which to send the next page token (or cursor).
+                Required for the page token and cursor pagination styles.
+
+            :type prefetch: ``bool``
+            :param prefetch:
+                Whether to request the next page on a background thread while the records of the current page
+                are processed. Default is False.
+
+            :type params: ``dict``
+            :param params: URL parameters to send in every request.
+
+            :type json_data: ``dict``
+            :param json_data: The dictionary to send in the body of every request.
+
+            :type full_url: ``str``
+            :param full_url: Bypasses the use of self._base_url + url_suffix for the first page.
+
+            :return: Generator of the records of all the pages.
+            :rtype: ``Iterator[Any]``
+            """
+            if pagination_style == PaginationStyle.OFFSET and not page_size:
+                raise ValueError('page_size is required for the offset pagination style')
+            if pagination_style in (PaginationStyle.PAGE_TOKEN, PaginationStyle.CURSOR) and \
+                    not (next_token_path and token_param):
+                raise ValueError('next_token_path and token_param are required for the {} pagination style'
+                                 .format(pagination_style))
+            if pagination_style not in (PaginationStyle.OFFSET, PaginationStyle.PAGE_TOKEN, PaginationStyle.CURSOR,
+                                        PaginationStyle.LINK_HEADER):
+                raise ValueError('Unknown pagination style: {}'.format(pagination_style))
+
+            kwargs['resp_type'] = 'response'
+            page_params = dict(params or {})
+            if page_size:
+                page_params[page_size_param] = page_size
+            if pagination_style == PaginationStyle.OFFSET:
+                page_params[offset_param] = start_offset
+            page = {'params': page_params, 'json_data': json_data, 'full_url': full_url}
+
+            def request_page(page):
+                response = self._http_request(method, url_suffix, **dict(kwargs, **page))
+                try:
+                    return response, response.json()
+                except ValueError as exception:
+                    raise DemistoException('Failed to parse json object from response: {}'
+                                           .format(response.content), exception)
+
+            records_count = 0
+            pending_page = None
+            while page is not None:
+                response, body = pending_page.result() if pending_page else request_page(page)
+                records = (demisto.get(body, records_path) if records_path else body) or []
+                page = self._get_next_page(page, response, body, len(records), pagination_style, page_size,
+                                           offset_param, next_token_path, token_param)
+                if page is not None and limit is not None and records_count + len(records) >= limit:
+                    page = None
+                pending_page = PrefetchedCall(request_page, page) if prefetch and page is not None else None
+                for record in records:
+                    yield record
+                    records_count += 1
+                    if limit is not None and records_count >= limit:
+                        return
+
+        @staticmethod
+        def _get_next_page(page, response, body, records_count, pagination_style, page_size, offset_param,
+                           next_token_path, token_param):
+            """Gets the request arguments of the page following the given page, or None if it is the last page."""
+            if not records_count:
+                return None
+            next_page = dict(page, params=dict(page['params']))
+            if pagination_style == PaginationStyle.OFFSET:
+                if records_count < page_size:
+                    return None
+                next_page['params'][offset_param] += records_count
+            elif pagination_style == PaginationStyle.LINK_HEADER:
+                next_url = response.links.get('next', {}).get('url')
+                if not next_url:
+                    return None
+                # the next page URL already contains the query of the page
+                next_page.update(full_url=next_url, params={})
+            else:
+                next_token = demisto.get(body, next_token_path)
+                if not next_token:
+                    return None
+                if pagination_style == PaginationStyle.CURSOR and page['json_data'] is not None:
+                    next_page['json_data'] = dict(page['json_data'], **{token_param: next_token})
+                else:
+                    next_page['params'][token_param] = next_token
+            return next_page
+
 
 def batch(iterable, batch_size=1):
     """Gets an iterable and yields slices of it.
 
     :type iterable: ``list``
-    :param iterable: list or other iterable object.
+    :param iterable: list or other iterable object. Generators and other iterators are consumed lazily,
+        so at most one batch is held in memory at a time.
 
     :type batch_size: ``int``
     :param batch_size: the size of batches to fetch
@@ -3585,6 +4048,14 @@ def batch(iterable, batch_size=1):
     :rtype: ``list``
     :return:: Iterable slices of given
     """
+    if not hasattr(iterable, '__getitem__'):
+        iterator = iter(iterable)
+        current_batch = list(itertools.islice(iterator, batch_size))
+        while current_batch:
+            yield current_batch
+            current_batch = list(itertools.islice(iterator, batch_size))
+        return
+
     current_batch = iterable[:batch_size]
     not_batched = iterable[batch_size:]
     while current_batch:
@@ -3593,5 +4064,381 @@ def batch(iterable, batch_size=1):
         not_batched = not_batched[batch_size:]
 
 
+class ProcessLRUCache(object):
+    """A least recently used cache of a bounded size, which is kept between script executions in the same docker
+    process (see ``get_process_cache``).
+
+    :type max_size: ``int``
+    :param max_size: The maximal number of items in the cache. The least recently used item is removed when it is full.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()  # type: OrderedDict
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """Gets an item from the cache, and marks it as the most recently used item.
+
+        :type key: ``object``
+        :param key: The key of the item.
+
+        :type default: ``object``
+        :param default: The value to return if the item is not in the cache.
+
+        :return: The cached value, or the default value.
+        :rtype: ``object``
+        """
+        if key not in self._items:
+            return default
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def items(self):
+        """Gets the items of the cache, from the least recently used item, without marking them as used.
+
+        :return: The (key, value) pairs of the items.
+        :rtype: ``list``
+        """
+        return list(self._items.items())
+
+    def set(self, key, value):
+        """Adds an item to the cache, removing the least recently used items if the cache is full.
+
+        :type key: ``object``
+        :param key: The key of the item.
+
+        :type value: ``object``
+        :param value: The value of the item.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key=None, key_filter=None):
+        """Removes items from the cache.
+
+        :type key: ``object``
+        :param key: The key of the item to remove. If None and no filter is given, all the items are removed.
+
+        :type key_filter: ``function``
+        :param key_filter: A function which gets a key and returns whether to remove its item.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        if key_filter is not None:
+            for item_key in [item_key for item_key in self._items if key_filter(item_key)]:
+                del self._items[item_key]
+        elif key is not None:
+            self._items.pop(key, None)
+        else:
+            self._items.clear()
+
+
+def get_process_cache(name, max_size=10):
+    """Gets a cache which is kept between script executions in the same docker process, for data which is expensive
+    to load, such as decoded machine learning models. The scripts are executed in fresh globals, so the caches are
+    kept in a module registered in ``sys.modules``.
+
+    :type name: ``str``
+    :param name: The name of the cache.
+
+    :type max_size: ``int``
+    :param max_size: The maximal number of items in the cache, when it is created.
+
+    :return: The cache.
+    :rtype: ``ProcessLRUCache``
+    """
+    caches_module = sys.modules.get(PROCESS_CACHES_MODULE_NAME)
+    if caches_module is None:
+        caches_module = types.ModuleType(PROCESS_CACHES_MODULE_NAME)
+        caches_module.caches = {}  # type: ignore
+        sys.modules[PROCESS_CACHES_MODULE_NAME] = caches_module
+    cache = caches_module.caches.get(name)  # type: ignore
+    if cache is None:
+        cache = caches_module.caches[name] = ProcessLRUCache(max_size)  # type: ignore
+    return cache
+
+
+class FeedIndicatorsDelta(object):
+    """Computes the delta between the indicators of consecutive feed fetches, so only new and changed indicators
+    are submitted, together with the list of indicators which were removed from the feed.
+    The state of a fetch is kept as a compressed fingerprint of each indicator (its type, value and a digest of its
+    content), which can be stored in the integration context and passed to the next fetch.
+
+    :type previous_state: ``str``
+    :param previous_state: The state returned by ``get_state`` in the previous fetch. None for the first fetch.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    DIGEST_LENGTH = 16
+
+    def __init__(self, previous_state=None):
+        self._previous = self.decode_state(previous_state) if previous_state else {}
+        self._current = {}  # type: dict
+
+    @staticmethod
+    def decode_state(state):
+        """Decodes a state created by ``get_state``.
+
+        :type state: ``str``
+        :param state: The encoded state.
+
+        :rtype: ``dict``
+        :return:: The indicator digests, by the indicator's type and value.
+        """
+        fingerprints = json.loads(zlib.decompress(base64.b64decode(state)).decode('utf-8'))
+        return {(indicator_type, value): digest for indicator_type, value, digest in fingerprints}
+
+    @classmethod
+    def get_digest(cls, indicator):
+        """Creates a digest of the indicator's content.
+
+        :type indicator: ``dict``
+        :param indicator: The indicator, as submitted to ``demisto.createIndicators``.
+
+        :rtype: ``str``
+        :return:: The digest of the indicator.
+        """
+        content = json.dumps(indicator, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha1(content).hexdigest()[:cls.DIGEST_LENGTH]
+
+    def filter_indicators(self, indicators):
+        """Filters the indicators of the current fetch, keeping only new and changed indicators.
+        The indicators are consumed lazily, so generators are supported.
+
+        :type indicators: ``iterable``
+        :param indicators: The indicators of the current fetch.
+
+        :rtype: ``generator``
+        :return:: The indicators which were not submitted with the same content in the previous fetch.
+        """
+        for indicator in indicators:
+            key = (indicator.get('type'), indicator.get('value'))
+            digest = self.get_digest(indicator)
+            self._current[key] = digest
+            if self._previous.get(key) != digest:
+                yield indicator
+
+    def get_removed_indicators(self):
+        """Gets the indicators of the previous fetch which are not in the current fetch, with their expiration set
+        to the current time, so submitting them to ``demisto.createIndicators`` expires them.
+        Should be called after all the indicators of the current fetch were filtered.
+
+        :rtype: ``list``
+        :return:: The removed indicators.
+        """
+        expiration = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        removed = sorted(set(self._previous) - set(self._current), key=lambda key: (str(key[0]), str(key[1])))
+        return [{'value': value, 'type': indicator_type, 'expiration': expiration}
+                for indicator_type, value in removed]
+
+    def get_state(self):
+        """Gets the state of the current fetch, to be passed to the next fetch.
+
+        :rtype: ``str``
+        :return:: The compressed fingerprints of the current fetch's indicators.
+        """
+        fingerprints = sorted(([indicator_type, value, digest] for (indicator_type, value), digest in
+                               self._current.items()), key=lambda fingerprint: (str(fingerprint[0]), str(fingerprint[1])))
+        compressed = zlib.compress(json.dumps(fingerprints, separators=(',', ':')).encode('utf-8'), 9)
+        return base64.b64encode(compressed).decode('ascii')
+
+
+def load_feed_delta():
+    """Creates the delta of the current feed fetch from the fingerprints stored by the last fetch in the
+    integration context.
+
+    :return: The delta of the current fetch.
+    :rtype: ``FeedIndicatorsDelta``
+    """
+    return FeedIndicatorsDelta(demisto.getIntegrationContext().get(FEED_DELTA_CONTEXT_KEY))
+
+
+def submit_feed_delta(feed_delta, batch_size):
+    """Expires the indicators which were removed from the feed, and stores the fingerprints of the fetched
+    indicators in the integration context for the next fetch.
+
+    :type feed_delta: ``FeedIndicatorsDelta``
+    :param feed_delta: The delta of the current fetch, after all the fetched indicators were filtered.
+
+    :type batch_size: ``int``
+    :param batch_size: The number of indicators in each createIndicators call.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    for b in batch(feed_delta.get_removed_indicators(), batch_size=batch_size):
+        demisto.createIndicators(b)
+    integration_context = demisto.getIntegrationContext()
+    integration_context[FEED_DELTA_CONTEXT_KEY] = feed_delta.get_state()
+    demisto.setIntegrationContext(integration_context)
+
+
+def get_conditional_headers(validators):
+    """Creates the conditional request headers of a feed URL from the validators of its previous fetch.
+
+    :type validators: ``dict``
+    :param validators: The validators of the URL's previous response, as returned by ``get_response_validators``.
+
+    :return: The conditional request headers.
+    :rtype: ``dict``
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def get_response_validators(response, not_modified=False):
+    """Gets the validators of a feed response - its ETag and Last-Modified headers. When the server supports
+    neither, a digest of the content is used instead. The content is streamed through the digest chunk by chunk,
+    so it is not held in memory, but it is consumed - the URL has to be requested again to parse its content.
+
+    :type response: ``requests.Response``
+    :param response: The (streamed) response of the feed URL.
+
+    :type not_modified: ``bool``
+    :param not_modified: Whether the response is a 304 Not Modified response, which has no content.
+
+    :return: The validators of the response.
+    :rtype: ``dict``
+    """
+    validators = {}
+    if response.headers.get('ETag'):
+        validators['etag'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        validators['last_modified'] = response.headers['Last-Modified']
+    if not validators and not not_modified:
+        content_hash = hashlib.sha256()
+        for chunk in response.iter_content(chunk_size=FEED_CONTENT_HASH_CHUNK_SIZE):
+            content_hash.update(chunk)
+        validators['content_hash'] = content_hash.hexdigest()
+    return validators
+
+
+def get_params_signature(params):
+    """Creates a signature of the integration parameters, so the feed validators of a previous configuration
+    are not used.
+
+    :type params: ``dict``
+    :param params: The integration parameters.
+
+    :return: The signature of the parameters.
+    :rtype: ``str``
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def load_feed_validators(signature):
+    """Loads the feed validators stored by the last fetch with the same parameters from the integration context.
+
+    :type signature: ``str``
+    :param signature: The signature of the current integration parameters, as returned by ``get_params_signature``.
+
+    :return: The stored validators, by URL.
+    :rtype: ``dict``
+    """
+    stored = demisto.getIntegrationContext().get(FEED_VALIDATORS_CONTEXT_KEY) or {}
+    return stored.get('validators', {}) if stored.get('signature') == signature else {}
+
+
+def save_feed_validators(signature, validators):
+    """Stores the validators of the fetched feed content in the integration context.
+
+    :type signature: ``str``
+    :param signature: The signature of the current integration parameters, as returned by ``get_params_signature``.
+
+    :type validators: ``dict``
+    :param validators: The validators, by URL.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    integration_context = demisto.getIntegrationContext()
+    integration_context[FEED_VALIDATORS_CONTEXT_KEY] = {'signature': signature, 'validators': validators}
+    demisto.setIntegrationContext(integration_context)
+
+
+class IndicatorsSearcher(object):
+    """Pages through the indicators of a query with ``demisto.searchIndicators``. Iterating the searcher lazily
+    yields the pages, fetching a page per iteration, until a page is shorter than the page size.
+    When the server returns a ``searchAfter`` cursor with a page, the next page is requested by the cursor instead
+    of by its number, so the server does not go over all the previous pages again for each page.
+
+    :type query: ``str``
+    :param query: The indicators query.
+
+    :type size: ``int``
+    :param size: The number of indicators in each page.
+
+    :type offset: ``int``
+    :param offset:
+        The index of the first indicator to yield. The search starts from the page which holds it, and the
+        indicators before it are dropped from that page.
+
+    :type search_args: ``dict``
+    :param search_args: Additional arguments for ``demisto.searchIndicators``, such as fromdate, todate and value.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+    SEARCH_AFTER_KEY = 'searchAfter'
+
+    def __init__(self, query='', size=100, offset=0, **search_args):
+        self.query = query
+        self.size = size
+        self.page = offset // size
+        self.total = None
+        self._offset_in_page = offset % size
+        self._search_args = search_args
+        self._search_after = None
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """Fetches the next page.
+
+        :return: The indicators of the page.
+        :rtype: ``list``
+        """
+        if self._done:
+            raise StopIteration
+        search_args = dict(self._search_args)
+        if self._search_after is not None:
+            search_args[self.SEARCH_AFTER_KEY] = self._search_after
+        else:
+            search_args['page'] = self.page
+        res = demisto.searchIndicators(query=self.query, size=self.size, **search_args) or {}
+        iocs = res.get('iocs') or []
+        self._search_after = res.get(self.SEARCH_AFTER_KEY)
+        self.total = res.get('total', self.total)
+        self.page += 1
+        self._done = len(iocs) < self.size
+        page, self._offset_in_page = iocs[self._offset_in_page:], 0
+        return page
+
+    next = __next__
+
+
 class DemistoException(Exception):
     pass
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import demistomock as demisto
 import copy
+import hashlib
 import json
 import re
 import os
 import sys
+import time
 import requests
 from pytest import raises, mark
 import pytest
@@ -15,7 +17,9 @@ from CommonServerPython import xml2json, json2xml, entryTypes, formats, tableToM
     IntegrationLogger, parse_date_string, IS_PY3, DebugLogger, b64_encode, parse_date_range, return_outputs, \
     argToBoolean, ipv4Regex, ipv4cidrRegex, ipv6cidrRegex, ipv6Regex, batch, FeedIndicatorType, \
     encode_string_results, safe_load_json, remove_empty_elements, aws_table_to_markdown, is_demisto_version_ge, \
-    appendContext
+    appendContext, FeedIndicatorsDelta, get_process_cache, PROCESS_CACHES_MODULE_NAME, IndicatorsSearcher, \
+    get_conditional_headers, get_response_validators, get_params_signature, load_feed_validators, save_feed_validators, \
+    load_feed_delta, submit_feed_delta, FEED_DELTA_CONTEXT_KEY
 
 try:
     from StringIO import StringIO
@@ -1365,6 +1369,320 @@ class TestBaseClient:
         with raises(DemistoException, match='- {}\n.*{}'.format(reason, json_response["error"])):
             self.client._http_request('get', 'event', resp_type='text')
 
+    def test_http_request_reuses_retry_adapter(self, requests_mock):
+        """
+            Given
+            - A base client with a custom connection pool size
+
+            When
+            - Making several http requests with the same and with different retry policies
+
+            Then
+            - Ensure the adapter of each retry policy is created once and reused by the following requests
+            - Ensure the adapter uses the configured pool size
+        """
+        from CommonServerPython import BaseClient
+        requests_mock.get('http://example.com/api/v2/event', text=json.dumps(self.text))
+        client = BaseClient('http://example.com/api/v2/', pool_maxsize=20)
+
+        client._http_request('get', 'event')
+        adapter = client._session.get_adapter('http://example.com')
+        client._http_request('get', 'event')
+        assert client._session.get_adapter('http://example.com') is adapter
+        assert adapter._pool_maxsize == 20
+
+        client._http_request('get', 'event', retries=2, status_list_to_retry=[429])
+        retry_adapter = client._session.get_adapter('http://example.com')
+        assert retry_adapter is not adapter
+        assert retry_adapter.max_retries.total == 2
+
+        client._http_request('get', 'event')
+        assert client._session.get_adapter('http://example.com') is adapter
+
+    def test_share_session(self, mocker):
+        """
+            Given
+            - Several base clients which share sessions
+
+            When
+            - Creating the clients
+
+            Then
+            - Ensure clients with the same base URL, settings and credentials use the same session
+            - Ensure clients with different settings or credentials, or which do not share sessions, use different
+              sessions
+        """
+        from CommonServerPython import BaseClient
+        mocker.patch.dict(BaseClient._shared_sessions, clear=True)
+
+        client = BaseClient('http://example.com/api/v2/', auth=('user', 'pass'), share_session=True)
+        assert BaseClient('http://example.com/api/v2/', auth=('user', 'pass'), share_session=True)._session is \
+            client._session
+        assert BaseClient('http://example.com/api/v2/', auth=('user', 'pass'), verify=False,
+                          share_session=True)._session is not client._session
+        assert BaseClient('http://example.com/api/v2/', auth=('other', 'pass'), share_session=True)._session is not \
+            client._session
+        assert BaseClient('http://example.com/api/v2/', auth=('user', 'pass'), headers={'Authorization': 'token'},
+                          share_session=True)._session is not client._session
+        assert BaseClient('http://example.com/api/v2/', auth=('user', 'pass'))._session is not client._session
+
+    def test_http_request_retry_adapter_replaced_session(self, requests_mock):
+        """
+            Given
+            - A base client whose session was replaced by a session created outside of the client
+
+            When
+            - Sending several requests with the same retry policy
+
+            Then
+            - Ensure the retry adapter is created once and reused by the following requests
+        """
+        from CommonServerPython import BaseClient
+        requests_mock.get('http://example.com/api/v2/event', text=json.dumps(self.text))
+        client = BaseClient('http://example.com/api/v2/')
+        client._session = requests.Session()
+
+        client._http_request('get', 'event', retries=2)
+        adapter = client._session.get_adapter('http://example.com')
+        client._http_request('get', 'event', retries=2)
+        assert client._session.get_adapter('http://example.com') is adapter
+        assert adapter.max_retries.total == 2
+
+    def test_keep_alive_disabled(self):
+        from CommonServerPython import BaseClient
+        client = BaseClient('http://example.com/api/v2/', keep_alive=False)
+        assert client._session.headers['Connection'] == 'close'
+
+    PAGINATION_INPUTS = [
+        ('offset', {}),
+        ('page_token', {'next_token_path': 'meta.next', 'token_param': 'page_token'}),
+        ('cursor', {'next_token_path': 'meta.next', 'token_param': 'cursor'}),
+    ]
+
+    @pytest.mark.parametrize('prefetch', [False, True])
+    @pytest.mark.parametrize('pagination_style, pagination_args', PAGINATION_INPUTS)
+    def test_paginate(self, requests_mock, pagination_style, pagination_args, prefetch):
+        """
+            Given
+            - An API which returns 5 records in pages of 2 records
+
+            When
+            - Paginating over the records with each pagination style, with and without prefetch
+
+            Then
+            - Ensure all the records are yielded in order
+            - Ensure the pagination parameter of each page is sent
+        """
+        def page_callback(request, context):
+            start = int(request.qs.get('offset', request.qs.get('page_token', request.qs.get('cursor', ['0'])))[0])
+            next_start = start + 2 if start + 2 < 5 else None
+            return {'items': list(range(start, min(start + 2, 5))), 'meta': {'next': next_start}}
+
+        requests_mock.get('http://example.com/api/v2/items', json=page_callback)
+        records = self.client._paginate('GET', 'items', records_path='items', pagination_style=pagination_style,
+                                        page_size=2, prefetch=prefetch, **pagination_args)
+        assert list(records) == [0, 1, 2, 3, 4]
+        assert requests_mock.call_count == 3
+        assert all(request.qs['limit'] == ['2'] for request in requests_mock.request_history)
+
+    def test_paginate_cursor_in_body(self, requests_mock):
+        """
+            Given
+            - A search API which gets the cursor of the page in the request body
+
+            When
+            - Paginating over the records with the cursor pagination style
+
+            Then
+            - Ensure the cursor is sent in the request body
+        """
+        def page_callback(request, context):
+            cursor = request.json().get('cursor')
+            return {'items': [cursor or 'first'], 'next': None if cursor else 'second'}
+
+        requests_mock.post('http://example.com/api/v2/search', json=page_callback)
+        records = self.client._paginate('POST', 'search', records_path='items', pagination_style='cursor',
+                                        page_size=None, next_token_path='next', token_param='cursor',
+                                        json_data={'query': 'x'})
+        assert list(records) == ['first', 'second']
+        assert requests_mock.request_history[1].json() == {'query': 'x', 'cursor': 'second'}
+
+    def test_paginate_link_header(self, requests_mock):
+        """
+            Given
+            - An API which returns the URL of the next page in the Link header
+
+            When
+            - Paginating over the records with the link header pagination style
+
+            Then
+            - Ensure the next page URL is requested until there is no next link
+        """
+        requests_mock.get('http://example.com/api/v2/items', json=[1, 2],
+                          headers={'Link': '<http://example.com/api/v2/items?page=2>; rel="next"'})
+        requests_mock.get('http://example.com/api/v2/items?page=2', json=[3])
+        records = self.client._paginate('GET', 'items', pagination_style='link_header', page_size=None)
+        assert list(records) == [1, 2, 3]
+        assert requests_mock.call_count == 2
+
+    def test_paginate_limit(self, requests_mock):
+        """
+            Given
+            - An API with many pages of records
+
+            When
+            - Paginating with a limit, and stopping the iteration early
+
+            Then
+            - Ensure only the pages needed for the limit are requested
+            - Ensure no more pages are requested when the iteration stops
+        """
+        requests_mock.get('http://example.com/api/v2/items', json=list(range(10)))
+        assert list(self.client._paginate('GET', 'items', page_size=10, limit=15)) == list(range(10)) + \
+            list(range(5))
+        assert requests_mock.call_count == 2
+
+        records = self.client._paginate('GET', 'items', page_size=10)
+        assert next(records) == 0
+        assert requests_mock.call_count == 3
+
+    def test_paginate_prefetch_error(self, requests_mock):
+        """
+            Given
+            - An API which fails on the second page
+
+            When
+            - Paginating over the records with prefetch
+
+            Then
+            - Ensure the records of the first page are yielded before the error is raised
+        """
+        from CommonServerPython import DemistoException
+        requests_mock.get('http://example.com/api/v2/items?offset=0', json=[1, 2])
+        requests_mock.get('http://example.com/api/v2/items?offset=2', status_code=500, text='error')
+        records = self.client._paginate('GET', 'items', page_size=2, prefetch=True)
+        assert next(records) == 1
+        assert next(records) == 2
+        with pytest.raises(DemistoException, match='500'):
+            next(records)
+
+    def test_rate_limiter_token_bucket(self, mocker):
+        """
+            Given
+            - A rate limiter of 2 requests per second with a capacity of 2 requests
+
+            When
+            - Acquiring 4 requests at the same time
+
+            Then
+            - Ensure the first 2 requests are sent immediately, and the following requests wait for new tokens
+        """
+        from CommonServerPython import TokenBucketRateLimiter
+        mocker.patch.object(time, 'time', return_value=1000.0)
+        sleep = mocker.patch.object(time, 'sleep')
+        rate_limiter = TokenBucketRateLimiter(rate=2, capacity=2)
+        for _ in range(4):
+            rate_limiter.acquire()
+        assert [call[0][0] for call in sleep.call_args_list] == [0.5, 1.0]
+
+    def test_rate_limiter_headers(self, mocker, requests_mock):
+        """
+            Given
+            - An API which returns rate limit headers
+
+            When
+            - Updating the rate limiter from the responses
+
+            Then
+            - Ensure the limiter waits for the time in the Retry-After header of a throttled response
+            - Ensure the limiter waits for the reset time when no requests remain
+        """
+        from CommonServerPython import TokenBucketRateLimiter
+        mocker.patch.object(time, 'time', return_value=1600000000.0)
+        rate_limiter = TokenBucketRateLimiter(rate=10)
+
+        requests_mock.get('http://example.com/api/v2/event', status_code=429, headers={'Retry-After': '30'})
+        rate_limiter.update_from_response(requests.get('http://example.com/api/v2/event'))
+        assert rate_limiter.get_wait_time() == 30
+
+        requests_mock.get('http://example.com/api/v2/event', headers={'X-RateLimit-Remaining': '0',
+                                                                      'X-RateLimit-Reset': '1600000100'})
+        rate_limiter.update_from_response(requests.get('http://example.com/api/v2/event'))
+        assert rate_limiter.get_wait_time() == 100
+
+    @pytest.mark.parametrize('retry_after, expected', [('5', 5), ('Thu, 01 Jan 1970 00:16:50 GMT', 10), ('x', None),
+                                                       (None, None)])
+    def test_parse_retry_after(self, retry_after, expected):
+        from CommonServerPython import TokenBucketRateLimiter
+        assert TokenBucketRateLimiter.parse_retry_after(retry_after, 1000) == expected
+
+    def test_rate_limiter_state_persisted(self, mocker):
+        """
+            Given
+            - A rate limiter which keeps its state in the integration context
+
+            When
+            - Creating a new limiter after the budget of the previous limiter was used
+
+            Then
+            - Ensure the new limiter continues from the state of the previous limiter
+        """
+        from CommonServerPython import TokenBucketRateLimiter
+        integration_context = {'token': 'abc'}
+        mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: integration_context)
+        mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+        mocker.patch.object(time, 'time', return_value=1000.0)
+        mocker.patch.object(time, 'sleep')
+        rate_limiter = TokenBucketRateLimiter(rate=1, capacity=5, context_key='rate_limit')
+        for _ in range(5):
+            rate_limiter.acquire()
+        response = requests.Response()
+        response.status_code = 200
+        rate_limiter.update_from_response(response)
+
+        assert integration_context['token'] == 'abc'
+        assert TokenBucketRateLimiter(rate=1, capacity=5, context_key='rate_limit').get_wait_time() == 1
+
+    def test_http_request_throttled(self, mocker, requests_mock):
+        """
+            Given
+            - A client with a rate limiter, and an API which throttles the first request
+
+            When
+            - Sending a request
+
+            Then
+            - Ensure the request is resent after the wait time given in the Retry-After header
+        """
+        from CommonServerPython import BaseClient, TokenBucketRateLimiter
+        sleep = mocker.patch.object(time, 'sleep')
+        requests_mock.get('http://example.com/api/v2/event', [
+            {'status_code': 429, 'headers': {'Retry-After': '2'}},
+            {'json': self.text}
+        ])
+        client = BaseClient('http://example.com/api/v2/', rate_limiter=TokenBucketRateLimiter(rate=100))
+        assert client._http_request('get', 'event') == self.text
+        assert requests_mock.call_count == 2
+        assert 1.9 < sleep.call_args[0][0] <= 2
+
+    def test_http_request_throttled_too_long(self, mocker, requests_mock):
+        """
+            Given
+            - A client with a rate limiter, and an API which asks to wait longer than the maximal wait time
+
+            When
+            - Sending a request
+
+            Then
+            - Ensure the throttled response is not resent
+        """
+        from CommonServerPython import BaseClient, TokenBucketRateLimiter, DemistoException
+        requests_mock.get('http://example.com/api/v2/event', status_code=429, headers={'Retry-After': '3600'})
+        client = BaseClient('http://example.com/api/v2/', rate_limiter=TokenBucketRateLimiter(rate=100))
+        with pytest.raises(DemistoException, match='429'):
+            client._http_request('get', 'event')
+        assert requests_mock.call_count == 1
+
     def test_is_valid_ok_codes_empty(self):
         from requests import Response
         from CommonServerPython import BaseClient
@@ -1599,6 +1917,197 @@ def test_batch(iterable, sz, expected):
         assert expected[i] == item
 
 
+@pytest.mark.parametrize('iterable, sz, expected', batch_params)
+def test_batch_generator(iterable, sz, expected):
+    """
+    Given:
+        - A generator (no slicing support).
+    When:
+        - Batching it.
+    Then:
+        - Ensure the same batches are yielded as for the equivalent list.
+    """
+    assert list(batch((x for x in iterable), sz)) == expected
+
+
+def test_feed_indicators_delta():
+    """
+    Given:
+        - The state of a previous fetch.
+    When:
+        - Filtering the indicators of the current fetch, where one indicator was added, one changed and one removed.
+    Then:
+        - Ensure only the added and changed indicators are returned.
+        - Ensure the removed indicator is returned with an expiration.
+        - Ensure the state of the current fetch can be used by the next fetch.
+    """
+    previous = [
+        {'value': '1.1.1.1', 'type': 'IP', 'rawJSON': {'a': 1}},
+        {'value': '2.2.2.2', 'type': 'IP', 'rawJSON': {'a': 1}},
+        {'value': '3.3.3.3', 'type': 'IP', 'rawJSON': {'a': 1}},
+    ]
+    current = [
+        {'value': '1.1.1.1', 'type': 'IP', 'rawJSON': {'a': 1}},
+        {'value': '2.2.2.2', 'type': 'IP', 'rawJSON': {'a': 2}},
+        {'value': '4.4.4.4', 'type': 'IP', 'rawJSON': {'a': 1}},
+    ]
+    first_delta = FeedIndicatorsDelta()
+    assert list(first_delta.filter_indicators(iter(previous))) == previous
+    assert first_delta.get_removed_indicators() == []
+
+    delta = FeedIndicatorsDelta(first_delta.get_state())
+    assert list(delta.filter_indicators(iter(current))) == current[1:]
+    removed = delta.get_removed_indicators()
+    assert [(indicator['value'], indicator['type']) for indicator in removed] == [('3.3.3.3', 'IP')]
+    assert removed[0]['expiration']
+
+    next_delta = FeedIndicatorsDelta(delta.get_state())
+    assert list(next_delta.filter_indicators(iter(current))) == []
+
+
+def test_submit_feed_delta(mocker):
+    """
+    Given:
+        - A feed fetch which stored its delta state, and a fetch in which 2 of its 3 indicators were removed.
+    When:
+        - Submitting the delta of the second fetch in batches of 1.
+    Then:
+        - Ensure the removed indicators are expired in separate batches.
+        - Ensure the state is stored for the next fetch, and the other keys of the integration context are kept.
+    """
+    integration_context = {'other': 'value'}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    create_indicators = mocker.patch.object(demisto, 'createIndicators')
+    indicators = [{'value': value, 'type': 'IP', 'rawJSON': {}} for value in ('1.1.1.1', '2.2.2.2', '3.3.3.3')]
+
+    first_delta = load_feed_delta()
+    list(first_delta.filter_indicators(iter(indicators)))
+    submit_feed_delta(first_delta, batch_size=1)
+    assert create_indicators.call_count == 0
+    assert integration_context[FEED_DELTA_CONTEXT_KEY] == first_delta.get_state()
+
+    delta = load_feed_delta()
+    assert list(delta.filter_indicators(iter(indicators[:1]))) == []
+    submit_feed_delta(delta, batch_size=1)
+    assert [[indicator['value'] for indicator in call_args[0][0]] for call_args in create_indicators.call_args_list] == \
+        [['2.2.2.2'], ['3.3.3.3']]
+    assert integration_context[FEED_DELTA_CONTEXT_KEY] == delta.get_state()
+    assert integration_context['other'] == 'value'
+
+
+def test_process_cache():
+    """
+    Given:
+        - A process cache of 2 items.
+    When:
+        - Adding 3 items, after the first item was used.
+        - Getting the cache again by its name, and invalidating items.
+    Then:
+        - Ensure the least recently used item is removed.
+        - Ensure the same cache is returned, even if the cache is gotten with another size.
+        - Ensure the invalidated items are removed.
+    """
+    cache = get_process_cache('test_process_cache', max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.items() == [('a', 1), ('c', 3)]
+    assert cache.get('b', 'missing') == 'missing'
+
+    same_cache = get_process_cache('test_process_cache', max_size=5)
+    assert same_cache is cache
+    assert sys.modules[PROCESS_CACHES_MODULE_NAME].caches['test_process_cache'] is cache
+    same_cache.invalidate(key_filter=lambda key: key == 'a')
+    assert 'a' not in cache and 'c' in cache
+    same_cache.invalidate()
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize('headers, not_modified, expected_validators', [
+    ({'ETag': '"v1"', 'Last-Modified': 'Tue, 12 May 2020 10:00:00 GMT'}, False,
+     {'etag': '"v1"', 'last_modified': 'Tue, 12 May 2020 10:00:00 GMT'}),
+    ({}, False, {'content_hash': hashlib.sha256(b'1.1.1.1').hexdigest()}),
+    ({}, True, {}),
+])
+def test_get_response_validators(mocker, headers, not_modified, expected_validators):
+    """
+    Given:
+        - A feed response with validator headers, without them, and a 304 response without them.
+    When:
+        - Getting the validators of the response, and the conditional headers of the next request.
+    Then:
+        - Ensure the ETag and Last-Modified headers are used, and a digest of the content when neither is returned.
+        - Ensure the conditional headers are created only from the ETag and Last-Modified validators.
+    """
+    response = mocker.Mock(headers=headers)
+    response.iter_content.return_value = [b'1.1', b'.1.1']
+    validators = get_response_validators(response, not_modified=not_modified)
+    assert validators == expected_validators
+    expected_headers = {}
+    if 'etag' in validators:
+        expected_headers = {'If-None-Match': '"v1"', 'If-Modified-Since': 'Tue, 12 May 2020 10:00:00 GMT'}
+    assert get_conditional_headers(validators) == expected_headers
+
+
+def test_feed_validators(mocker):
+    """
+    Given:
+        - Feed validators which were saved in the integration context.
+    When:
+        - Loading the validators with the same parameters, and with other parameters.
+    Then:
+        - Ensure the validators are loaded only with the same parameters.
+        - Ensure the other keys of the integration context are kept.
+    """
+    integration_context = {'other': 'value'}
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: dict(integration_context))
+    mocker.patch.object(demisto, 'setIntegrationContext', side_effect=integration_context.update)
+    signature = get_params_signature({'url': 'https://example.com', 'conditional_fetch': True})
+    assert signature == get_params_signature({'conditional_fetch': True, 'url': 'https://example.com'})
+    assert load_feed_validators(signature) == {}
+
+    save_feed_validators(signature, {'https://example.com': {'etag': '"v1"'}})
+    assert integration_context['other'] == 'value'
+    assert load_feed_validators(signature) == {'https://example.com': {'etag': '"v1"'}}
+    assert load_feed_validators(get_params_signature({'url': 'https://example.com'})) == {}
+
+
+@pytest.mark.parametrize('use_search_after', [False, True])
+def test_indicators_searcher(mocker, use_search_after):
+    """
+    Given:
+        - 7 indicators, in pages of 3, on a server which does or does not return a searchAfter cursor.
+    When:
+        - Iterating the pages from the 5th indicator.
+    Then:
+        - Ensure the search starts from the page which holds the 5th indicator, without the indicators before it.
+        - Ensure the next pages are requested by the cursor when it is returned, and by the page number otherwise.
+        - Ensure the iteration stops after the short last page.
+    """
+    indicators = [{'value': str(i)} for i in range(7)]
+
+    def search_indicators(query, size, page=None, searchAfter=None):
+        start = searchAfter if searchAfter is not None else page * size
+        res = {'iocs': indicators[start:start + size], 'total': len(indicators)}
+        if use_search_after:
+            res['searchAfter'] = start + size
+        return res
+
+    search_mock = mocker.patch.object(demisto, 'searchIndicators', side_effect=search_indicators)
+    searcher = IndicatorsSearcher(query='type:IP', size=3, offset=4)
+    assert list(searcher) == [[{'value': '4'}, {'value': '5'}], [{'value': '6'}]]
+    assert searcher.total == 7
+    assert searcher.page == 3
+    assert search_mock.call_args_list[0][1] == {'query': 'type:IP', 'size': 3, 'page': 1}
+    if use_search_after:
+        assert search_mock.call_args_list[1][1] == {'query': 'type:IP', 'size': 3, 'searchAfter': 6}
+    else:
+        assert search_mock.call_args_list[1][1] == {'query': 'type:IP', 'size': 3, 'page': 2}
+
+
 regexes_test = [
     (ipv4Regex, '192.168.1.1', True),
     (ipv4Regex, '192.168.a.1', False),
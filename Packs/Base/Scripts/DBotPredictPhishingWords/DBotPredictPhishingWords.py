@@ -6,21 +6,38 @@ import demisto_ml
 from CommonServerPython import *
 
 
+MODELS_CACHE_NAME = 'DBotPredictPhishingWordsModels'
+MODELS_CACHE_SIZE = 3
+
+
 def get_model_data(model_name, store_type, is_return_error):
-    res_model_list = demisto.executeCommand("getList", {"listName": model_name})[0]
-    res_model = demisto.executeCommand("getMLModel", {"modelName": model_name})[0]
-
-    if is_error(res_model_list) and not is_error(res_model):
-        return res_model['Contents']['modelData']
-    elif not is_error(res_model_list) and is_error(res_model):
-        return res_model_list["Contents"]
-    elif not is_error(res_model_list) and not is_error(res_model):
-        if store_type == "list":
-            return res_model_list["Contents"]
-        elif store_type == "mlModel":
-            return res_model['Contents']['modelData']
-    else:
-        handle_error("error reading model %s from Demisto" % model_name, is_return_error)
+    def load_from_list():
+        res = demisto.executeCommand("getList", {"listName": model_name})[0]
+        return None if is_error(res) else res["Contents"]
+
+    def load_from_ml_model():
+        res = demisto.executeCommand("getMLModel", {"modelName": model_name})[0]
+        return None if is_error(res) else res['Contents']['modelData']
+
+    loaders = [load_from_list, load_from_ml_model] if store_type == "list" else [load_from_ml_model, load_from_list]
+    for loader in loaders:
+        model_data = loader()
+        if model_data is not None:
+            return model_data
+    handle_error("error reading model %s from Demisto" % model_name, is_return_error)
+
+
+def load_model(model_name, store_type, is_return_error):
+    model_data = get_model_data(model_name, store_type, is_return_error)
+    encoded_model_data = model_data.encode('utf-8') if isinstance(model_data, str) else model_data
+    cache_key = (model_name, hashlib.md5(encoded_model_data).hexdigest())  # nosec
+    models_cache = get_process_cache(MODELS_CACHE_NAME, MODELS_CACHE_SIZE)
+    model = models_cache.get(cache_key)
+    if model is None:
+        model = demisto_ml.decode_model(model_data)
+        models_cache.invalidate(key_filter=lambda key: key[0] == model_name)
+        models_cache.set(cache_key, model)
+    return model
 
 
 def handle_error(message, is_return_error):
@@ -31,23 +48,15 @@ def handle_error(message, is_return_error):
         sys.exit(1)
 
 
-def predict_phishing_words(model_name, model_store_type, email_subject, email_body, min_text_length, label_threshold,
-                           word_threshold, top_word_limit, is_return_error, set_incidents_fields=False):
-    model_data = get_model_data(model_name, model_store_type, is_return_error)
-    model = demisto_ml.decode_model(model_data)
-    text = "%s %s" % (email_subject, email_body)
-    res = demisto.executeCommand('WordTokenizerNLP', {'value': text,
-                                                      'hashWordWithSeed': demisto.args().get('hashSeed')})
-    if is_error(res[0]):
-        handle_error(res[0]['Contents'], is_return_error)
-    tokenized_text_result = res[0]['Contents']
+def explain_tokenized_text(model, tokenized_text_result, min_text_length, label_threshold, word_threshold,
+                           top_word_limit):
     input_text = tokenized_text_result['hashedTokenizedText'] if tokenized_text_result.get('hashedTokenizedText') else \
         tokenized_text_result['tokenizedText']
     filtered_text, filtered_text_number_of_words = demisto_ml.filter_model_words(input_text, model)
     if filtered_text_number_of_words == 0:
-        handle_error("The model does not contains any of the input text words", is_return_error)
+        raise DemistoException("The model does not contains any of the input text words")
     if filtered_text_number_of_words < min_text_length:
-        handle_error("The model contains less then %d words" % min_text_length, is_return_error)
+        raise DemistoException("The model contains less then %d words" % min_text_length)
 
     explain_result = demisto_ml.explain_model_words(model,
                                                     input_text,
@@ -56,8 +65,7 @@ def predict_phishing_words(model_name, model_store_type, email_subject, email_bo
                                                     top_word_limit)
     predicted_prob = explain_result["Probability"]
     if predicted_prob < label_threshold:
-        handle_error("Label probability is {:.2f} and it's below the input threshold".format(
-            predicted_prob), is_return_error)
+        raise DemistoException("Label probability is {:.2f} and it's below the input threshold".format(predicted_prob))
 
     if tokenized_text_result.get('hashedTokenizedText'):
         words_to_token_maps = tokenized_text_result['wordsToHashedTokens']
@@ -67,8 +75,29 @@ def predict_phishing_words(model_name, model_store_type, email_subject, email_bo
     negative_tokens = set([''.join(c for c in word if c.isalnum()) for word in explain_result['NegativeWords']])
     positive_words = find_words_contain_tokens(positive_tokens, words_to_token_maps)
     negative_words = find_words_contain_tokens(negative_tokens, words_to_token_maps)
-    positive_words = [s.strip(punctuation) for s in positive_words]
-    negative_words = [s.strip(punctuation) for s in negative_words]
+    explain_result['PositiveWords'] = [s.strip(punctuation) for s in positive_words]
+    explain_result['NegativeWords'] = [s.strip(punctuation) for s in negative_words]
+    explain_result['OriginalText'] = tokenized_text_result['originalText'].strip()
+    return explain_result
+
+
+def predict_phishing_words(model_name, model_store_type, email_subject, email_body, min_text_length, label_threshold,
+                           word_threshold, top_word_limit, is_return_error, set_incidents_fields=False):
+    model = load_model(model_name, model_store_type, is_return_error)
+    text = "%s %s" % (email_subject, email_body)
+    res = demisto.executeCommand('WordTokenizerNLP', {'value': text,
+                                                      'hashWordWithSeed': demisto.args().get('hashSeed')})
+    if is_error(res[0]):
+        handle_error(res[0]['Contents'], is_return_error)
+    tokenized_text_result = res[0]['Contents']
+    try:
+        explain_result = explain_tokenized_text(model, tokenized_text_result, min_text_length, label_threshold,
+                                                word_threshold, top_word_limit)
+    except DemistoException as e:
+        handle_error(str(e), is_return_error)
+    predicted_prob = explain_result["Probability"]
+    positive_words = explain_result['PositiveWords']
+    negative_words = explain_result['NegativeWords']
 
     if len(positive_words) > 0:
         res = demisto.executeCommand('HighlightWords', {'text': tokenized_text_result['originalText'],
@@ -81,9 +110,6 @@ def predict_phishing_words(model_name, model_store_type, email_subject, email_bo
     else:
         highlighted_text_markdown = tokenized_text_result['originalText'].strip()
 
-    explain_result['PositiveWords'] = positive_words
-    explain_result['NegativeWords'] = negative_words
-    explain_result['OriginalText'] = tokenized_text_result['originalText'].strip()
     explain_result['TextTokensHighlighted'] = highlighted_text_markdown
     predicted_label = explain_result["Label"]
 
@@ -113,6 +139,65 @@ def predict_phishing_words(model_name, model_store_type, email_subject, email_bo
     }
 
 
+def get_batch_emails(emails_json, emails_entry_id):
+    if emails_entry_id:
+        res = demisto.getFilePath(emails_entry_id)
+        if not res:
+            return_error("Entry {} not found".format(emails_entry_id))
+        with open(res['path'], 'r') as f:
+            emails_json = f.read()
+    emails = json.loads(emails_json)
+    return emails if isinstance(emails, list) else [emails]
+
+
+def predict_phishing_words_batch(model_name, model_store_type, emails, min_text_length, label_threshold,
+                                 word_threshold, top_word_limit, is_return_error):
+    """Predicts the labels of a batch of emails, decoding the model once and tokenizing all the emails in a single
+    command. The text highlighting is not returned in the batch mode, and the emails which can not be predicted get
+    an error instead of a label.
+    """
+    model = load_model(model_name, model_store_type, is_return_error)
+    texts = ["%s %s" % (email.get('emailSubject', ''), email.get('emailBody', '') or email.get('emailBodyHTML', ''))
+             for email in emails]
+    res = demisto.executeCommand('WordTokenizerNLP', {'value': json.dumps(texts),
+                                                      'isValueJson': 'yes',
+                                                      'hashWordWithSeed': demisto.args().get('hashSeed')})
+    if is_error(res[0]):
+        handle_error(res[0]['Contents'], is_return_error)
+    tokenized_text_results = res[0]['Contents']
+    if not isinstance(tokenized_text_results, list):
+        tokenized_text_results = [tokenized_text_results]
+
+    explain_results = []
+    for index, tokenized_text_result in enumerate(tokenized_text_results):
+        try:
+            explain_result = explain_tokenized_text(model, tokenized_text_result, min_text_length, label_threshold,
+                                                    word_threshold, top_word_limit)
+        except DemistoException as e:
+            explain_result = {'OriginalText': tokenized_text_result['originalText'].strip(), 'Error': str(e)}
+        explain_result['Index'] = index
+        explain_results.append(explain_result)
+
+    explain_results_hr = [{'Index': explain_result['Index'],
+                           'Label': explain_result.get('Label'),
+                           'Probability': "%.2f" % explain_result['Probability'] if 'Probability' in explain_result
+                           else None,
+                           'PositiveWords': ", ".join(explain_result.get('PositiveWords', [])),
+                           'Error': explain_result.get('Error')} for explain_result in explain_results]
+    return {
+        'Type': entryTypes['note'],
+        'Contents': explain_results,
+        'ContentsFormat': formats['json'],
+        'HumanReadable': tableToMarkdown('DBot Predict Phishing Words', explain_results_hr,
+                                         headers=['Index', 'Label', 'Probability', 'PositiveWords', 'Error'],
+                                         removeNull=True),
+        'HumanReadableFormat': formats['markdown'],
+        'EntryContext': {
+            'DBotPredictPhishingWords': explain_results
+        }
+    }
+
+
 def find_words_contain_tokens(positive_tokens, words_to_token_maps):
     positive_words = []
     for word, word_in_tokens_list in words_to_token_maps.items():
@@ -122,6 +207,17 @@ def find_words_contain_tokens(positive_tokens, words_to_token_maps):
 
 
 def main():
+    if demisto.args().get('emailsJson') or demisto.args().get('emailsEntryId'):
+        return predict_phishing_words_batch(demisto.args()['modelName'],
+                                            demisto.args()['modelStoreType'],
+                                            get_batch_emails(demisto.args().get('emailsJson'),
+                                                             demisto.args().get('emailsEntryId')),
+                                            int(demisto.args()['minTextLength']),
+                                            float(demisto.args().get("labelProbabilityThreshold", 0)),
+                                            float(demisto.args().get('wordThreshold', 0)),
+                                            int(demisto.args()['topWordsLimit']),
+                                            demisto.args()['returnError'] == 'true')
+
     result = predict_phishing_words(demisto.args()['modelName'],
                                     demisto.args()['modelStoreType'],
                                     demisto.args().get('emailSubject', ''),
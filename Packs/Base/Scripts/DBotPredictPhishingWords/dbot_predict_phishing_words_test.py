@@ -3,11 +3,17 @@ from collections import defaultdict
 import pytest
 
 from CommonServerPython import *
-from DBotPredictPhishingWords import get_model_data, predict_phishing_words, main
+from DBotPredictPhishingWords import get_model_data, load_model, predict_phishing_words, predict_phishing_words_batch, \
+    main, MODELS_CACHE_NAME
 
 TOKENIZATION_RESULT = None
 
 
+@pytest.fixture(autouse=True)
+def clear_models_cache():
+    get_process_cache(MODELS_CACHE_NAME).invalidate()
+
+
 def get_args():
     args = defaultdict(lambda: "yes")
     args['encoding'] = 'utf8'
@@ -47,6 +53,26 @@ def test_get_model_data(mocker):
     assert "ModelDataML" == get_model_data("test", "mlModel", True)
 
 
+def test_load_model_cache(mocker):
+    models_data = {'model1': 'ModelData1', 'model2': 'ModelData2'}
+
+    def execute_command_models(command, args=None):
+        return [{'Contents': {'modelData': models_data[args['modelName']]}, 'Type': 'note'}]
+
+    mocker.patch.object(demisto, 'executeCommand', side_effect=execute_command_models)
+    decode_model = mocker.patch('demisto_ml.decode_model', side_effect=lambda data: 'Decoded' + data, create=True)
+    assert load_model('model1', 'mlModel', True) == 'DecodedModelData1'
+    assert load_model('model2', 'mlModel', True) == 'DecodedModelData2'
+    assert load_model('model1', 'mlModel', True) == 'DecodedModelData1'
+    assert decode_model.call_count == 2
+    assert demisto.executeCommand.call_count == 3
+
+    # a retrained model is decoded again
+    models_data['model1'] = 'ModelData3'
+    assert load_model('model1', 'mlModel', True) == 'DecodedModelData3'
+    assert decode_model.call_count == 3
+
+
 def test_predict_phishing_words(mocker):
     global TOKENIZATION_RESULT
     mocker.patch.object(demisto, 'executeCommand', side_effect=executeCommand)
@@ -267,3 +293,33 @@ def test_no_positive_words(mocker):
 
     res = main()
     assert res['Contents']['TextTokensHighlighted'] == TOKENIZATION_RESULT['originalText']
+
+
+def test_predict_phishing_words_batch(mocker):
+    def execute_command_batch(command, args=None):
+        if command == 'WordTokenizerNLP':
+            assert args['isValueJson'] == 'yes'
+            return [{'Contents': [{'originalText': text, 'tokenizedText': text,
+                                   'originalWordsToTokens': {w: [w] for w in text.split()}}
+                                  for text in json.loads(args['value'])],
+                     'Type': 'note'}]
+        return executeCommand(command, args)
+
+    def filter_model_words(text, model):
+        return text, len(text.split())
+
+    decode_model = mocker.patch('demisto_ml.decode_model', return_value="Model", create=True)
+    mocker.patch.object(demisto, 'executeCommand', side_effect=execute_command_batch)
+    mocker.patch.object(demisto, 'args', return_value={'topWordsLimit': 10})
+    mocker.patch('demisto_ml.filter_model_words', side_effect=filter_model_words, create=True)
+    mocker.patch('demisto_ml.explain_model_words', return_value={"Label": 'Valid',
+                                                                 'Probability': 0.7,
+                                                                 'PositiveWords': ['word1'],
+                                                                 'NegativeWords': ['word2']},
+                 create=True)
+    emails = [{'emailSubject': 'word1', 'emailBody': 'word2 word3'}, {'emailSubject': 'word1', 'emailBody': ''}]
+    res = predict_phishing_words_batch("modelName", "list", emails, 2, 0, 0, 10, True)
+    assert decode_model.call_count == 1
+    assert res['Contents'] == [{'OriginalText': 'word1 word2 word3', 'Probability': 0.7, 'NegativeWords': ['word2'],
+                                'PositiveWords': ['word1'], 'Label': 'Valid', 'Index': 0},
+                               {'OriginalText': 'word1', 'Error': 'The model contains less then 2 words', 'Index': 1}]
@@ -1,7 +1,9 @@
 # pylint: disable=no-member
+import multiprocessing
 import pickle
 import uuid
 from HTMLParser import HTMLParser
+from Queue import Empty
 from io import BytesIO, StringIO
 
 import demisto_ml
@@ -12,6 +14,12 @@ from CommonServerPython import *
 DBOT_TEXT_FIELD = 'dbot_text'
 DBOT_PROCESSED_TEXT_FIELD = 'dbot_processed_text'
 CONTEXT_KEY = 'DBotPreProcessTextData'
+TOKENIZATION_BATCH_SIZE = 1000
+MIN_SAMPLES_PER_WORKER = 1000
+# seconds to wait for a worker result before checking whether the workers are still alive
+WORKER_RESULT_TIMEOUT = 10
+# number of CSV rows converted to JSON at a time when reading the input file
+CSV_ROWS_BATCH_SIZE = 1000
 HTML_PATTERNS = [
     re.compile(r"(?is)<(script|style).*?>.*?(</\1>)"),
     re.compile(r"(?s)<!--(.*?)-->[\n]?"),
@@ -39,20 +47,71 @@ def hash_word(word, seed):
     return str(hash_djb2(word, seed))
 
 
+def batch_list(items, batch_size):
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def run_in_processes(func, items, workers_count):
+    """
+    Applies the function to the items in forked processes, each process handles a contiguous shard of the items.
+    The processes are forked, so the function is not pickled and may be a closure, and only the results are sent back.
+    Raises a DemistoException if the function fails, or if a process exits without sending its results.
+    """
+    if workers_count <= 1 or len(items) < 2 * MIN_SAMPLES_PER_WORKER:
+        return [func(item) for item in items]
+    workers_count = min(workers_count, len(items) // MIN_SAMPLES_PER_WORKER)
+    shards = batch_list(items, (len(items) + workers_count - 1) // workers_count)
+    results_queue = multiprocessing.Queue()
+
+    def process_shard(shard_index, shard):
+        try:
+            results_queue.put((shard_index, [func(item) for item in shard], None))
+        except Exception as e:
+            results_queue.put((shard_index, None, str(e)))
+
+    processes = [multiprocessing.Process(target=process_shard, args=(i, shard)) for i, shard in enumerate(shards)]
+    for process in processes:
+        process.start()
+    # the results are read before joining the processes, which exit only once their results are consumed
+    shard_results = {}
+    while len(shard_results) < len(processes):
+        # a process which has exited already flushed its result to the queue, so if none is received in time,
+        # the process exited without sending it (for example, it was killed) and waiting for it would block forever
+        exited = [i for i, process in enumerate(processes) if i not in shard_results and process.exitcode is not None]
+        try:
+            shard_index, results, error = results_queue.get(timeout=WORKER_RESULT_TIMEOUT)
+        except Empty:
+            if exited:
+                error = 'the worker process exited with code {} without a result'.format(processes[exited[0]].exitcode)
+            else:
+                continue
+        if error is not None:
+            for process in processes:
+                process.terminate()
+            raise DemistoException('Failed to pre-process the text: {}'.format(error))
+        shard_results[shard_index] = results
+    for process in processes:
+        process.join()
+    return [result for shard_index in range(len(shards)) for result in shard_results[shard_index]]
+
+
 def pre_process_nlp(text_data):
-    res = demisto.executeCommand('WordTokenizerNLP', {
-        'value': json.dumps(text_data),
-        'isValueJson': 'yes',
-        'tokenizationMethod': demisto.args()['tokenizationMethod'],
-        'language': demisto.args()['language']
-    })
-
-    if is_error(res):
-        return_error(get_error(res))
-    processed_text_data = res[0]['Contents']
-    if not isinstance(processed_text_data, list):
-        processed_text_data = [processed_text_data]
-    tokenized_text_data = map(lambda x: x.get('tokenizedText'), processed_text_data)
+    tokenized_text_data = []  # type: List[str]
+    batch_size = int(demisto.args().get('tokenizationBatchSize') or TOKENIZATION_BATCH_SIZE)
+    for text_data_batch in batch_list(text_data, batch_size):
+        res = demisto.executeCommand('WordTokenizerNLP', {
+            'value': json.dumps(text_data_batch),
+            'isValueJson': 'yes',
+            'tokenizationMethod': demisto.args()['tokenizationMethod'],
+            'language': demisto.args()['language']
+        })
+
+        if is_error(res):
+            return_error(get_error(res))
+        processed_text_data = res[0]['Contents']
+        if not isinstance(processed_text_data, list):
+            processed_text_data = [processed_text_data]
+        tokenized_text_data += map(lambda x: x.get('tokenizedText'), processed_text_data)
     return tokenized_text_data
 
 
@@ -81,7 +140,11 @@ def read_file(input_entry_or_string, file_type):
         with open(file_path, 'rb') as f:
             file_content = BytesIO(f.read())
     if file_type.startswith('csv'):
-        return json.loads(pd.read_csv(file_content).fillna('').to_json(orient='records'))
+        df = pd.read_csv(file_content).fillna('')
+        # converted in batches of rows, to avoid encoding the whole file as a single JSON string
+        for i in range(0, len(df), CSV_ROWS_BATCH_SIZE):
+            data += json.loads(df.iloc[i:i + CSV_ROWS_BATCH_SIZE].to_json(orient='records'))
+        return data
     elif file_type.startswith('json'):
         return json.loads(file_content.getvalue())
     elif file_type.startswith('pickle'):
@@ -90,17 +153,27 @@ def read_file(input_entry_or_string, file_type):
         return_error("Unsupported file type %s" % file_type)
 
 
-def pre_process(data, source_text_field, target_text_field, remove_html_tags, pre_process_type, hash_seed):
-    tokenized_text_data = map(lambda x: x[source_text_field], data)
+def clean_text(text, remove_html_tags):
     if remove_html_tags:
-        tokenized_text_data = map(clean_html, tokenized_text_data)
-    tokenized_text_data = map(remove_line_breaks, tokenized_text_data)
+        text = clean_html(text)
+    return remove_line_breaks(text)
+
+
+def hash_text(text, hash_seed):
+    return " ".join(map(lambda word: hash_word(word, hash_seed), text.split(" ")))
+
+
+def pre_process(data, source_text_field, target_text_field, remove_html_tags, pre_process_type, hash_seed,
+                workers_count=1):
+    tokenized_text_data = run_in_processes(lambda text: clean_text(text, remove_html_tags),
+                                           [d[source_text_field] for d in data], workers_count)
     pre_process_func = PRE_PROCESS_TYPES[pre_process_type]
     tokenized_text_data = pre_process_func(tokenized_text_data)
-    for d, tokenized_text_data in zip(data, tokenized_text_data):
-        if hash_seed:
-            tokenized_text_data = " ".join(map(lambda word: hash_word(word, hash_seed), tokenized_text_data.split(" ")))
-        d[target_text_field] = tokenized_text_data
+    if hash_seed:
+        tokenized_text_data = run_in_processes(lambda text: hash_text(text, hash_seed), tokenized_text_data,
+                                               workers_count)
+    for d, tokenized_text in zip(data, tokenized_text_data):
+        d[target_text_field] = tokenized_text
     return data
 
 
@@ -156,6 +229,26 @@ def remove_duplicate_by_indices(data, duplicate_indices):
     return data, description
 
 
+def write_output_file(file_name, data, output_format):
+    """
+    Creates the output file like fileResult, but encodes the data into the file sample by sample, instead of encoding
+    the whole data set in memory first.
+    """
+    file_id = demisto.uniqueFile()
+    with open(demisto.investigation()['id'] + '_' + file_id, 'wb') as f:
+        if output_format == 'pickle':
+            pickle.Pickler(f).dump(data)
+        else:
+            f.write('[')
+            for i, d in enumerate(data):
+                if i > 0:
+                    f.write(', ')
+                f.write(json.dumps(d, default=str))
+            f.write(']')
+    return {'Contents': '', 'ContentsFormat': formats['text'], 'Type': entryTypes['file'], 'File': file_name,
+            'FileID': file_id}
+
+
 def main():
     text_fields = demisto.args()['textFields'].split(",")
     input = demisto.args().get('input')
@@ -169,6 +262,7 @@ def main():
         'whitelistFields') else None
     output_format = demisto.args()['outputFormat']
     output_original_text_fields = demisto.args().get('outputOriginalTextFields', 'false') == 'true'
+    workers_count = int(demisto.args().get('workersCount') or multiprocessing.cpu_count())
 
     description = ""
     # read data
@@ -181,7 +275,8 @@ def main():
     # clean text
     if pre_process_type not in PRE_PROCESS_TYPES:
         return_error('Pre-process type {} is not supported'.format(pre_process_type))
-    data = pre_process(data, DBOT_TEXT_FIELD, DBOT_PROCESSED_TEXT_FIELD, remove_html_tags, pre_process_type, hash_seed)
+    data = pre_process(data, DBOT_TEXT_FIELD, DBOT_PROCESSED_TEXT_FIELD, remove_html_tags, pre_process_type, hash_seed,
+                       workers_count)
 
     # remove short emails
     data, desc = remove_short_text(data, DBOT_TEXT_FIELD, remove_short_threshold)
@@ -209,13 +304,9 @@ def main():
     # output
     file_name = str(uuid.uuid4())
     output_format = demisto.args()['outputFormat']
-    if output_format == 'pickle':
-        data_encoded = pickle.dumps(data)
-    elif output_format == 'json':
-        data_encoded = json.dumps(data, default=str)
-    else:
+    if output_format not in ['pickle', 'json']:
         return_error("Invalid output format: %s" % output_format)
-    entry = fileResult(file_name, data_encoded)
+    entry = write_output_file(file_name, data, output_format)
     entry['Contents'] = data
     entry['HumanReadable'] = description
     entry['EntryContext'] = {
@@ -1,10 +1,14 @@
+import os
 import pickle
 
 import pandas as pd
+import pytest
 
+import DBotPreprocessTextData
 from CommonServerPython import *
 from DBotPreprocessTextData import clean_html, remove_line_breaks, hash_word, read_file, \
-    concat_text_fields, whitelist_dict_fields, remove_short_text, remove_duplicate_by_indices, pre_process, main
+    concat_text_fields, whitelist_dict_fields, remove_short_text, remove_duplicate_by_indices, pre_process, main, \
+    run_in_processes, pre_process_nlp
 
 
 def test_clean_html(mocker):
@@ -163,6 +167,34 @@ def test_pre_process():
         {'body': 'TestBody1 TestBody2 <h1> html </h1>', 'processed': '148060132 148060133 2090341082'}]
 
 
+def test_run_in_processes():
+    texts = ['TestBody{} <h1> html </h1>'.format(i) for i in range(5000)]
+    assert run_in_processes(clean_html, texts, 4) == map(clean_html, texts)
+
+
+def test_run_in_processes_worker_exited(mocker):
+    def exit_worker(text):
+        if text == 'TestBody4999':
+            os._exit(1)
+        return text
+
+    mocker.patch.object(DBotPreprocessTextData, 'WORKER_RESULT_TIMEOUT', 0.1)
+    texts = ['TestBody{}'.format(i) for i in range(5000)]
+    with pytest.raises(DemistoException, match='exited with code 1'):
+        run_in_processes(exit_worker, texts, 4)
+
+
+def test_pre_process_nlp_batches(mocker):
+    def execute_command(command, args):
+        return [{'Type': 'note', 'Contents': [{'tokenizedText': text.lower()} for text in json.loads(args['value'])]}]
+
+    mocker.patch.object(demisto, 'args', return_value={'tokenizationBatchSize': '2', 'tokenizationMethod': 'tokenizer',
+                                                       'language': 'English'})
+    mocker.patch.object(demisto, 'executeCommand', side_effect=execute_command)
+    assert pre_process_nlp(['A', 'B', 'C', 'D', 'E']) == ['a', 'b', 'c', 'd', 'e']
+    assert demisto.executeCommand.call_count == 3
+
+
 def test_main(mocker):
     args = {
         'textFields': 'subject|subject2,body|body2',
@@ -1,7 +1,15 @@
 # type: ignore
+import base64
+import hashlib
+import zlib
+from collections import Counter
+
 import dateutil.parser
+import numpy as np
+from scipy.sparse import csr_matrix
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
+from sklearn.preprocessing import normalize
 
 from CommonServerPython import *
 
@@ -21,6 +29,124 @@ def get_similar_texts(text, other_texts):
     return similarity_vector[1:]
 
 
+def get_similar_texts_by_counts(counts):
+    """Computes the TF-IDF similarity of the first text to the other texts from their term counts matrix, with the
+    same weighting as the TfidfVectorizer of get_similar_texts (smooth IDF over the given texts, L2 normalization).
+    """
+    texts_count = counts.shape[0]
+    # the rows of a csr matrix have unique column indices, so the count of each index is the document frequency
+    document_frequencies = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1. + texts_count) / (1. + document_frequencies)) + 1
+    tfidf = normalize(csr_matrix(counts.multiply(idf)))
+    similarity_vector = linear_kernel(tfidf[0:1], tfidf).flatten()
+    return similarity_vector[1:]
+
+
+class TextVectorIndex(object):
+    """Term counts of incident texts by the incident ID, persisted in a list between runs, so each text is
+    tokenized (and pre-processed) only once.
+    """
+
+    def __init__(self, settings, terms=None, documents=None):
+        self.settings = settings
+        self.terms = terms or []
+        self.vocabulary = {term: i for i, term in enumerate(self.terms)}
+        # incident ID -> [text hash, term indices, term counts]
+        self.documents = documents or {}
+
+    @classmethod
+    def from_string(cls, index_string, settings):
+        try:
+            index_data = json.loads(zlib.decompress(base64.b64decode(index_string)))
+        except Exception as e:
+            demisto.debug('Failed to load the text index, it will be rebuilt: {}'.format(e))
+            return cls(settings)
+        if index_data.get('settings') != settings:
+            return cls(settings)
+        return cls(settings, index_data['terms'], index_data['documents'])
+
+    def to_string(self):
+        index_data = {'settings': self.settings, 'terms': self.terms, 'documents': self.documents}
+        return base64.b64encode(zlib.compress(json.dumps(index_data).encode('utf-8'))).decode('ascii')
+
+    def get_missing_ids(self, text_hashes):
+        return [incident_id for incident_id, text_hash in text_hashes.items()
+                if self.documents.get(incident_id, [None])[0] != text_hash]
+
+    def _get_term_index(self, term):
+        if term not in self.vocabulary:
+            self.vocabulary[term] = len(self.terms)
+            self.terms.append(term)
+        return self.vocabulary[term]
+
+    def add(self, incident_id, text_hash, tokens):
+        term_counts = Counter(tokens)
+        self.documents[incident_id] = [text_hash, [self._get_term_index(term) for term in term_counts],
+                                       list(term_counts.values())]
+
+    def prune(self, incident_ids):
+        """Keeps only the given incidents, and the terms of their texts."""
+        documents = {incident_id: self.documents[incident_id] for incident_id in incident_ids
+                     if incident_id in self.documents}
+        terms = self.terms
+        self.terms, self.vocabulary, self.documents = [], {}, {}
+        for incident_id, (text_hash, indices, counts) in documents.items():
+            self.documents[incident_id] = [text_hash, [self._get_term_index(terms[index]) for index in indices], counts]
+
+    def get_counts_matrix(self, incident_ids):
+        data, indices, indptr = [], [], [0]
+        for incident_id in incident_ids:
+            _, document_indices, document_counts = self.documents[incident_id]
+            indices.extend(document_indices)
+            data.extend(document_counts)
+            indptr.append(len(indices))
+        return csr_matrix((data, indices, indptr), shape=(len(incident_ids), max(len(self.terms), 1)), dtype=float)
+
+
+def get_text_hash(text):
+    return hashlib.md5(text if isinstance(text, bytes) else text.encode('utf-8')).hexdigest()
+
+
+def load_text_index(list_name, settings):
+    res = demisto.executeCommand('getList', {'listName': list_name})
+    if is_error(res) or not res[0]['Contents'] or 'Item not found' in res[0]['Contents']:
+        return TextVectorIndex(settings), False
+    return TextVectorIndex.from_string(res[0]['Contents'], settings), True
+
+
+def save_text_index(list_name, text_index, list_exists):
+    res = demisto.executeCommand('setList' if list_exists else 'createList',
+                                 {'listName': list_name, 'listData': text_index.to_string()})
+    if is_error(res):
+        demisto.debug('Failed to save the text index to the list {}: {}'.format(list_name, get_error(res)))
+
+
+def get_similar_texts_by_index(list_name, incident, incident_text, candidates, text_fields, pre_process_text):
+    """Computes the similarity of the incident text to the texts of the candidates like get_similar_texts, using
+    the term counts of the texts which were already indexed in previous runs.
+    """
+    settings = {'textFields': sorted(text_fields), 'preProcessText': pre_process_text}
+    text_index, list_exists = load_text_index(list_name, settings)
+
+    incident_ids = [str(incident['id'])] + [str(candidate['id']) for candidate in candidates]
+    texts = dict(zip(incident_ids, [incident_text] + [candidate[INCIDENT_TEXT_FIELD] for candidate in candidates]))
+    missing_ids = text_index.get_missing_ids({incident_id: get_text_hash(text) for incident_id, text in texts.items()})
+    if missing_ids:
+        missing_texts = [texts[incident_id] for incident_id in missing_ids]
+        if pre_process_text:
+            missing_texts = pre_process_nlp(missing_texts)
+        analyzer = TfidfVectorizer(min_df=1, stop_words='english').build_analyzer()
+        for incident_id, text in zip(missing_ids, missing_texts):
+            text_index.add(incident_id, get_text_hash(texts[incident_id]), analyzer(text))
+
+    # only the incidents of the current time frame are kept, as the older incidents are not candidates anymore
+    indexed_count = len(text_index.documents)
+    text_index.prune(incident_ids)
+    if missing_ids or len(text_index.documents) != indexed_count:
+        save_text_index(list_name, text_index, list_exists)
+    return get_similar_texts_by_counts(text_index.get_counts_matrix(incident_ids))
+
+
 def get_texts_from_incident(incident, text_fields):
     texts = []
     # labels
@@ -114,6 +240,7 @@ def main():
     MAX_CANDIDATES_IN_LIST = int(demisto.args()['maxResults'])
     TIME_FIELD = demisto.args()['timeField']
     PRE_PROCESS_TEXT = demisto.args()['preProcessText'] == 'true'
+    INDEX_LIST_NAME = demisto.args().get('indexListName')
 
     incident = demisto.incidents()[0]
     incident_text = get_texts_from_incident(incident, TEXT_FIELDS)
@@ -130,12 +257,16 @@ def main():
     candidates = [x for x in candidates if len(x.get(INCIDENT_TEXT_FIELD, 0)) >= MIN_TEXT_LENGTH]
 
     # compare candidates to the orginial incident using TF-IDF
-    candidates_text = map(lambda x: x[INCIDENT_TEXT_FIELD], candidates)
-    if PRE_PROCESS_TEXT:
-        incident_text = pre_process_nlp(incident_text)
-        candidates_text = pre_process_nlp(candidates_text)
+    if INDEX_LIST_NAME:
+        similarity_vector = get_similar_texts_by_index(INDEX_LIST_NAME, incident, incident_text, candidates,
+                                                       TEXT_FIELDS, PRE_PROCESS_TEXT)
+    else:
+        candidates_text = map(lambda x: x[INCIDENT_TEXT_FIELD], candidates)
+        if PRE_PROCESS_TEXT:
+            incident_text = pre_process_nlp(incident_text)
+            candidates_text = pre_process_nlp(candidates_text)
 
-    similarity_vector = get_similar_texts(incident_text, candidates_text)
+        similarity_vector = get_similar_texts(incident_text, candidates_text)
     similar_incidents = []
     for (i, similarity) in enumerate(similarity_vector):
         candidates[i]['similarity'] = similarity
@@ -238,3 +238,33 @@ def test_similar_context_with_pre_process(mocker):
     assert len(result['EntryContext']['similarIncidentList']) == 1
     assert result['EntryContext']['similarIncidentList'][0]['rawId'] == 2
     assert result['EntryContext']['similarIncident']['similarity'] > 0.9
+
+
+def test_similar_context_with_index(mocker):
+    args = dict(default_args)
+    args.update({'indexListName': 'similar_incidents_index'})
+    lists = {}
+
+    def execute_command_with_lists(command, args=None):
+        if command == 'getList':
+            if args['listName'] not in lists:
+                return [{'Type': entryTypes['error'], 'Contents': 'Item not found (8)'}]
+            return [{'Type': entryTypes['note'], 'Contents': lists[args['listName']]}]
+        if command in ('createList', 'setList'):
+            lists[args['listName']] = args['listData']
+            return [{'Type': entryTypes['note'], 'Contents': 'Done'}]
+        return execute_command(command, args)
+
+    mocker.patch.object(demisto, 'args', return_value=args)
+    mocker.patch.object(demisto, 'incidents', return_value=[incident1])
+    mocker.patch.object(demisto, 'executeCommand', side_effect=execute_command_with_lists)
+
+    result = main()
+    assert 'similar_incidents_index' in lists
+    assert result['EntryContext']['similarIncidentList'][0]['rawId'] == 2
+    assert result['EntryContext']['similarIncident']['similarity'] > 0.9
+
+    # the texts are already indexed, so the second run does not update the index
+    index_data = lists['similar_incidents_index']
+    assert main()['EntryContext'] == result['EntryContext']
+    assert lists['similar_incidents_index'] == index_data
@@ -5,6 +5,8 @@ import uuid
 from datetime import datetime, timedelta
 from dateutil import parser
 
+DEFAULT_PAGE_SIZE = 500
+
 
 def parse_datetime(datetime_str):
     try:
@@ -65,8 +67,10 @@ def build_incidents_query(extra_query, incident_types, time_field, from_date, to
     return query
 
 
-def get_incidents(query, time_field, size, from_date):
+def get_incidents(query, time_field, size, from_date, page=0):
     args = {"query": query, "size": size, "sort": time_field}
+    if page:
+        args['page'] = page
     if time_field == "created" and from_date:
         from_datetime = None
         try:
@@ -85,8 +89,50 @@ def get_incidents(query, time_field, size, from_date):
     return incident_list
 
 
+def get_incidents_by_page(query, time_field, limit, from_date, page_size):
+    """
+    Yields pages of the incidents, sorted by the time field. Each page is queried from the time of the last incident
+    of the previous page, so the server does not have to skip over all the previous pages. Incidents which have the
+    same time as the last incident are returned again, so they are skipped by their IDs, and the page offset is used
+    while a whole page shares the same time.
+    """
+    seen_ids = set()  # type: Set[Any]
+    cursor = None
+    page = 0
+    while len(seen_ids) < limit:
+        page_query = query if cursor is None else '%s and (%s:>="%s")' % (query, time_field, cursor)
+        incidents = get_incidents(page_query, time_field, page_size, from_date, page)
+        new_incidents = []
+        for incident in incidents:
+            if incident.get('id') not in seen_ids and len(seen_ids) < limit:
+                seen_ids.add(incident.get('id'))
+                new_incidents.append(incident)
+        if new_incidents:
+            yield new_incidents
+        if len(incidents) < page_size:
+            break
+        last_time = incidents[-1].get(time_field)
+        if last_time and last_time != cursor:
+            cursor = last_time
+            page = 0
+        else:
+            page += 1
+
+
+def extend_incident(incident, fields_to_populate, include_context):
+    # we flat the custom field to the incident structure, like in the context
+    custom_fields = incident.get('CustomFields', {}) or {}
+    incident.update(custom_fields)
+    if include_context:
+        incident['context'] = get_context(incident['id'])
+
+    if fields_to_populate and len(fields_to_populate) > 0:
+        incident = {k: v for k, v in incident.items() if k in fields_to_populate}
+    return incident
+
+
 def get_comma_sep_list(value):
-    return map(lambda x: x.strip(), value.split(","))
+    return [x.strip() for x in value.split(",")]
 
 
 def main():
@@ -98,42 +144,38 @@ def main():
                                   demisto.args().get('toDate'),
                                   demisto.args().get('NonEmptyFields'))
 
-    incident_list = get_incidents(query, demisto.args()['timeField'],
-                                  int(demisto.args()['limit']),
-                                  demisto.args().get('fromDate'))
     fields_to_populate = demisto.args().get('populateFields')
     if fields_to_populate:
         fields_to_populate = get_comma_sep_list(fields_to_populate)
         fields_to_populate += get_comma_sep_list(demisto.args().get('NonEmptyFields', ''))
         fields_to_populate = set([x for x in fields_to_populate if x])
     include_context = demisto.args()['includeContext'] == 'true'
-    # extend incidents fields \ context
-    new_incident_list = []
-    for i in incident_list:
-        # we flat the custom field to the incident structure, like in the context
-        custom_fields = i.get('CustomFields', {}) or {}
-        i.update(custom_fields)
-        if include_context:
-            i['context'] = get_context(i['id'])
-
-        if fields_to_populate and len(fields_to_populate) > 0:
-            i = {k: v for k, v in i.items() if k in fields_to_populate}
-        new_incident_list.append(i)
-
-    incident_list = new_incident_list
-
-    # output
-    file_name = str(uuid.uuid4())
-
     output_format = demisto.args()['outputFormat']
-    if output_format == 'pickle':
-        data_encoded = pickle.dumps(incident_list)
-    elif output_format == 'json':
-        data_encoded = json.dumps(incident_list)
-    else:
+    if output_format not in ['pickle', 'json']:
         return_error("Invalid output format: %s" % output_format)
-    entry = fileResult(file_name, data_encoded)
-    entry['Contents'] = incident_list
+
+    # extend incidents fields \ context, and write them to the output file page by page
+    file_name = str(uuid.uuid4())
+    file_id = demisto.uniqueFile()
+    incident_list = []
+    with open(demisto.investigation()['id'] + '_' + file_id, 'wb') as f:
+        if output_format == 'json':
+            f.write(b'[')
+        for incidents in get_incidents_by_page(query, demisto.args()['timeField'],
+                                               int(demisto.args()['limit']),
+                                               demisto.args().get('fromDate'),
+                                               int(demisto.args().get('pageSize') or DEFAULT_PAGE_SIZE)):
+            for i in incidents:
+                i = extend_incident(i, fields_to_populate, include_context)
+                if output_format == 'json':
+                    f.write(((', ' if incident_list else '') + json.dumps(i)).encode('utf-8'))
+                incident_list.append(i)
+        if output_format == 'pickle':
+            pickle.dump(incident_list, f)
+        else:
+            f.write(b']')
+    entry = {'Contents': incident_list, 'ContentsFormat': formats['text'], 'Type': entryTypes['file'],
+             'File': file_name, 'FileID': file_id}
     entry['HumanReadable'] = "Fetched %d incidents successfully by the query: %s" % (len(incident_list), query)
     entry['EntryContext'] = {
         'GetIncidentsByQuery': {
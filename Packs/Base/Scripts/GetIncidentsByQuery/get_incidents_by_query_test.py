@@ -1,5 +1,5 @@
 from CommonServerPython import *
-from GetIncidentsByQuery import build_incidents_query, get_incidents, parse_relative_time, main
+from GetIncidentsByQuery import build_incidents_query, get_incidents, parse_relative_time, main, get_incidents_by_page
 
 incident1 = {
     'id': 1,
@@ -69,6 +69,28 @@ def test_get_incidents(mocker):
     get_incidents(query, "modified", size, "3 weeks ago")
 
 
+def test_get_incidents_by_page(mocker):
+    incidents = [{'id': i, 'created': '2019-01-0%dT00:00:00Z' % (1 + i // 4)} for i in range(10)]
+    queries = []
+
+    def get_incidents_page(command, args):
+        queries.append((args['query'], args.get('page', 0)))
+        res = re.search('created:>="(.+)"', args['query'])
+        matching = [i for i in incidents if not res or i['created'] >= res.group(1)]
+        page = args.get('page', 0)
+        return [{'Type': entryTypes['note'], 'Contents': {'data': matching[page * args['size']:(page + 1) * args['size']]}}]
+
+    mocker.patch.object(demisto, 'executeCommand', side_effect=get_incidents_page)
+    pages = list(get_incidents_by_page('(query)', 'created', 100, None, 3))
+    assert [i['id'] for page in pages for i in page] == list(range(10))
+    # the first page from the 1st day has only incidents which were already fetched, so the next page is taken
+    assert queries[:3] == [('(query)', 0), ('(query) and (created:>="2019-01-01T00:00:00Z")', 0),
+                           ('(query) and (created:>="2019-01-01T00:00:00Z")', 1)]
+
+    pages = list(get_incidents_by_page('(query)', 'created', 5, None, 3))
+    assert [i['id'] for page in pages for i in page] == list(range(5))
+
+
 def test_parse_relative_time():
     threshold = 2
     t1 = parse_relative_time("3 days ago")
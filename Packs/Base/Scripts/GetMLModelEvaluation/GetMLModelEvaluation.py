@@ -67,11 +67,10 @@ def calculate_df_row(class_, threshold, y_true_per_class, y_pred_per_class):
     y_pred_class_binary = binarize(y_pred_class, threshold)
     precision = precision_score(y_true=y_true_class, y_pred=y_pred_class_binary)
     recall = recall_score(y_true=y_true_class, y_pred=y_pred_class_binary)
-    classified_correctly = sum(1 for y_true_i, y_pred_i in zip(y_true_class, y_pred_class_binary) if y_true_i == 1
-                               and y_pred_i == 1)
-    above_thresh = sum(1 for i, y_true_i in enumerate(y_true_class) if y_true_i == 1
-                       and any(y_pred_per_class[c][i] >= threshold for c in y_pred_per_class))
-    fp = sum(1 for i, y_true_i in enumerate(y_true_class) if y_true_i == 0 and y_pred_class_binary[i] == 1.0)
+    classified_correctly = int(np.sum((y_true_class == 1) & (y_pred_class_binary == 1)))
+    any_class_above_thresh = np.any([y_pred_per_class[c] >= threshold for c in y_pred_per_class], axis=0)
+    above_thresh = int(np.sum((y_true_class == 1) & any_class_above_thresh))
+    fp = int(np.sum((y_true_class == 0) & (y_pred_class_binary == 1.0)))
     total = int(sum(y_true_class))
     row = {'Class': class_,
            'Precision': precision,
@@ -210,44 +209,72 @@ def find_threshold(y_true_str, y_pred_str, customer_target_precision, target_rec
     return [entry, per_class_entry]
 
 
+def get_first_indices_above_precisions(precisions, valid_indices_mask, target_precisions):
+    """
+    Finds for each target precision the first index of a valid precision which is higher than the target, as the
+    scan over the precision-recall curve did, by searching the running maximum of the valid precisions.
+    Returns the length of the precisions array for targets which no valid precision is higher than.
+    """
+    valid_precisions = np.where(valid_indices_mask, precisions, -np.inf)
+    running_max_precisions = np.maximum.accumulate(valid_precisions) if len(valid_precisions) > 0 \
+        else valid_precisions
+    return np.searchsorted(running_max_precisions, target_precisions, side='right')
+
+
+def get_precisions_at_thresholds(class_arrs, thresholds):
+    # the precision of the first threshold which is not lower than each of the given thresholds - the thresholds
+    # of the precision-recall curve are sorted, and like np.argmax, the first precision is taken if there is none
+    indices = np.searchsorted(class_arrs['thresholds'], thresholds, side='left')
+    indices[indices == len(class_arrs['thresholds'])] = 0
+    return class_arrs['precisions'][indices]
+
+
 def find_best_threshold_for_target_precision(class_to_arrs, customer_target_precision, labels):
-    target_unified_precision = round(customer_target_precision, 2)
-    unified_threshold_found = False
+    # the target precision is lowered by 0.01 until a threshold is found - all the targets are searched at once.
+    # once the target is negative, every class has a candidate unless all its thresholds are 0, and every candidate
+    # meets the target, so the search ends at the first negative target
+    target_precisions = [round(customer_target_precision, 2)]
+    while target_precisions[-1] >= 0:
+        target_precisions.append(target_precisions[-1] - 0.01)
+    target_precisions = np.array(target_precisions)
+
+    # the candidate threshold of each class for each target is the first threshold whose precision is higher than
+    # the target. indexing is done by purpose - the ith precision corresponds with threshold i-1
+    candidates = np.full((len(target_precisions), len(labels)), np.nan)
+    for class_index, class_ in enumerate(labels):
+        thresholds = class_to_arrs[class_]['thresholds']
+        precisions = class_to_arrs[class_]['precisions'][:-1]
+        indices = get_first_indices_above_precisions(precisions, thresholds != 0, target_precisions)
+        found = indices < len(thresholds)
+        candidates[found, class_index] = thresholds[indices[found]]
+
+    # the precision of every class at every candidate threshold
+    unique_candidates = np.unique(candidates[~np.isnan(candidates)])
+    precisions_at_candidates = np.array([get_precisions_at_thresholds(class_to_arrs[class_], unique_candidates)
+                                         for class_ in labels]).reshape(len(labels), len(unique_candidates))
+    min_precisions_at_candidates = precisions_at_candidates.min(axis=0)
+
     threshold = None
     threshold_precision = None
-    while not unified_threshold_found:
-        threshold_per_class = {}
-        precision_per_class = {}
-        for class_ in labels:
-            # indexing is done by purpose - the ith precision corresponds with threshold i-1. Last precision is 1
-            for i, precision in enumerate(class_to_arrs[class_]['precisions'][:-1]):
-                if class_to_arrs[class_]['thresholds'][i] == 0:
-                    continue
-                if precision > target_unified_precision:
-                    threshold_per_class[class_] = class_to_arrs[class_]['thresholds'][i]
-                    precision_per_class[class_] = precision
-                    break
-        if len(threshold_per_class) == len(labels):
-            threshold_candidates = sorted(list(threshold_per_class.values()))
-            for threshold in threshold_candidates:
-                legal_threshold_for_all_classes = True
-                threshold_precision = sys.maxint
-                for class_ in labels:
-                    i = np.argmax(class_to_arrs[class_]['thresholds'] >= threshold)
-                    threshold_precision_for_class = class_to_arrs[class_]['precisions'][i]
-                    threshold_precision = min(threshold_precision, threshold_precision_for_class)
-                    if threshold_precision_for_class >= target_unified_precision:
-                        legal_threshold_for_all_classes = True
-                    else:
-                        legal_threshold_for_all_classes = False
-                        break
-                if legal_threshold_for_all_classes:
-                    unified_threshold_found = True
-                    break
-        elif target_unified_precision < 0:
-            break
-        target_unified_precision -= 0.01
-    return threshold, threshold_precision, target_unified_precision
+    for target_index, target_unified_precision in enumerate(target_precisions):
+        target_candidates = candidates[target_index]
+        if np.isnan(target_candidates).any():
+            if target_unified_precision < 0:
+                return threshold, threshold_precision, target_unified_precision
+            continue
+        candidate_indices = np.searchsorted(unique_candidates, np.sort(target_candidates))
+        legal_candidates = min_precisions_at_candidates[candidate_indices] >= target_unified_precision
+        if legal_candidates.any():
+            candidate_index = candidate_indices[np.argmax(legal_candidates)]
+            return unique_candidates[candidate_index], min_precisions_at_candidates[candidate_index], \
+                target_unified_precision - 0.01
+        # no candidate meets the target - keep the last candidate and the precision of the first class which
+        # failed it, as the result in case no threshold is found
+        candidate_index = candidate_indices[-1]
+        class_precisions = precisions_at_candidates[:, candidate_index]
+        threshold = unique_candidates[candidate_index]
+        threshold_precision = class_precisions[np.argmax(class_precisions < target_unified_precision)]
+    return threshold, threshold_precision, target_precisions[-1] - 0.01
 
 
 def calculate_per_class_report_entry(class_to_arrs, labels, y_pred_per_class, y_true_per_class):
@@ -257,15 +284,15 @@ def calculate_per_class_report_entry(class_to_arrs, labels, y_pred_per_class, y_
     class_to_thresholds = {}
     for class_ in labels:
         class_to_thresholds[class_] = set([0.001])  # using no threshold
-        for target_precision in np.arange(0.95, 0.5, -0.05):
-            # indexing is done by purpose - the ith precision corresponds with threshold i-1. Last precision is 1
-            for i, precision in enumerate(class_to_arrs[class_]['precisions'][:-1]):
-                if class_to_arrs[class_]['thresholds'][i] == 0:
-                    continue
-                if precision > target_precision and class_to_arrs[class_]['recalls'][i] > 0:
-                    threshold = class_to_arrs[class_]['thresholds'][i]
-                    class_to_thresholds[class_].add(threshold)
-                    break
+        thresholds = class_to_arrs[class_]['thresholds']
+        # indexing is done by purpose - the ith precision corresponds with threshold i-1. Last precision is 1
+        valid_indices_mask = (thresholds != 0) & (class_to_arrs[class_]['recalls'][:-1] > 0)
+        target_precisions = np.arange(0.95, 0.5, -0.05)
+        indices = get_first_indices_above_precisions(class_to_arrs[class_]['precisions'][:-1], valid_indices_mask,
+                                                     target_precisions)
+        for i in indices:
+            if i < len(thresholds):
+                class_to_thresholds[class_].add(thresholds[i])
             if len(class_to_thresholds[class_]) >= 4:
                 break
     per_class_context = {}
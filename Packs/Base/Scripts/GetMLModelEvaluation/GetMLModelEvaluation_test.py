@@ -1,6 +1,9 @@
 import json
 
-from GetMLModelEvaluation import find_threshold
+import numpy as np
+from sklearn.metrics import precision_recall_curve
+
+from GetMLModelEvaluation import find_threshold, find_best_threshold_for_target_precision
 
 y_true = []
 y_pred = []
@@ -138,3 +141,39 @@ def test_all_wrong_predictions_2(mocker):
                                 customer_target_precision=0,
                                 target_recall=0)
     assert entry['Contents']['threshold'] >= 0.5
+
+
+def find_best_threshold_by_scan(class_to_arrs, customer_target_precision, labels):
+    # scans the precision-recall curves for each target precision, as the search did before it was vectorized
+    target_unified_precision = round(customer_target_precision, 2)
+    while True:
+        threshold_per_class = {}
+        for class_ in labels:
+            for i, precision in enumerate(class_to_arrs[class_]['precisions'][:-1]):
+                if class_to_arrs[class_]['thresholds'][i] != 0 and precision > target_unified_precision:
+                    threshold_per_class[class_] = class_to_arrs[class_]['thresholds'][i]
+                    break
+        if len(threshold_per_class) == len(labels):
+            for threshold in sorted(threshold_per_class.values()):
+                precisions = [class_to_arrs[class_]['precisions'][np.argmax(class_to_arrs[class_]['thresholds']
+                                                                            >= threshold)] for class_ in labels]
+                if min(precisions) >= target_unified_precision:
+                    return threshold, min(precisions)
+        target_unified_precision -= 0.01
+
+
+def test_find_best_threshold_for_target_precision_many_classes():
+    rng = np.random.RandomState(0)
+    labels = ['class{}'.format(i) for i in range(5)]
+    y_true = rng.randint(0, len(labels), 2000)
+    scores = rng.rand(2000, len(labels)) + 0.2 * np.eye(len(labels))[y_true]
+    scores /= scores.sum(axis=1, keepdims=True)
+    y_pred = scores.argmax(axis=1)
+    class_to_arrs = {}
+    for i, class_ in enumerate(labels):
+        precisions, recalls, thresholds = precision_recall_curve(y_true == i, np.where(y_pred == i, scores.max(axis=1), 0))
+        class_to_arrs[class_] = {'precisions': precisions, 'recalls': recalls, 'thresholds': thresholds}
+    for target_precision in [0, 0.3, 0.5, 0.7, 0.9]:
+        threshold, threshold_precision, _ = find_best_threshold_for_target_precision(class_to_arrs, target_precision,
+                                                                                     labels)
+        assert (threshold, threshold_precision) == find_best_threshold_by_scan(class_to_arrs, target_precision, labels)
@@ -184,53 +184,122 @@ def incident_to_record(incident, time_field):
             'time': time}
 
 
+def get_words_set(text, separator=' '):
+    return set([x for x in map(lambda x: x.strip(), text.replace("\\n", separator).split(separator)) if x])
+
+
 def is_text_equal_by_x_different_words(text1, text2, number_of_different_words, separator=' '):
     if not isinstance(text1, basestring):
         text1 = str(text1)
-    if not isinstance(text2, basestring):
-        text2 = str(text2)
+    return get_text_matcher(text1, number_of_different_words, separator)(text2)
+
+
+def get_text_matcher(text1, number_of_different_words, separator=' '):
+    """
+    Prepares the text of the incident once - lowered and split to words - and returns a function which compares it
+    with the text of another incident, like is_text_equal_by_x_different_words.
+    """
     text1 = text1.lower()
-    text2 = text2.lower()
     if number_of_different_words == EXACT_MATCH:
-        return text1 == text2
+        return lambda text2: text1 == get_lower_text(text2)
     elif number_of_different_words == CONTAINS:
-        return text1.find(text2) >= 0 or text2.find(text1) >= 0
+        def contains(text2):
+            text2 = get_lower_text(text2)
+            return text1.find(text2) >= 0 or text2.find(text1) >= 0
+        return contains
     else:
-        words_set1 = set([x for x in map(lambda x: x.strip(), text1.replace("\\n", separator).split(separator)) if x])
-        words_set2 = set([x for x in map(lambda x: x.strip(), text2.replace("\\n", separator).split(separator)) if x])
-        return len(words_set1.difference(words_set2)) <= number_of_different_words and len(
-            words_set2.difference(words_set1)) <= number_of_different_words
-
-
-def verify_map_equals(values_map1, values_map2, equality_map):
-    if not equality_map or len(equality_map) == 0:
-        return True
-
-    if not values_map1 or len(values_map1) == 0 or not values_map2 or len(values_map2) == 0:
-        return False
-
-    for key in equality_map:
-        if key not in values_map1 or key not in values_map2:
-            return False
-
-        value1 = values_map1[key]
-        value2 = values_map2[key]
+        words_set1 = get_words_set(text1, separator)
+
+        def is_different_by_x_words(text2):
+            words_set2 = get_words_set(get_lower_text(text2), separator)
+            return len(words_set1.difference(words_set2)) <= number_of_different_words and len(
+                words_set2.difference(words_set1)) <= number_of_different_words
+        return is_different_by_x_words
+
+
+def get_lower_text(text):
+    if not isinstance(text, basestring):
+        text = str(text)
+    return text.lower()
+
+
+def get_map_matcher(values_map1, equality_map):
+    """
+    Prepares the values of the incident once, and returns a function which compares them with the values of another
+    incident like verify_map_equals. The function returns the result, and the key which decided it - None if all the
+    keys were compared, or if the values of the other incident are empty.
+    """
+    text_matchers = {}
+    if values_map1:
+        for key in equality_map:
+            if isinstance(values_map1.get(key), basestring):
+                text_matchers[key] = get_text_matcher(values_map1[key], equality_map[key])
+
+    def match(values_map2):
+        if not equality_map or len(equality_map) == 0:
+            return True, None
+
+        if not values_map1 or len(values_map1) == 0:
+            return False, None
+
+        if not values_map2 or len(values_map2) == 0:
+            return False, None
+
+        for key in equality_map:
+            if key not in values_map1 or key not in values_map2:
+                return False, key
+
+            value1 = values_map1[key]
+            value2 = values_map2[key]
+
+            if isinstance(value1, basestring) and isinstance(value2, basestring):
+                if not text_matchers[key](value2):
+                    return False, key
+
+            elif isinstance(value1, list) and isinstance(value2, list):
+                try:
+                    return set(value1) == set(value2), key
+                except Exception:
+                    return value1 == value2, key
+            else:
 
-        if isinstance(value1, basestring) and isinstance(value2, basestring):
-            is_values_equals = is_text_equal_by_x_different_words(values_map1[key], values_map2[key], equality_map[key])
+                return value1 == value2, key
+        return True, None
+    return match
 
-            if not is_values_equals:
-                return False
 
-        elif isinstance(value1, list) and isinstance(value2, list):
-            try:
-                return set(value1) == set(value2)
-            except Exception:
-                return value1 == value2
-        else:
-
-            return value1 == value2
-    return True
+def verify_map_equals(values_map1, values_map2, equality_map):
+    return get_map_matcher(values_map1, equality_map)(values_map2)[0]
+
+
+def filter_by_context(candidates, original_context_map, similar_context_map):
+    """
+    Keeps the candidates whose context is similar to the original context. The context keys of a candidate are
+    compared one by one as they are queried, so once a key which was already queried fails the comparison, the
+    remaining keys are not queried.
+    """
+    context_matcher = get_map_matcher(original_context_map, similar_context_map)
+    context_keys = list(similar_context_map.keys())
+    filtered_candidates = []
+    for c in candidates:
+        other_incident_context = get_context(c['id'])
+
+        if other_incident_context:
+            other_incident_context_map = {}
+
+            for i, key in enumerate(context_keys):
+                response = demisto.dt(other_incident_context, key)
+                if response:
+                    other_incident_context_map[key] = response
+                    is_match, deciding_key = context_matcher(other_incident_context_map)
+                    if is_match:
+                        filtered_candidates.append(c)
+                    elif deciding_key is not None and context_keys.index(deciding_key) <= i:
+                        break
+                elif not context_matcher(other_incident_context_map)[0]:
+                    # the comparison cannot pass this missing key, so it is already decided by the queried keys
+                    break
+    return filtered_candidates
 
 
 def did_not_found_duplicates():
@@ -326,37 +395,21 @@ def main():
 
     # filter by labels
     if len(incident_similar_labels or {}) > 0:
+        labels_matcher = get_map_matcher(incident_similar_labels, SIMILAR_LABELS_MAP)
         duplicate_incidents = [c for c in duplicate_incidents if
-                               verify_map_equals(incident_similar_labels,
-                                                 get_incident_labels_map(c.get('labels', [])),
-                                                 SIMILAR_LABELS_MAP)
-
+                               labels_matcher(get_incident_labels_map(c.get('labels', [])))[0]
                                ]
 
     # filter by incident similar fields
     if len(similar_incident_fields or {}) > 0:
+        fields_matcher = get_map_matcher(similar_incident_fields, SIMILAR_INCIDENTS_FIELDS_MAP)
         duplicate_incidents = [c for c in duplicate_incidents
-                               if verify_map_equals(similar_incident_fields,
-                                                    get_map_from_nested_dict(c,
-                                                                             SIMILAR_INCIDENTS_FIELDS_MAP.keys(),
-                                                                             raise_error=False),
-                                                    SIMILAR_INCIDENTS_FIELDS_MAP)
+                               if fields_matcher(get_map_from_nested_dict(c,
+                                                                          SIMILAR_INCIDENTS_FIELDS_MAP.keys(),
+                                                                          raise_error=False))[0]
                                ]
-    filter_by_context = []
     if original_context_map:
-        for c in duplicate_incidents:
-            other_incident_context = get_context(c['id'])
-
-            if other_incident_context:
-                other_incident_context_map = {}
-
-                for key in SIMILAR_CONTEXT_MAP.keys():
-                    response = demisto.dt(other_incident_context, key)
-                    if response:
-                        other_incident_context_map[key] = response
-                        if verify_map_equals(original_context_map, other_incident_context_map, SIMILAR_CONTEXT_MAP):
-                            filter_by_context.append(c)
-        duplicate_incidents = filter_by_context
+        duplicate_incidents = filter_by_context(duplicate_incidents, original_context_map, SIMILAR_CONTEXT_MAP)
 
     # update context
     if len(duplicate_incidents or []) > 0:
@@ -1,7 +1,9 @@
+import collections
+
 import pytest
 
 from CommonServerPython import *
-from FindSimilarIncidentsV2 import main
+from FindSimilarIncidentsV2 import main, filter_by_context
 
 default_args = {
     'hoursBack': 5,
@@ -318,6 +320,32 @@ def test_similar_context_missing_key(mocker):
         main()
 
 
+def test_filter_by_context_skips_decided_keys(mocker):
+    """
+    Given
+        - Candidates whose first context key is missing or different from the original incident
+    When
+        - Filtering the candidates by 3 context keys
+    Then
+        - Ensure only the matching candidate is kept
+        - Ensure the other context keys of the non-matching candidates are not queried
+    """
+    contexts = {
+        1: {'first': 'value', 'second': 'value', 'third': 'value'},
+        2: {'first': 'other', 'second': 'value', 'third': 'value'},
+        3: {'second': 'value', 'third': 'value'},
+    }
+    mocker.patch.object(demisto, 'executeCommand', side_effect=lambda command, args: [
+        {'Contents': {'context': contexts[args['id']]}}])
+    mocker.patch.object(demisto, 'dt', side_effect=lambda context, key: context.get(key))
+    similar_context_map = collections.OrderedDict([('first', 0), ('second', 0), ('third', 0)])
+    original_context_map = {'first': 'value', 'second': 'value', 'third': 'value'}
+
+    candidates = filter_by_context([{'id': 1}, {'id': 2}, {'id': 3}], original_context_map, similar_context_map)
+    assert candidates == [{'id': 1}]
+    assert demisto.dt.call_count == 5
+
+
 def dt_res(context, keys_to_search):
 
     keys_list = keys_to_search.split('.')
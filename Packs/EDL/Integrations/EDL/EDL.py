@@ -7,11 +7,13 @@ import re
 from copy import deepcopy
 from base64 import b64decode
 from multiprocessing import Process
+import gevent
+from gevent.event import AsyncResult
 from gevent.pywsgi import WSGIServer
 from tempfile import NamedTemporaryFile
-from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
-from typing import Callable, List, Any, Dict, cast, Tuple
+from flask import Flask, Response, request, stream_with_context
+from netaddr import IPAddress
+from typing import Callable, List, Any, Dict, cast, Tuple, Generator, Iterator
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 
 
@@ -27,6 +29,11 @@ PAGE_SIZE: int = 200
 DEMISTO_LOGGER: Handler = Handler()
 APP: Flask = Flask('demisto-edl')
 EDL_VALUES_KEY: str = 'dmst_edl_values'
+EDL_OUTPUTS_CACHE_NAME: str = 'EDL.outputs'
+EDL_OUTPUTS_CACHE_SIZE: int = 1
+EDL_REFRESH_INTERVAL: int = 10  # seconds between the checks for an expired EDL
+# the EDLs which are being built, by their arguments, so each EDL is built once at a time
+EDL_REFRESHES: Dict[tuple, AsyncResult] = {}
 EDL_LIMIT_ERR_MSG: str = 'Please provide a valid integer for EDL Size'
 EDL_MISSING_REFRESH_ERR_MSG: str = 'Refresh Rate must be "number date_range_unit", examples: (2 hours, 4 minutes, ' \
                                    '6 months, 1 day, etc.)'
@@ -179,138 +186,292 @@ def find_indicators_to_limit_loop(indicator_query: str, limit: int, total_fetche
     iocs: List[dict] = []
     if not last_found_len:
         last_found_len = total_fetched
-    while last_found_len == PAGE_SIZE and limit and total_fetched < limit:
-        formatted_iocs = []
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs', [])
-        if panos_compatible or url_port_stripping:
-            for ioc in fetched_iocs:
-                ioc_value = ioc.get('value', '')
-                if url_port_stripping:
-                    ioc_value = _PORT_RE.sub(_URL_WITHOUT_PORT, ioc_value)
-                if panos_compatible:
-                    # protocol stripping
-                    ioc_value = _PROTOCOL_RE.sub('', ioc_value)
-                    # mix of text and wildcard in domain field handling
-                    ioc_value = _INVALID_TOKEN_RE.sub('*', ioc_value)
-                    # for PAN-OS *.domain.com does not match domain.com
-                    # we should provide both
-                    # this could generate more than num entries according to PAGE_SIZE
-                    if ioc_value.startswith('*.'):
-                        ioc_object_copy = deepcopy(ioc)
-                        ioc_object_copy['value'] = ioc_value.lstrip('*.')
-                        formatted_iocs.append(ioc_object_copy)
-                ioc['value'] = ioc_value
-                formatted_iocs.append(ioc)
-            iocs.extend(formatted_iocs)
-        else:
-            iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
+    if last_found_len == PAGE_SIZE and limit and total_fetched < limit:
+        searcher = IndicatorsSearcher(query=indicator_query, size=PAGE_SIZE, offset=next_page * PAGE_SIZE)
+        for fetched_iocs in searcher:
+            if panos_compatible or url_port_stripping:
+                for ioc in fetched_iocs:
+                    iocs.extend(format_indicator(ioc, panos_compatible, url_port_stripping))
+            else:
+                iocs.extend(fetched_iocs)
+            total_fetched += len(fetched_iocs)
+            if total_fetched >= limit:
+                break
+        next_page = searcher.page
     return iocs, next_page
 
 
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
+def ips_to_intervals(ips: list):
+    """Merges IPs to intervals of consecutive IPs, in a single pass over their sorted integer values.
 
     Args:
-        ip_range_groups (list): a list of lists containing connected IPs
+        ips (list): a list of IPs of the same version.
 
     Returns:
-        list. a list of CIDRs.
+        list. a sorted list of [first, last] integer values of consecutive IPs.
     """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
-            continue
-
+    intervals = []  # type:List
+    for ip in sorted({int(ip) for ip in ips}):
+        if intervals and ip == intervals[-1][1] + 1:
+            intervals[-1][1] = ip
         else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
-
-    return ip_ranges
+            intervals.append([ip, ip])
+    return intervals
 
 
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges.
+def interval_to_cidrs(first: int, last: int, max_prefix_len: int):
+    """Splits an interval of IPs to the minimal list of CIDRs which covers exactly its IPs.
 
     Args:
-        ip_range_groups (list): a list of lists containing connected IPs
+        first (int): the integer value of the first IP in the interval.
+        last (int): the integer value of the last IP in the interval.
+        max_prefix_len (int): the number of bits in an IP of the interval version.
 
     Returns:
-        list. a list of Ranges.
+        list. a list of (network, prefix length) tuples.
     """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
-
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
-
-    return ip_ranges
+    cidrs = []  # type:List
+    while first <= last:
+        # the largest block which starts at the first IP and does not pass the last IP
+        alignment_bits = (first & -first).bit_length() - 1 if first else max_prefix_len
+        block_bits = min(alignment_bits, (last - first + 1).bit_length() - 1)
+        cidrs.append((first, max_prefix_len - block_bits))
+        first += 1 << block_bits
+    return cidrs
 
 
 def ips_to_ranges(ips: list, collapse_ips):
     """Collapse IPs to Ranges or CIDRs.
 
     Args:
-        ips (list): a list of IP strings.
+        ips (list): a list of IPs of the same version.
         collapse_ips (str): Whether to collapse to Ranges or CIDRs.
 
     Returns:
         list. a list to Ranges or CIDRs.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
+    if not ips:
+        return []
 
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
+    version = ips[0].version
+    max_prefix_len = 32 if version == 4 else 128
+    ip_ranges = []  # type:List
+    for first, last in ips_to_intervals(ips):
+        if collapse_ips == COLLAPSE_TO_RANGES:
+            if first == last:
+                ip_ranges.append(str(IPAddress(first, version)))
+            else:
+                ip_ranges.append(f'{IPAddress(first, version)}-{IPAddress(last, version)}')
 
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
+        else:
+            for network, prefix_len in interval_to_cidrs(first, last, max_prefix_len):
+                # single IPs are listed without a prefix length
+                if prefix_len == max_prefix_len:
+                    ip_ranges.append(str(IPAddress(network, version)))
+                else:
+                    ip_ranges.append(f'{IPAddress(network, version)}/{prefix_len}')
 
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
+    return ip_ranges
 
-            if not appended:
-                ips_range_groups.append([ip])
 
-    if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
+def format_indicator(ioc: dict, panos_compatible: bool, url_port_stripping: bool) -> List[dict]:
+    """
+    Formats an indicator for the EDL
+
+    Parameters:
+        ioc (dict): The indicator to format
+        panos_compatible (bool): Whether to make the indicators PANOS compatible or not
+        url_port_stripping (bool): Whether to strip the port from URL indicators (if a port is present) or not
+
+    Returns:
+        list: The formatted indicator, preceded by a copy of it without the wildcard if it starts with one
+    """
+    formatted_iocs = []
+    ioc_value = ioc.get('value', '')
+    if url_port_stripping:
+        ioc_value = _PORT_RE.sub(_URL_WITHOUT_PORT, ioc_value)
+    if panos_compatible:
+        # protocol stripping
+        ioc_value = _PROTOCOL_RE.sub('', ioc_value)
+        # mix of text and wildcard in domain field handling
+        ioc_value = _INVALID_TOKEN_RE.sub('*', ioc_value)
+        # for PAN-OS *.domain.com does not match domain.com
+        # we should provide both
+        # this could generate more than num entries according to PAGE_SIZE
+        if ioc_value.startswith('*.'):
+            ioc_object_copy = deepcopy(ioc)
+            ioc_object_copy['value'] = ioc_value.lstrip('*.')
+            formatted_iocs.append(ioc_object_copy)
+    ioc['value'] = ioc_value
+    formatted_iocs.append(ioc)
+    return formatted_iocs
+
+
+def iter_indicators(indicator_query: str, offset: int = 0) -> Iterator[dict]:
+    """
+    Yields the indicators of the query from the given offset, fetching them with demisto.searchIndicators page by page,
+    so only a single page is held in memory
+
+    Parameters:
+        indicator_query (str): Query that determines which indicators to include in
+            the EDL (Cortex XSOAR indicator query syntax)
+        offset (int): The starting index from which to fetch indicators
+
+    Returns:
+        Iterator: The indicators
+    """
+    for fetched_iocs in IndicatorsSearcher(query=indicator_query, size=PAGE_SIZE, offset=offset):
+        yield from fetched_iocs
+
+
+def stream_edl_values(indicator_query: str, limit: int, collapse_ips: str = DONT_COLLAPSE,
+                      panos_compatible: bool = True, url_port_stripping: bool = False) -> Generator[str, None, None]:
+    """
+    Streams the EDL values, formatting the indicators page by page. Only the IPs to collapse are kept until the end of
+    the EDL, as they are collapsed after all the indicators are fetched, and the limit counts them before collapsing.
+
+    Parameters:
+        indicator_query (str): Query that determines which indicators to include in
+            the EDL (Cortex XSOAR indicator query syntax)
+        limit (int): The maximum number of entries in the EDL
+        collapse_ips (str): Whether to collapse IPs to Ranges or CIDRs or not at all
+        panos_compatible (bool): Whether to make the indicators PANOS compatible or not
+        url_port_stripping (bool): Whether to strip the port from URL indicators (if a port is present) or not
+
+    Returns:
+        Generator: The chunks of the EDL
+    """
+    chunk_prefix = ''
+    values: List[str] = []
+    ipv4_indicators: List[IPAddress] = []
+    ipv6_indicators: List[IPAddress] = []
+    entries_count = 0
+    indicators = iter_indicators(indicator_query)
+    while entries_count < limit:
+        ioc = next(indicators, None)
+        if ioc is None:
+            break
+
+        formatted_iocs = format_indicator(ioc, panos_compatible, url_port_stripping) \
+            if panos_compatible or url_port_stripping else [ioc]
+        for formatted_ioc in formatted_iocs:
+            value = formatted_ioc.get('value')
+            indicator_type = formatted_ioc.get('indicator_type')
+            if not value:
+                continue
+
+            if collapse_ips != DONT_COLLAPSE and indicator_type == 'IP':
+                ipv4_indicators.append(IPAddress(value))
+
+            elif collapse_ips != DONT_COLLAPSE and indicator_type == 'IPv6':
+                ipv6_indicators.append(IPAddress(value))
+
+            else:
+                values.append(value)
+            entries_count += 1
+
+        if len(values) >= PAGE_SIZE:
+            yield chunk_prefix + '\n'.join(values)
+            chunk_prefix = '\n'
+            values = []
+
+    if ipv4_indicators:
+        values.extend(ips_to_ranges(ipv4_indicators, collapse_ips))
+
+    if ipv6_indicators:
+        values.extend(ips_to_ranges(ipv6_indicators, collapse_ips))
+
+    if values:
+        yield chunk_prefix + '\n'.join(values)
 
-    else:
-        return ip_groups_to_cidrs(ips_range_groups)
+
+def stream_edl_context(indicator_query: str, limit: int, collapse_ips: str = DONT_COLLAPSE,
+                       panos_compatible: bool = True, url_port_stripping: bool = False) -> Generator[bytes, None, None]:
+    """
+    Refreshes the EDL while streaming it. When the EDL is complete, it is cached in the process memory, and only the
+    time of the refresh is saved in the integration context. While the EDL is refreshed, other requests for it wait for
+    the refresh instead of refreshing it again.
+
+    Parameters:
+        indicator_query (str): Query that determines which indicators to include in
+            the EDL (Cortex XSOAR indicator query syntax)
+        limit (int): The maximum number of entries in the EDL
+        collapse_ips (str): Whether to collapse IPs to Ranges or CIDRs or not at all
+        panos_compatible (bool): Whether to make the indicators PANOS compatible or not
+        url_port_stripping (bool): Whether to strip the port from URL indicators (if a port is present) or not
+
+    Returns:
+        Generator: The encoded chunks of the EDL
+    """
+    edl_args = (indicator_query, limit, collapse_ips, panos_compatible, url_port_stripping)
+    refresh = EDL_REFRESHES[edl_args] = AsyncResult()
+    cached_output = None
+    try:
+        now = datetime.now()
+        chunks: List[bytes] = []
+        for values in stream_edl_values(*edl_args):
+            chunk = values.encode('utf-8')
+            chunks.append(chunk)
+            yield chunk
+
+        last_run = date_to_timestamp(now)
+        outputs_cache = get_process_cache(EDL_OUTPUTS_CACHE_NAME, EDL_OUTPUTS_CACHE_SIZE)
+        cached_output = {'last_run': last_run, 'chunks': chunks}
+        outputs_cache.set(edl_args, cached_output)
+        demisto.setIntegrationContext({'last_run': last_run})
+
+    finally:
+        # the waiting requests get None if the refresh failed or its client disconnected, and refresh the EDL
+        if EDL_REFRESHES.get(edl_args) is refresh:
+            del EDL_REFRESHES[edl_args]
+        refresh.set(cached_output)
+
+
+def refresh_edl(edl_args: tuple):
+    """
+    Refreshes the EDL in the background. The requests are served from the previous EDL until the refresh is complete,
+    and from the previous EDL if it fails.
+
+    Parameters:
+        edl_args (tuple): The arguments of the EDL, as returned from get_edl_args
+    """
+    if edl_args in EDL_REFRESHES:
+        return
+
+    try:
+        for _ in stream_edl_context(*edl_args):
+            # let the requests be served between the pages of the EDL
+            gevent.idle()
+
+    except Exception as e:
+        demisto.error(f'Failed to refresh the EDL: {e}')
+
+
+def is_edl_expired(cached_output: dict, cache_refresh_rate: str) -> bool:
+    cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
+    return cached_output['last_run'] <= cache_time
+
+
+def refresh_edl_loop(params: dict):
+    """
+    Builds the EDL when the server starts, and refreshes it in the background when it expires, so the requests do not
+    wait for the refreshes
+
+    Parameters:
+        params (dict): The integration parameters
+    """
+    try:
+        edl_args = get_edl_args(params)
+    except Exception as e:
+        demisto.error(f'Failed to build the EDL: {e}')
+        return
+
+    outputs_cache = get_process_cache(EDL_OUTPUTS_CACHE_NAME, EDL_OUTPUTS_CACHE_SIZE)
+    while True:
+        cached_output = outputs_cache.get(edl_args)
+        if not cached_output or is_edl_expired(cached_output, params.get('cache_refresh_rate')):
+            refresh_edl(edl_args)
+        gevent.sleep(EDL_REFRESH_INTERVAL)
 
 
 def create_values_for_returned_dict(iocs: list, collapse_ips: str = DONT_COLLAPSE) -> Tuple[dict, int]:
@@ -431,20 +592,42 @@ def route_edl_values() -> Response:
             err_msg: str = 'Basic authentication failed. Make sure you are using the right credentials.'
             demisto.debug(err_msg)
             return Response(err_msg, status=401)
-    panos_compatible: bool = params.get('panos_compatible', False)
-    url_port_stripping: bool = params.get('url_port_stripping', False)
-
-    values = get_edl_ioc_values(
-        on_demand=params.get('on_demand'),
-        limit=try_parse_integer(params.get('edl_size'), EDL_LIMIT_ERR_MSG),
-        last_run=demisto.getIntegrationContext().get('last_run'),
-        indicator_query=params.get('indicators_query'),
-        cache_refresh_rate=params.get('cache_refresh_rate'),
-        panos_compatible=panos_compatible,
-        url_port_stripping=url_port_stripping,
-        collapse_ips=params.get('collapse_ips')
-    )
-    return Response(values, status=200, mimetype='text/plain')
+    if params.get('on_demand'):
+        # the EDL is updated by the edl-update command, which saves its values in the integration context
+        values = get_edl_ioc_values(on_demand=True, limit=try_parse_integer(params.get('edl_size'), EDL_LIMIT_ERR_MSG))
+        return Response(values, status=200, mimetype='text/plain')
+
+    edl_args = get_edl_args(params)
+    outputs_cache = get_process_cache(EDL_OUTPUTS_CACHE_NAME, EDL_OUTPUTS_CACHE_SIZE)
+    cached_output = outputs_cache.get(edl_args)
+    if not cached_output:
+        refresh = EDL_REFRESHES.get(edl_args)
+        if refresh is not None:
+            cached_output = refresh.get()
+
+        if not cached_output:
+            # the EDL is streamed while it is refreshed, and it is cached when it is complete
+            return Response(stream_with_context(stream_edl_context(*edl_args)), status=200, mimetype='text/plain')
+
+    elif is_edl_expired(cached_output, params.get('cache_refresh_rate')):
+        # the expired EDL is served while it is refreshed in the background
+        gevent.spawn(refresh_edl, edl_args)
+
+    return Response(cached_output['chunks'], status=200, mimetype='text/plain')
+
+
+def get_edl_args(params: dict) -> tuple:
+    """
+    Gets the arguments of the EDL from the integration parameters
+
+    Parameters:
+        params (dict): The integration parameters
+
+    Returns:
+        tuple: The indicator query, the limit, collapse_ips, panos_compatible and url_port_stripping
+    """
+    return (params.get('indicators_query'), try_parse_integer(params.get('edl_size'), EDL_LIMIT_ERR_MSG),
+            params.get('collapse_ips'), params.get('panos_compatible', False), params.get('url_port_stripping', False))
 
 
 ''' COMMAND FUNCTIONS '''
@@ -518,6 +701,10 @@ def run_long_running(params, is_test=False):
             demisto.debug('Starting HTTP Server')
 
         server = WSGIServer(('0.0.0.0', port), APP, **ssl_args, log=DEMISTO_LOGGER)
+        if not is_test and not params.get('on_demand'):
+            # the EDL is refreshed in a greenlet rather than a thread, as the calls to the server must not overlap
+            gevent.spawn(refresh_edl_loop, params)
+
         if is_test:
             server_process = Process(target=server.serve_forever)
             server_process.start()
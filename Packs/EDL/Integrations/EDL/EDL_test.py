@@ -306,3 +306,124 @@ class TestHelperFunctions:
         assert "1.1.1.3" not in ip_range_list
         assert "2.2.2.2" in ip_range_list
         assert "25.24.23.22" in ip_range_list
+
+    @pytest.mark.ips_to_cidrs
+    def test_ips_to_ranges_exact_cidrs(self):
+        from EDL import ips_to_ranges, COLLAPSE_TO_CIDR
+        ip_list = [IPAddress("10.0.0.{}".format(i)) for i in range(10, 0, -1)]
+        assert ips_to_ranges(ip_list, COLLAPSE_TO_CIDR) == ["10.0.0.1", "10.0.0.2/31", "10.0.0.4/30", "10.0.0.8/31",
+                                                            "10.0.0.10"]
+
+        ipv6_list = [IPAddress("2001:db8::{}".format(i)) for i in range(5)] + [IPAddress("2001:db8::2")]
+        assert ips_to_ranges(ipv6_list, COLLAPSE_TO_CIDR) == ["2001:db8::/126", "2001:db8::4"]
+
+
+@pytest.mark.route_edl_values
+class TestRouteEDLValues:
+    PARAMS = {'indicators_query': 'type:IP', 'edl_size': '1000', 'cache_refresh_rate': '1 minute',
+              'collapse_ips': "Don't Collapse"}
+    IPS = ['1.1.{}.{}'.format(i // 256, i % 256) for i in range(300)]
+
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        import EDL as edl
+        from CommonServerPython import get_process_cache
+        get_process_cache(edl.EDL_OUTPUTS_CACHE_NAME).invalidate()
+        mocker.patch.object(edl, 'PAGE_SIZE', 200)
+
+    def search_indicators(self, query, page, size):
+        return {'iocs': [{'value': ip, 'indicator_type': 'IP'} for ip in self.IPS[page * size:(page + 1) * size]]}
+
+    def test_route_edl_values_cached(self, mocker):
+        """
+        Given
+            - An EDL which was not refreshed yet
+        When
+            - Requesting the EDL twice
+        Then
+            - Ensure the EDL is streamed once, and only the refresh time is saved in the integration context
+            - Ensure the second request is served from the cache
+        """
+        import EDL as edl
+        mocker.patch.object(demisto, 'params', return_value=self.PARAMS)
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=self.search_indicators)
+        client = edl.APP.test_client()
+
+        response = client.get('/')
+        assert response.get_data(as_text=True) == '\n'.join(self.IPS)
+        assert list(demisto.setIntegrationContext.call_args[0][0].keys()) == ['last_run']
+
+        response = client.get('/')
+        assert response.get_data(as_text=True) == '\n'.join(self.IPS)
+        assert demisto.searchIndicators.call_count == 2
+
+    def test_stream_edl_values(self, mocker):
+        """
+        Given
+            - 300 IPs and a wildcard domain
+        When
+            - Streaming an EDL of 250 entries, collapsing the IPs to ranges
+        Then
+            - Ensure the domain is listed with and without the wildcard, before the IP ranges
+            - Ensure only the IPs within the limit are collapsed
+        """
+        from EDL import stream_edl_values, COLLAPSE_TO_RANGES
+        iocs = [{'value': 'https://*.demisto.com', 'indicator_type': 'Domain'}] + \
+               [{'value': ip, 'indicator_type': 'IP'} for ip in self.IPS]
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=lambda query, page, size: {
+            'iocs': iocs[page * size:(page + 1) * size]
+        })
+        values = ''.join(stream_edl_values('', 250, COLLAPSE_TO_RANGES, panos_compatible=True))
+        assert values.split('\n') == ['demisto.com', '*.demisto.com', '1.1.0.0-1.1.0.247']
+
+    def test_expired_edl_refreshed_in_background(self, mocker):
+        """
+        Given
+            - An expired EDL
+        When
+            - Requesting the EDL
+        Then
+            - Ensure the expired EDL is served, and the EDL is refreshed in the background
+            - Ensure the refreshed EDL replaces the expired EDL
+        """
+        import EDL as edl
+        from CommonServerPython import get_process_cache
+        mocker.patch.object(demisto, 'params', return_value=self.PARAMS)
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=self.search_indicators)
+        spawn_mock = mocker.patch.object(edl.gevent, 'spawn')
+        edl_args = edl.get_edl_args(self.PARAMS)
+        outputs_cache = get_process_cache(edl.EDL_OUTPUTS_CACHE_NAME)
+        outputs_cache.set(edl_args, {'last_run': 0, 'chunks': [b'1.1.1.1']})
+
+        assert edl.APP.test_client().get('/').get_data(as_text=True) == '1.1.1.1'
+        spawn_mock.assert_called_once_with(edl.refresh_edl, edl_args)
+        assert demisto.searchIndicators.call_count == 0
+
+        edl.refresh_edl(edl_args)
+        assert b''.join(outputs_cache.get(edl_args)['chunks']).decode('utf-8') == '\n'.join(self.IPS)
+        assert not edl.EDL_REFRESHES
+
+    def test_refresh_edl_single_flight(self, mocker):
+        """
+        Given
+            - An EDL which is being refreshed
+        When
+            - Refreshing the EDL again, and requesting the EDL
+        Then
+            - Ensure the EDL is not refreshed again
+            - Ensure the request is served with the EDL of the refresh in progress
+        """
+        import EDL as edl
+        from gevent.event import AsyncResult
+        mocker.patch.object(demisto, 'params', return_value=self.PARAMS)
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=self.search_indicators)
+        edl_args = edl.get_edl_args(self.PARAMS)
+        refresh = AsyncResult()
+        refresh.set({'last_run': 0, 'chunks': [b'1.1.1.1']})
+        mocker.patch.dict(edl.EDL_REFRESHES, {edl_args: refresh})
+
+        edl.refresh_edl(edl_args)
+        assert edl.APP.test_client().get('/').get_data(as_text=True) == '1.1.1.1'
+        assert demisto.searchIndicators.call_count == 0
@@ -4,15 +4,19 @@ from CommonServerUserPython import *
 
 import re
 import json
+import zlib
+import hashlib
 import traceback
 from base64 import b64decode
 from multiprocessing import Process
+import gevent
+from gevent.event import AsyncResult
 from gevent.pywsgi import WSGIServer
 from tempfile import NamedTemporaryFile
-from flask import Flask, Response, request
-from netaddr import IPAddress, iprange_to_cidrs
+from flask import Flask, Response, request, stream_with_context
+from netaddr import IPAddress
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
-from typing import Callable, List, Any, cast, Dict, Tuple
+from typing import Callable, List, Any, cast, Dict, Tuple, Optional, Generator, Iterator
 
 
 class Handler:
@@ -28,6 +32,12 @@ DEMISTO_LOGGER: Handler = Handler()
 APP: Flask = Flask('demisto-export_iocs')
 CTX_VALUES_KEY: str = 'dmst_export_iocs_values'
 CTX_MIMETYPE_KEY: str = 'dmst_export_iocs_mimetype'
+OUTPUTS_CACHE_NAME: str = 'ExportIndicators.outputs'
+OUTPUTS_CACHE_SIZE: int = 10
+GZIP_MIN_SIZE: int = 1024  # smaller outputs are not worth compressing
+OUTPUTS_REFRESH_INTERVAL: int = 10  # seconds between the checks for expired outputs
+# the outputs which are being built, by their cache keys, so each output is built once at a time
+OUTPUTS_REFRESHES: Dict[tuple, AsyncResult] = {}
 
 FORMAT_CSV: str = 'csv'
 FORMAT_TEXT: str = 'text'
@@ -134,6 +144,51 @@ class RequestArguments:
 
         return False
 
+    def get_cache_key(self) -> tuple:
+        return (self.query, self.out_format, self.limit, self.offset, self.mwg_type, self.strip_port,
+                self.drop_invalids, self.category_default, tuple(self.category_attribute), self.collapse_ips,
+                self.csv_text)
+
+
+'''Cached Output Class'''
+
+
+class CachedOutput:
+    """
+    A rendered output of the list, which is kept in the process memory and served as is until the list is refreshed,
+    so polling the list does not load the indicators from the integration context.
+    The output is kept in the chunks it was streamed in, so it is never copied to a single string.
+    """
+    def __init__(self, chunks: List[bytes], mimetype: str, version: Any = None,
+                 request_args: Optional[RequestArguments] = None):
+        self.chunks = chunks
+        # the arguments the output is refreshed with in the background, for outputs which are not On-Demand
+        self.request_args = request_args
+        self.size = sum(len(chunk) for chunk in chunks)
+        self.mimetype = mimetype
+        # the last_run of the integration context the output was rendered from, used in On-Demand mode
+        self.version = version
+        self.last_modified = datetime.utcnow().replace(microsecond=0)
+        # the last time the output was served, None if it was not served since it was rendered
+        self.last_accessed: Optional[datetime] = None
+        output_hash = hashlib.sha1()
+        for chunk in chunks:
+            output_hash.update(chunk)
+        self.etag = output_hash.hexdigest()
+        self._gzipped_chunks: Optional[List[bytes]] = None
+
+    def get_gzipped_chunks(self) -> List[bytes]:
+        if self._gzipped_chunks is None:
+            compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)  # gzip container
+            self._gzipped_chunks = [compressor.compress(chunk) for chunk in self.chunks] + [compressor.flush()]
+        return self._gzipped_chunks
+
+    def is_expired(self, cache_refresh_rate) -> bool:
+        if not cache_refresh_rate:
+            return True
+        cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
+        return date_to_timestamp(self.last_modified) <= cache_time
+
 
 ''' HELPER FUNCTIONS '''
 
@@ -205,30 +260,126 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
         if request_args.out_format == FORMAT_CSV:
             actual_indicator_amount = actual_indicator_amount - 1
 
+    out_dict[CTX_MIMETYPE_KEY] = get_mimetype(request_args)
+
+    integration_context = get_last_update_data(request_args, date_to_timestamp(now))
+    integration_context['last_output'] = out_dict
+    integration_context['current_iocs'] = iocs
+    demisto.setIntegrationContext(integration_context)
+    return out_dict[CTX_VALUES_KEY]
+
+
+def stream_outbound_context(request_args: RequestArguments) -> Generator[bytes, None, None]:
+    """
+    Refreshes the list while streaming it. When the list is complete, it is cached in the process memory, and only
+    the arguments of the refresh are saved in the integration context, without the indicators and the output.
+    While the list is refreshed, other requests for it wait for the refresh instead of refreshing it again.
+    """
+    cache_key = request_args.get_cache_key()
+    refresh = OUTPUTS_REFRESHES[cache_key] = AsyncResult()
+    cached_output = None
+    try:
+        now = datetime.now()
+        chunks: List[bytes] = []
+        for values in stream_outbound_values(request_args):
+            chunk = values.encode('utf-8')
+            chunks.append(chunk)
+            yield chunk
+
+        if not chunks:
+            chunk = b'No Results Found For the Query'
+            chunks.append(chunk)
+            yield chunk
+
+        outputs_cache = get_process_cache(OUTPUTS_CACHE_NAME, OUTPUTS_CACHE_SIZE)
+        mimetype = get_mimetype(request_args)
+        cached_output = CachedOutput(chunks, mimetype, request_args=request_args)
+        outputs_cache.set(cache_key, cached_output)
+
+        integration_context = get_last_update_data(request_args, date_to_timestamp(now))
+        integration_context['last_output'] = {CTX_MIMETYPE_KEY: mimetype}
+        demisto.setIntegrationContext(integration_context)
+
+    finally:
+        # the waiting requests get None if the refresh failed or its client disconnected, and refresh the list
+        if OUTPUTS_REFRESHES.get(cache_key) is refresh:
+            del OUTPUTS_REFRESHES[cache_key]
+        refresh.set(cached_output)
+
+
+def refresh_output(request_args: RequestArguments):
+    """
+    Refreshes a cached output in the background. The requests are served from the previous output until the refresh
+    is complete, and from the previous output if it fails.
+    """
+    if request_args.get_cache_key() in OUTPUTS_REFRESHES:
+        return
+
+    try:
+        for _ in stream_outbound_context(request_args):
+            # let the requests be served between the pages of the list
+            gevent.idle()
+
+    except Exception as e:
+        demisto.error(f'Failed to refresh the list of the query {request_args.query}: {e}')
+
+
+def refresh_expired_outputs(default_cache_key: Optional[tuple], cache_refresh_rate: str):
+    """
+    Refreshes the expired default list, and the expired lists which were requested since their last refresh.
+    The other lists are refreshed only when they are requested again, so one-off lists are not refreshed forever.
+    """
+    outputs_cache = get_process_cache(OUTPUTS_CACHE_NAME, OUTPUTS_CACHE_SIZE)
+    for cache_key, cached_output in outputs_cache.items():
+        if not cached_output.request_args or (cache_key != default_cache_key and not cached_output.last_accessed):
+            continue
+
+        if cached_output.is_expired(cache_refresh_rate):
+            refresh_output(cached_output.request_args)
+
+
+def refresh_outputs_loop(params: dict):
+    """
+    Builds the default list when the server starts, and refreshes the expired lists in the background, so the requests
+    do not wait for the refreshes
+    """
+    default_cache_key = None
+    try:
+        with APP.test_request_context('/'):
+            default_request_args = get_request_args(params)
+        default_cache_key = default_request_args.get_cache_key()
+        refresh_output(default_request_args)
+
+    except Exception as e:
+        demisto.error(f'Failed to build the default list: {e}')
+
+    while True:
+        gevent.sleep(OUTPUTS_REFRESH_INTERVAL)
+        refresh_expired_outputs(default_cache_key, params.get('cache_refresh_rate'))
+
+
+def get_mimetype(request_args: RequestArguments) -> str:
+    """Returns the mimetype of the requested format"""
     if request_args.out_format == FORMAT_JSON:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON
+        return MIMETYPE_JSON
 
     elif request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
-        if request_args.csv_text:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
-
-        else:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_CSV
+        return MIMETYPE_TEXT if request_args.csv_text else MIMETYPE_CSV
 
     elif request_args.out_format in [FORMAT_JSON_SEQ, FORMAT_XSOAR_JSON_SEQ]:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON_SEQ
+        return MIMETYPE_JSON_SEQ
+
+    return MIMETYPE_TEXT
 
-    else:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
 
-    demisto.setIntegrationContext({
-        "last_output": out_dict,
-        'last_run': date_to_timestamp(now),
+def get_last_update_data(request_args: RequestArguments, last_run: int) -> dict:
+    """Returns the arguments of the last refresh of the list, which are kept in the integration context"""
+    return {
+        'last_run': last_run,
         'last_limit': request_args.limit,
         'last_offset': request_args.offset,
         'last_format': request_args.out_format,
         'last_query': request_args.query,
-        'current_iocs': iocs,
         'mwg_type': request_args.mwg_type,
         'drop_invalids': request_args.drop_invalids,
         'strip_port': request_args.strip_port,
@@ -236,8 +387,7 @@ def refresh_outbound_context(request_args: RequestArguments) -> str:
         'category_attribute': request_args.category_attribute,
         'collapse_ips': request_args.collapse_ips,
         'csv_text': request_args.csv_text
-    })
-    return out_dict[CTX_VALUES_KEY]
+    }
 
 
 def find_indicators_with_limit(indicator_query: str, limit: int, offset: int) -> list:
@@ -272,167 +422,267 @@ def find_indicators_with_limit_loop(indicator_query: str, limit: int, total_fetc
     iocs: List[dict] = []
     if not last_found_len:
         last_found_len = total_fetched
-    while last_found_len == PAGE_SIZE and limit and total_fetched < limit:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
+    if last_found_len == PAGE_SIZE and limit and total_fetched < limit:
+        searcher = IndicatorsSearcher(query=indicator_query, size=PAGE_SIZE, offset=next_page * PAGE_SIZE)
+        for fetched_iocs in searcher:
+            iocs.extend(fetched_iocs)
+            total_fetched += len(fetched_iocs)
+            if total_fetched >= limit:
+                break
+        next_page = searcher.page
     return iocs, next_page
 
 
-def ip_groups_to_cidrs(ip_range_groups: list):
-    """Collapse ip groups list to CIDRs
+def iter_indicators(indicator_query: str, offset: int = 0) -> Iterator[dict]:
+    """
+    Yields the indicators of the query from the given offset, fetching them with demisto.searchIndicators page by page,
+    so only a single page is held in memory
+    """
+    for fetched_iocs in IndicatorsSearcher(query=indicator_query, size=PAGE_SIZE, offset=offset):
+        yield from fetched_iocs
 
-    Args:
-        ip_range_groups (list): a list of lists containing connected IPs
 
-    Returns:
-        list. a list of CIDRs.
+def format_indicator_lines(ioc: dict, request_args: RequestArguments) -> List[str]:
     """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
+    Formats a single indicator to its lines in the output, for the formats which are formatted by indicator
+    """
+    if request_args.out_format == FORMAT_PANOSURL:
+        return panos_url_format_single_indicator(ioc, request_args.drop_invalids, request_args.strip_port)
 
-        min_ip = group[0]
-        max_ip = group[-1]
-        moved_ip = False
-        # CIDR must begin with an even LSB
-        # if the first ip does not - separate it from the rest of the range
-        if (int(str(min_ip).split('.')[-1]) % 2) != 0:
-            ip_ranges.append(str(min_ip))
-            min_ip = group[1]
-            moved_ip = True
-
-        # CIDR must end with uneven LSB
-        # if the last ip does not - separate it from the rest of the range
-        if (int(str(max_ip).split('.')[-1]) % 2) == 0:
-            ip_ranges.append(str(max_ip))
-            max_ip = group[-2]
-            moved_ip = True
-
-        # if both min and max ips were shifted and there are only 2 ips in the range
-        # we added both ips by the shift and now we move to the next  range
-        if moved_ip and len(group) == 2:
+    if request_args.out_format == FORMAT_MWG:
+        return [mwg_format_single_indicator(ioc)]
+
+    if request_args.out_format in [FORMAT_JSON, FORMAT_JSON_SEQ]:
+        return [json.dumps(json_format_single_indicator(ioc))]
+
+    if request_args.out_format in [FORMAT_XSOAR_JSON, FORMAT_XSOAR_JSON_SEQ]:
+        return [json.dumps(ioc)]
+
+    if request_args.out_format == FORMAT_XSOAR_CSV:
+        # wrap csv values with " to escape them
+        return [list_to_str(list(ioc.values()), map_func=lambda val: f'"{val}"')]
+
+    return [ioc['value']]
+
+
+def stream_outbound_values(request_args: RequestArguments) -> Generator[str, None, None]:
+    """
+    Streams the list in the requested format, formatting the indicators page by page.
+    Only the IPs to collapse and the ProxySG categories, which are formatted after all the indicators are fetched, are
+    kept until the end of the list. The limit is applied to the number of entries in the list, so the entries which are
+    dropped by the formatting are replaced by the following indicators.
+    """
+    out_format = request_args.out_format
+    collapse_ips = request_args.collapse_ips != DONT_COLLAPSE and out_format in [FORMAT_TEXT, FORMAT_CSV]
+    is_json = out_format in [FORMAT_JSON, FORMAT_XSOAR_JSON]
+    separator = ', ' if is_json else '\n'
+    chunk_prefix = '[' if is_json else ''
+
+    lines: List[str] = []
+    if out_format == FORMAT_MWG:
+        mwg_type = request_args.mwg_type[0] if isinstance(request_args.mwg_type, list) else request_args.mwg_type
+        lines.append(f'type={mwg_type}')
+
+    ipv4_indicators: List[IPAddress] = []
+    ipv6_indicators: List[IPAddress] = []
+    category_dict: Dict[str, list] = {}
+    entries_count = 0
+    is_first_indicator = True
+    indicators = iter_indicators(request_args.query, request_args.offset)
+    while entries_count < request_args.limit:
+        ioc = next(indicators, None)
+        if ioc is None:
+            break
+
+        if is_first_indicator:
+            is_first_indicator = False
+            # add csv keys as first item
+            if out_format == FORMAT_CSV:
+                lines.append('indicator')
+
+            elif out_format == FORMAT_XSOAR_CSV:
+                lines.append(list_to_str(list(ioc.keys())))
+
+        value = ioc.get('value')
+        if not value:
             continue
 
+        if out_format == FORMAT_PROXYSG:
+            if ioc.get('indicator_type') in ['URL', 'Domain', 'DomainGlob']:
+                category = ioc.get('proxysgcategory')
+                if category is None or (category not in request_args.category_attribute
+                                        and len(request_args.category_attribute) != 0):
+                    category = request_args.category_default
+
+                add_indicator_to_category(value, category, category_dict)
+                entries_count += 1
+
+        elif collapse_ips and ioc.get('indicator_type') == 'IP':
+            ipv4_indicators.append(IPAddress(value))
+            entries_count += 1
+
+        elif collapse_ips and ioc.get('indicator_type') == 'IPv6':
+            ipv6_indicators.append(IPAddress(value))
+            entries_count += 1
+
         else:
-            ip_ranges.append(str(iprange_to_cidrs(min_ip, max_ip)[0].cidr))
+            indicator_lines = format_indicator_lines(ioc, request_args)
+            lines.extend(indicator_lines)
+            entries_count += len(indicator_lines)
 
-    return ip_ranges
+        if len(lines) >= PAGE_SIZE:
+            yield chunk_prefix + separator.join(lines)
+            chunk_prefix = separator
+            lines = []
+
+    if ipv4_indicators:
+        lines.extend(ips_to_ranges(ipv4_indicators, request_args.collapse_ips))
+
+    if ipv6_indicators:
+        lines.extend(ips_to_ranges(ipv6_indicators, request_args.collapse_ips))
+
+    for category, indicator_list in category_dict.items():
+        lines.append(f'define category {category}')
+        lines.extend(indicator_list)
+        lines.append('end')
 
+    if category_dict or (out_format == FORMAT_MWG and not entries_count):
+        # the ProxySG categories end with a new line, as well as the type line of an empty McAfee Web Gateway list
+        lines.append('')
 
-def ip_groups_to_ranges(ip_range_groups: list):
-    """Collapse ip groups list to ranges
+    last_chunk = separator.join(lines)
+    if lines or chunk_prefix == '[':
+        last_chunk = chunk_prefix + last_chunk
+
+    if is_json:
+        last_chunk += ']'
+
+    if last_chunk:
+        yield last_chunk
+
+
+def ips_to_intervals(ips: list):
+    """Merges IPs to intervals of consecutive IPs, in a single pass over their sorted integer values.
 
     Args:
-        ip_range_groups (list): a list of lists containing connected IPs
+        ips (list): a list of IPs of the same version.
 
     Returns:
-        list. a list of Ranges.
+        list. a sorted list of [first, last] integer values of consecutive IPs.
     """
-    ip_ranges = []  # type:List
-    for group in ip_range_groups:
-        # handle single ips
-        if len(group) == 1:
-            ip_ranges.append(str(group[0]))
-            continue
+    intervals = []  # type:List
+    for ip in sorted({int(ip) for ip in ips}):
+        if intervals and ip == intervals[-1][1] + 1:
+            intervals[-1][1] = ip
+        else:
+            intervals.append([ip, ip])
+    return intervals
 
-        min_ip = group[0]
-        max_ip = group[-1]
-        ip_ranges.append(str(min_ip) + "-" + str(max_ip))
 
-    return ip_ranges
+def interval_to_cidrs(first: int, last: int, max_prefix_len: int):
+    """Splits an interval of IPs to the minimal list of CIDRs which covers exactly its IPs.
+
+    Args:
+        first (int): the integer value of the first IP in the interval.
+        last (int): the integer value of the last IP in the interval.
+        max_prefix_len (int): the number of bits in an IP of the interval version.
+
+    Returns:
+        list. a list of (network, prefix length) tuples.
+    """
+    cidrs = []  # type:List
+    while first <= last:
+        # the largest block which starts at the first IP and does not pass the last IP
+        alignment_bits = (first & -first).bit_length() - 1 if first else max_prefix_len
+        block_bits = min(alignment_bits, (last - first + 1).bit_length() - 1)
+        cidrs.append((first, max_prefix_len - block_bits))
+        first += 1 << block_bits
+    return cidrs
 
 
 def ips_to_ranges(ips: list, collapse_ips):
     """Collapse IPs to Ranges or CIDRs.
 
     Args:
-        ips (list): a list of IP strings.
+        ips (list): a list of IPs of the same version.
         collapse_ips (str): Whether to collapse to Ranges or CIDRs.
 
     Returns:
         list. a list to Ranges or CIDRs.
     """
-    ips_range_groups = []  # type:List
-    ips = sorted(ips)
-    if len(ips) > 0:
-        ips_range_groups.append([ips[0]])
+    if not ips:
+        return []
 
-    if len(ips) > 1:
-        for ip in ips[1:]:
-            appended = False
+    version = ips[0].version
+    max_prefix_len = 32 if version == 4 else 128
+    ip_ranges = []  # type:List
+    for first, last in ips_to_intervals(ips):
+        if collapse_ips == COLLAPSE_TO_RANGES:
+            if first == last:
+                ip_ranges.append(str(IPAddress(first, version)))
+            else:
+                ip_ranges.append(f'{IPAddress(first, version)}-{IPAddress(last, version)}')
 
-            if len(ips_range_groups) == 0:
-                ips_range_groups.append([ip])
-                continue
+        else:
+            for network, prefix_len in interval_to_cidrs(first, last, max_prefix_len):
+                # single IPs are listed without a prefix length
+                if prefix_len == max_prefix_len:
+                    ip_ranges.append(str(IPAddress(network, version)))
+                else:
+                    ip_ranges.append(f'{IPAddress(network, version)}/{prefix_len}')
+
+    return ip_ranges
 
-            for group in ips_range_groups:
-                if IPAddress(int(ip) + 1) in group or IPAddress(int(ip) - 1) in group:
-                    group.append(ip)
-                    sorted(group)
-                    appended = True
 
-            if not appended:
-                ips_range_groups.append([ip])
+def panos_url_format_single_indicator(indicator_data: dict, drop_invalids: bool, strip_port: bool) -> List[str]:
+    # only format URLs and Domains
+    indicator = indicator_data.get('value')
+    if indicator_data.get('indicator_type') not in ['URL', 'Domain', 'DomainGlob']:
+        return [indicator]
 
-    for group in ips_range_groups:
-        sorted(group)
+    indicator = indicator.lower()
 
-    if collapse_ips == COLLAPSE_TO_RANGES:
-        return ip_groups_to_ranges(ips_range_groups)
+    # remove initial protocol - http/https/ftp/ftps etc
+    indicator = _PROTOCOL_REMOVAL.sub('', indicator)
 
-    else:
-        return ip_groups_to_cidrs(ips_range_groups)
+    indicator_with_port = indicator
+    # remove port from indicator - from demisto.com:369/rest/of/path -> demisto.com/rest/of/path
+    indicator = _PORT_REMOVAL.sub(r'\g<1>', indicator)
+    # check if removing the port changed something about the indicator
+    if indicator != indicator_with_port and not strip_port:
+        # if port was in the indicator and strip_port param not set - ignore the indicator
+        return []
+
+    with_invalid_tokens_indicator = indicator
+    # remove invalid tokens from indicator
+    indicator = _INVALID_TOKEN_REMOVAL.sub('*', indicator)
+
+    # check if the indicator held invalid tokens
+    if with_invalid_tokens_indicator != indicator:
+        # invalid tokens in indicator- if drop_invalids is set - ignore the indicator
+        if drop_invalids:
+            return []
+
+        # check if after removing the tokens the indicator is too broad if so - ignore
+        # example of too broad terms: "*.paloalto", "*.*.paloalto", "*.paloalto:60"
+        hostname = indicator
+        if '/' in hostname:
+            hostname, _ = hostname.split('/', 1)
+
+        if _BROAD_PATTERN.match(hostname) is not None:
+            return []
+
+    # for PAN-OS "*.domain.com" does not match "domain.com" - we should provide both
+    if indicator.startswith('*.'):
+        return [indicator[2:], indicator]
+
+    return [indicator]
 
 
 def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
     formatted_indicators = []  # type:List
     for indicator_data in iocs:
-        # only format URLs and Domains
-        indicator = indicator_data.get('value')
-        if indicator_data.get('indicator_type') in ['URL', 'Domain', 'DomainGlob']:
-            indicator = indicator.lower()
-
-            # remove initial protocol - http/https/ftp/ftps etc
-            indicator = _PROTOCOL_REMOVAL.sub('', indicator)
-
-            indicator_with_port = indicator
-            # remove port from indicator - from demisto.com:369/rest/of/path -> demisto.com/rest/of/path
-            indicator = _PORT_REMOVAL.sub(r'\g<1>', indicator)
-            # check if removing the port changed something about the indicator
-            if indicator != indicator_with_port and not strip_port:
-                # if port was in the indicator and strip_port param not set - ignore the indicator
-                continue
-
-            with_invalid_tokens_indicator = indicator
-            # remove invalid tokens from indicator
-            indicator = _INVALID_TOKEN_REMOVAL.sub('*', indicator)
-
-            # check if the indicator held invalid tokens
-            if with_invalid_tokens_indicator != indicator:
-                # invalid tokens in indicator- if drop_invalids is set - ignore the indicator
-                if drop_invalids:
-                    continue
-
-                # check if after removing the tokens the indicator is too broad if so - ignore
-                # example of too broad terms: "*.paloalto", "*.*.paloalto", "*.paloalto:60"
-                hostname = indicator
-                if '/' in hostname:
-                    hostname, _ = hostname.split('/', 1)
-
-                if _BROAD_PATTERN.match(hostname) is not None:
-                    continue
-
-            # for PAN-OS "*.domain.com" does not match "domain.com" - we should provide both
-            if indicator.startswith('*.'):
-                formatted_indicators.append(indicator[2:])
-
-        formatted_indicators.append(indicator)
+        formatted_indicators.extend(panos_url_format_single_indicator(indicator_data, drop_invalids, strip_port))
     return {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
@@ -497,18 +747,22 @@ def create_proxysg_out_format(iocs: list, category_attribute: list, category_def
     return {CTX_VALUES_KEY: formatted_indicators}, num_of_returned_indicators
 
 
+def mwg_format_single_indicator(indicator: dict) -> str:
+    value = "\"" + indicator.get('value') + "\""
+    sources = indicator.get('sourceBrands')
+    if sources:
+        sources_string = "\"" + ','.join(sources) + "\""
+
+    else:
+        sources_string = "\"from CORTEX XSOAR\""
+
+    return value + " " + sources_string
+
+
 def create_mwg_out_format(iocs: list, mwg_type: str) -> dict:
     formatted_indicators = []  # type:List
     for indicator in iocs:
-        value = "\"" + indicator.get('value') + "\""
-        sources = indicator.get('sourceBrands')
-        if sources:
-            sources_string = "\"" + ','.join(sources) + "\""
-
-        else:
-            sources_string = "\"from CORTEX XSOAR\""
-
-        formatted_indicators.append(value + " " + sources_string)
+        formatted_indicators.append(mwg_format_single_indicator(indicator))
 
     string_formatted_indicators = list_to_str(formatted_indicators, '\n')
 
@@ -756,6 +1010,25 @@ def get_request_args(params):
                             category_attribute, collapse_ips, csv_text)
 
 
+def create_values_response(cached_output: CachedOutput) -> Response:
+    """
+    Creates the response of a cached output, with an ETag and Last-Modified headers, so clients which already have
+    the output get a 304 response. The output is gzipped if the client accepts it.
+    """
+    if request.accept_encodings['gzip'] and cached_output.size >= GZIP_MIN_SIZE:
+        response = Response(cached_output.get_gzipped_chunks(), status=200, mimetype=cached_output.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(f'{cached_output.etag}-gzip')
+
+    else:
+        response = Response(cached_output.chunks, status=200, mimetype=cached_output.mimetype)
+        response.set_etag(cached_output.etag)
+
+    response.vary.add('Accept-Encoding')
+    response.last_modified = cached_output.last_modified
+    return response.make_conditional(request)
+
+
 @APP.route('/', methods=['GET'])
 def route_list_values() -> Response:
     """
@@ -775,23 +1048,51 @@ def route_list_values() -> Response:
                 return Response(err_msg, status=401)
 
         request_args = get_request_args(params)
-
-        values = get_outbound_ioc_values(
-            on_demand=params.get('on_demand'),
-            last_update_data=demisto.getIntegrationContext(),
-            cache_refresh_rate=params.get('cache_refresh_rate'),
-            request_args=request_args
-        )
-
-        if not demisto.getIntegrationContext() and params.get('on_demand'):
-            values = 'You are running in On-Demand mode - please run !eis-update command to initialize the ' \
-                     'export process'
-
-        elif not values:
-            values = "No Results Found For the Query"
-
-        mimetype = get_outbound_mimetype()
-        return Response(values, status=200, mimetype=mimetype)
+        on_demand = params.get('on_demand')
+        cache_refresh_rate = params.get('cache_refresh_rate')
+
+        outputs_cache = get_process_cache(OUTPUTS_CACHE_NAME, OUTPUTS_CACHE_SIZE)
+        cache_key = request_args.get_cache_key()
+        cached_output = outputs_cache.get(cache_key)
+
+        if on_demand:
+            # in On-Demand mode the list is updated by the eis-update command, so the context version is always checked
+            integration_context = demisto.getIntegrationContext()
+            if not integration_context:
+                values = 'You are running in On-Demand mode - please run !eis-update command to initialize the ' \
+                         'export process'
+                return Response(values, status=200, mimetype='text/plain')
+
+            version = integration_context.get('last_run')
+            if not cached_output or cached_output.version != version:
+                values = get_outbound_ioc_values(
+                    on_demand=on_demand,
+                    last_update_data=integration_context,
+                    cache_refresh_rate=cache_refresh_rate,
+                    request_args=request_args
+                )
+                if not values:
+                    values = "No Results Found For the Query"
+
+                cached_output = CachedOutput([values.encode('utf-8')], get_outbound_mimetype(), version)
+                outputs_cache.set(cache_key, cached_output)
+
+        elif not cached_output:
+            refresh = OUTPUTS_REFRESHES.get(cache_key)
+            if refresh is not None:
+                cached_output = refresh.get()
+
+            if not cached_output:
+                # the list is streamed while it is refreshed, and it is cached when it is complete
+                return Response(stream_with_context(stream_outbound_context(request_args)), status=200,
+                                mimetype=get_mimetype(request_args))
+
+        elif cached_output.is_expired(cache_refresh_rate):
+            # the expired list is served while it is refreshed in the background
+            gevent.spawn(refresh_output, request_args)
+
+        cached_output.last_accessed = datetime.utcnow()
+        return create_values_response(cached_output)
 
     except Exception:
         return Response(traceback.format_exc(), status=400, mimetype='text/plain')
@@ -868,6 +1169,10 @@ def run_long_running(params, is_test=False):
             demisto.debug('Starting HTTP Server')
 
         server = WSGIServer(('', port), APP, **ssl_args, log=DEMISTO_LOGGER)
+        if not is_test and not params.get('on_demand'):
+            # the lists are refreshed in a greenlet rather than a thread, as the calls to the server must not overlap
+            gevent.spawn(refresh_outputs_loop, params)
+
         if is_test:
             server_process = Process(target=server.serve_forever)
             server_process.start()
@@ -2,6 +2,7 @@
 import json
 import pytest
 import demistomock as demisto
+from datetime import datetime
 from netaddr import IPAddress
 
 
@@ -567,8 +568,255 @@ class TestHelperFunctions:
         assert "2.2.2.2" in ip_range_list
         assert "25.24.23.22" in ip_range_list
 
+    @pytest.mark.ips_to_cidrs
+    def test_ips_to_ranges_exact_cidrs(self):
+        from ExportIndicators import ips_to_ranges, COLLAPSE_TO_CIDR
+        ip_list = [IPAddress("10.0.0.{}".format(i)) for i in range(10, 0, -1)]
+        assert ips_to_ranges(ip_list, COLLAPSE_TO_CIDR) == ["10.0.0.1", "10.0.0.2/31", "10.0.0.4/30", "10.0.0.8/31",
+                                                            "10.0.0.10"]
+
+        ipv6_list = [IPAddress("2001:db8::{}".format(i)) for i in range(5)] + [IPAddress("2001:db8::2")]
+        assert ips_to_ranges(ipv6_list, COLLAPSE_TO_CIDR) == ["2001:db8::/126", "2001:db8::4"]
+
     def test_empty_integartion_context_mimtype(self, mocker):
         from ExportIndicators import get_outbound_mimetype
         mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
         mimtype = get_outbound_mimetype()
         assert mimtype == 'text/plain'
+
+
+@pytest.mark.route_list_values
+class TestRouteListValues:
+    PARAMS = {'indicators_query': 'type:IP', 'list_size': 1000, 'format': 'text', 'cache_refresh_rate': '1 minute'}
+    IPS = ['1.1.{}.{}'.format(i // 256, i % 256) for i in range(300)]
+    VALUES = '\n'.join(IPS)
+
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        import ExportIndicators as ei
+        from CommonServerPython import get_process_cache
+        get_process_cache(ei.OUTPUTS_CACHE_NAME).invalidate()
+        mocker.patch.object(ei, 'PAGE_SIZE', 200)
+
+    def search_indicators(self, query, page, size):
+        return {'iocs': [{'value': ip, 'indicator_type': 'IP'} for ip in self.IPS[page * size:(page + 1) * size]]}
+
+    def test_cached_output_not_modified(self, mocker):
+        """
+        Given
+            - A list which was not refreshed yet
+        When
+            - Polling the list 3 times, the last time with the ETag of the previous response
+        Then
+            - Ensure the list is streamed once, and only the refresh arguments are saved in the integration context
+            - Ensure the integration context is not loaded while the output is cached
+            - Ensure the last response is 304
+        """
+        import ExportIndicators as ei
+        mocker.patch.object(demisto, 'params', return_value=self.PARAMS)
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        search_mock = mocker.patch.object(demisto, 'searchIndicators', side_effect=self.search_indicators)
+        client = ei.APP.test_client()
+
+        response = client.get('/')
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == self.VALUES
+        assert search_mock.call_count == 2
+        integration_context = demisto.setIntegrationContext.call_args[0][0]
+        assert integration_context['last_output'] == {ei.CTX_MIMETYPE_KEY: ei.MIMETYPE_TEXT}
+        assert 'current_iocs' not in integration_context
+
+        response = client.get('/')
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == self.VALUES
+        assert response.headers['Last-Modified']
+        etag = response.headers['ETag']
+        response = client.get('/', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.get_data() == b''
+        assert search_mock.call_count == 2
+        assert demisto.getIntegrationContext.call_count == 0
+
+    def test_cached_output_gzip(self, mocker):
+        """
+        Given
+            - A list of 300 IPs
+        When
+            - Polling the list with and without accepting gzip encoding
+        Then
+            - Ensure the cached output is gzipped only when it is accepted, with an ETag of its own
+        """
+        import gzip
+        import ExportIndicators as ei
+        mocker.patch.object(demisto, 'params', return_value=self.PARAMS)
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=self.search_indicators)
+        client = ei.APP.test_client()
+        client.get('/').get_data()
+
+        response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.get_data()).decode('utf-8') == self.VALUES
+        gzip_etag = response.headers['ETag']
+
+        response = client.get('/')
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_data(as_text=True) == self.VALUES
+        assert response.headers['ETag'] != gzip_etag
+
+    def test_stream_outbound_values_limit(self, mocker):
+        """
+        Given
+            - 300 IPs, and a PAN-OS URL list which drops the IPs with ports
+        When
+            - Streaming 250 entries of the list from the 10th indicator
+        Then
+            - Ensure the dropped IPs are replaced by the following indicators
+            - Ensure only the needed pages are fetched
+        """
+        import ExportIndicators as ei
+        ips = ['{}:80'.format(ip) if i % 10 == 0 else ip for i, ip in enumerate(self.IPS)]
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=lambda query, page, size: {
+            'iocs': [{'value': ip, 'indicator_type': 'URL'} for ip in ips[page * size:(page + 1) * size]]
+        })
+        request_args = ei.RequestArguments('type:IP', ei.FORMAT_PANOSURL, limit=250, offset=10)
+        values = ''.join(ei.stream_outbound_values(request_args)).split('\n')
+        assert len(values) == 250
+        assert values[0] == '1.1.0.11'
+        assert not [value for value in values if ':' in value]
+        assert demisto.searchIndicators.call_count == 2
+
+    @pytest.mark.parametrize('out_format', ['text', 'csv', 'json', 'json-seq', 'McAfee Web Gateway', 'Symantec ProxySG',
+                                            'PAN-OS URL', 'XSOAR json', 'XSOAR json-seq', 'XSOAR csv'])
+    def test_stream_outbound_values_formats(self, mocker, out_format):
+        """
+        Given
+            - 450 URLs and IPs, in 3 pages
+        When
+            - Streaming the list in each format, collapsing the IPs to CIDRs
+        Then
+            - Ensure the streamed list is the same as the list which is formatted at once
+        """
+        import copy
+        import ExportIndicators as ei
+        iocs = [{'value': 'https://www.demisto{}.com:8080/path'.format(i), 'indicator_type': 'URL'} if i % 3 else
+                {'value': self.IPS[i % 300], 'indicator_type': 'IP', 'sourceBrands': ['feed']} for i in range(450)]
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=lambda query, page, size: {
+            'iocs': copy.deepcopy(iocs[page * size:(page + 1) * size])
+        })
+        request_args = ei.RequestArguments('', out_format, limit=1000, strip_port=True, collapse_ips=ei.COLLAPSE_TO_CIDR)
+        expected_output = ei.create_values_for_returned_dict(copy.deepcopy(iocs), request_args)
+        if isinstance(expected_output, tuple):
+            expected_output = expected_output[0]
+        assert ''.join(ei.stream_outbound_values(request_args)) == expected_output[ei.CTX_VALUES_KEY]
+
+    def test_cached_output_on_demand(self, mocker):
+        """
+        Given
+            - A list in On-Demand mode
+        When
+            - Polling the list before and after it is updated by the eis-update command
+        Then
+            - Ensure the output is rendered again only after the update
+        """
+        import ExportIndicators as ei
+        params = dict(self.PARAMS, on_demand=True)
+        mocker.patch.object(demisto, 'params', return_value=params)
+        mocker.patch.object(demisto, 'getIntegrationContext', return_value={'last_run': 1})
+        values_mock = mocker.patch.object(ei, 'get_outbound_ioc_values', return_value=self.VALUES)
+        client = ei.APP.test_client()
+
+        assert client.get('/').get_data(as_text=True) == self.VALUES
+        assert client.get('/').get_data(as_text=True) == self.VALUES
+        assert values_mock.call_count == 1
+
+        demisto.getIntegrationContext.return_value = {'last_run': 2}
+        assert client.get('/').get_data(as_text=True) == self.VALUES
+        assert values_mock.call_count == 2
+
+    def test_expired_output_refreshed_in_background(self, mocker):
+        """
+        Given
+            - An expired cached output
+        When
+            - Polling the list
+        Then
+            - Ensure the expired output is served and marked as accessed, and the list is refreshed in the background
+            - Ensure the refreshed output replaces the expired output
+        """
+        import ExportIndicators as ei
+        from CommonServerPython import get_process_cache
+        mocker.patch.object(demisto, 'params', return_value=self.PARAMS)
+        mocker.patch.object(demisto, 'setIntegrationContext')
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=self.search_indicators)
+        spawn_mock = mocker.patch.object(ei.gevent, 'spawn')
+        with ei.APP.test_request_context('/'):
+            request_args = ei.get_request_args(self.PARAMS)
+        outputs_cache = get_process_cache(ei.OUTPUTS_CACHE_NAME)
+        expired_output = ei.CachedOutput([b'1.1.1.1'], ei.MIMETYPE_TEXT, request_args=request_args)
+        expired_output.last_modified = expired_output.last_modified.replace(year=2000)
+        outputs_cache.set(request_args.get_cache_key(), expired_output)
+
+        response = ei.APP.test_client().get('/')
+        assert response.get_data(as_text=True) == '1.1.1.1'
+        assert expired_output.last_accessed
+        spawn_mock.assert_called_once_with(ei.refresh_output, mocker.ANY)
+        assert demisto.searchIndicators.call_count == 0
+
+        ei.refresh_output(spawn_mock.call_args[0][1])
+        assert b''.join(outputs_cache.get(request_args.get_cache_key()).chunks).decode('utf-8') == self.VALUES
+        assert not ei.OUTPUTS_REFRESHES
+
+    def test_refresh_expired_outputs(self, mocker):
+        """
+        Given
+            - Expired outputs of the default list, of a list which was requested since its last refresh, of a list
+              which was not, and of an On-Demand list
+        When
+            - Refreshing the expired outputs in the background
+        Then
+            - Ensure only the default list and the requested list are refreshed
+        """
+        import ExportIndicators as ei
+        from CommonServerPython import get_process_cache
+        refresh_mock = mocker.patch.object(ei, 'refresh_output')
+        outputs_cache = get_process_cache(ei.OUTPUTS_CACHE_NAME)
+        outputs_cache.invalidate()
+        outputs = {}
+        for name in ['default', 'requested', 'not_requested', 'on_demand']:
+            request_args = ei.RequestArguments(name, ei.FORMAT_TEXT)
+            outputs[name] = ei.CachedOutput([b'1.1.1.1'], ei.MIMETYPE_TEXT,
+                                            request_args=None if name == 'on_demand' else request_args)
+            outputs[name].last_modified = outputs[name].last_modified.replace(year=2000)
+            outputs_cache.set(request_args.get_cache_key(), outputs[name])
+        outputs['requested'].last_accessed = datetime.utcnow()
+        outputs['on_demand'].last_accessed = datetime.utcnow()
+
+        ei.refresh_expired_outputs(ei.RequestArguments('default', ei.FORMAT_TEXT).get_cache_key(), '1 hour')
+        assert [call_args[0][0].query for call_args in refresh_mock.call_args_list] == ['default', 'requested']
+        outputs_cache.invalidate()
+
+    def test_refresh_single_flight(self, mocker):
+        """
+        Given
+            - A list which is being refreshed
+        When
+            - Refreshing the list again, and polling the list
+        Then
+            - Ensure the list is not refreshed again
+            - Ensure the poll is served with the output of the refresh in progress
+        """
+        import ExportIndicators as ei
+        from gevent.event import AsyncResult
+        mocker.patch.object(demisto, 'params', return_value=self.PARAMS)
+        mocker.patch.object(demisto, 'searchIndicators', side_effect=self.search_indicators)
+        with ei.APP.test_request_context('/'):
+            request_args = ei.get_request_args(self.PARAMS)
+        refresh = AsyncResult()
+        refresh.set(ei.CachedOutput([b'1.1.1.1'], ei.MIMETYPE_TEXT))
+        mocker.patch.dict(ei.OUTPUTS_REFRESHES, {request_args.get_cache_key(): refresh})
+
+        ei.refresh_output(request_args)
+        assert ei.APP.test_client().get('/').get_data(as_text=True) == '1.1.1.1'
+        assert demisto.searchIndicators.call_count == 0
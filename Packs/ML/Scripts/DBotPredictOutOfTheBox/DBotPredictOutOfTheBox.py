@@ -7,11 +7,18 @@ OUT_OF_THE_BOX_MODEL_NAME = 'demisto_out_of_the_box_model'
 OUT_OF_THE_BOX_MODEL_PATH = '/var/oob_model.ftz'
 EVALUATION_PATH = '/var/oob_evaluation.json'
 HASH_SEED = 5381
+MODEL_EXISTS_CACHE_NAME = 'DBotPredictOutOfTheBox'
 
 
 def oob_model_exists():
+    model_exists_cache = get_process_cache(MODEL_EXISTS_CACHE_NAME, 1)
+    if OUT_OF_THE_BOX_MODEL_NAME in model_exists_cache:
+        return True
     res_model = demisto.executeCommand("getMLModel", {"modelName": OUT_OF_THE_BOX_MODEL_NAME})[0]
-    return not is_error(res_model)
+    if is_error(res_model):
+        return False
+    model_exists_cache.set(OUT_OF_THE_BOX_MODEL_NAME, True)
+    return True
 
 
 def load_oob_model():
@@ -22,6 +29,7 @@ def load_oob_model():
                                                    'modelOverride': 'true'})
     if is_error(res):
         return_error(get_error(res))
+    get_process_cache(MODEL_EXISTS_CACHE_NAME, 1).set(OUT_OF_THE_BOX_MODEL_NAME, True)
 
     with open(EVALUATION_PATH, 'r') as json_file:
         data = json.load(json_file)
@@ -54,6 +62,8 @@ def predict_phishing_words():
     dargs['hashSeed'] = '5381'
     res = demisto.executeCommand('DBotPredictPhishingWords', dargs)
     if is_error(res):
+        # the model may have been deleted, so check it again on the next execution
+        get_process_cache(MODEL_EXISTS_CACHE_NAME, 1).invalidate(OUT_OF_THE_BOX_MODEL_NAME)
         return_error(get_error(res))
     return res
 
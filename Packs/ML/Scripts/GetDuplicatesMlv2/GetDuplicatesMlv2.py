@@ -1,6 +1,8 @@
 import demistomock as demisto
 from CommonServerPython import *
+import base64
 import collections
+import hashlib
 import re
 import dateutil.parser
 import pickle
@@ -249,6 +251,8 @@ BRAND_LABEL = 'Brand'
 INSTANCE_LABEL = 'Instance'
 CANDIDATES_FEATURES_NA_RATIO = 0.2
 TIME_FIELD = 'created'
+# the trained models are stored in Demisto under this prefix, the name of the features set and a digest of the features
+MODEL_NAME_PREFIX = 'GetDuplicatesMlv2_'
 
 LABELS_BLACKLIST = [BRAND_LABEL, INSTANCE_LABEL, EMAIL_SENDER_ADDRESS_LABEL, EMAIL_SENDER_NAME_LABEL,
                     EMAIL_SUBJECT_LABEL, EMAIL_RECEIVED_LABEL, EMAIL_ATTACHMENT_LABEL, EMAIL_DATE_LABEL,
@@ -265,12 +269,16 @@ INDICATORS_FOR_JACCARD = []  # type: list
 class Utils():
     email_pattern = re.compile(
         r"""[a-zA-Z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)*""")  # noqa: E501
+    # created once, as loading the TLD set is much slower than extracting a domain
+    tld_extractor = None
 
     @staticmethod
     def extract_domain_from_url(url):
-        extract = tldextract.TLDExtract(cache_file='/tmp/.tld_set')
-        domain = extract(url).domain.lower()
-        suffix = extract(url).suffix.lower()
+        if Utils.tld_extractor is None:
+            Utils.tld_extractor = tldextract.TLDExtract(cache_file='/tmp/.tld_set')
+        extract_result = Utils.tld_extractor(url)
+        domain = extract_result.domain.lower()
+        suffix = extract_result.suffix.lower()
         if len(domain) > 0 and len(suffix) > 0:
             return ".".join([domain, suffix])
 
@@ -577,11 +585,17 @@ def get_unique_key_for_pair(id1, id2):
     return "%s_%s" % (key_tuple[0], key_tuple[1])
 
 
-def get_my_duplicate_incidents_features(incident_type, days_to_fetch_duplicates, max_number_of_results, max_indicators):
+def get_my_duplicate_incidents(incident_type, days_to_fetch_duplicates, max_number_of_results):
     since_date = datetime.now() - timedelta(days=days_to_fetch_duplicates)
     query = "linkedIncidents:* and %s:>=%s and type:%s" % (TIME_FIELD, since_date.isoformat(), incident_type)
     res = demisto.executeCommand("getIncidents", {'query': query, 'size': max_number_of_results, 'sort': '%s.desc' % TIME_FIELD})
-    incident_list = res[0]['Contents']['data']
+    return res[0]['Contents']['data']
+
+
+def get_my_duplicate_incidents_features(incident_type, days_to_fetch_duplicates, max_number_of_results, max_indicators,
+                                        incident_list=None):
+    if incident_list is None:
+        incident_list = get_my_duplicate_incidents(incident_type, days_to_fetch_duplicates, max_number_of_results)
     if incident_list is None:
         return None
     incidents = enrich_incidents_by_indicators(incident_list, max_indicators)
@@ -590,9 +604,14 @@ def get_my_duplicate_incidents_features(incident_type, days_to_fetch_duplicates,
     for incident in incidents.values():
         related_incidents = incident.get('linkedIncidents')
         if related_incidents:
+            related_incidents_set = set(related_incidents)
             for related_incident_id in related_incidents:
                 if related_incident_id in incidents:
-                    related_incidents += list(set(incidents[related_incident_id]['linkedIncidents']).difference(related_incidents))  # noqa E501 line too long
+                    linked_incidents = [linked_incident_id for linked_incident_id
+                                        in set(incidents[related_incident_id]['linkedIncidents'])
+                                        if linked_incident_id not in related_incidents_set]
+                    related_incidents += linked_incidents
+                    related_incidents_set.update(linked_incidents)
             for related_incident_id in related_incidents:
                 key = get_unique_key_for_pair(incident['id'], related_incident_id)
                 if incident['id'] == related_incident_id or key in related_features or related_incident_id not in incidents:
@@ -617,6 +636,81 @@ def get_ml_model():
     return RandomForestClassifier(max_depth=10, n_estimators=100, random_state=1)
 
 
+def get_model_signature(features_set_name, use_features, my_duplicate_incidents):
+    """Gets a signature of the inputs of the model training - the features and the local duplicate incidents (by
+    their IDs, modification times and linked incidents), so a stored model is reused only if they did not change.
+    """
+    local_data_watermark = None
+    if my_duplicate_incidents is not None:
+        local_data_watermark = sorted([incident['id'], incident.get('modified'),
+                                       sorted(incident.get('linkedIncidents') or [])]
+                                      for incident in my_duplicate_incidents)
+    signature_data = [features_set_name, sorted(use_features), local_data_watermark, get_ml_model().get_params()]
+    return hashlib.md5(json.dumps(signature_data, sort_keys=True)).hexdigest()
+
+
+def get_model_name(features_set_name, use_features, incident_type=None):
+    """Gets the name under which the model is stored - by the features and the incident type of the local duplicate
+    incidents, so incidents which are compared by different features or types do not override each other's model.
+    """
+    variant_data = [features_set_name, sorted(use_features), incident_type]
+    return '{}{}_{}'.format(MODEL_NAME_PREFIX, features_set_name,
+                            hashlib.md5(json.dumps(variant_data)).hexdigest()[:12])
+
+
+def train_model(features_df, use_features, signature):
+    use_features = set(features_df.columns).intersection(use_features)
+    X = filter_features(features_df, use_features)
+    Y = features_df[DUPLICATE_COL]
+    model = get_ml_model()
+    model.fit(X, Y)
+    return {
+        'signature': signature,
+        'model': model,
+        'use_features': use_features,
+        # the statistics of the training features, which are needed to complete the missing candidates features
+        'columns': list(X.columns),
+        'columns_sums': X.sum(),
+        'rows_count': len(X)
+    }
+
+
+def load_stored_model(model_name, signature):
+    res = demisto.executeCommand('getMLModel', {'modelName': model_name})
+    if is_error(res):
+        return None
+    try:
+        model_data = pickle.loads(zlib.decompress(base64.b64decode(res[0]['Contents']['modelData'])))
+    except Exception as e:
+        demisto.debug('Failed to load the stored model {}: {}'.format(model_name, e))
+        return None
+    if model_data.get('signature') != signature:
+        return None
+    return model_data
+
+
+def store_model(model_name, model_data):
+    res = demisto.executeCommand('createMLModel', {
+        'modelData': base64.b64encode(zlib.compress(pickle.dumps(model_data, pickle.HIGHEST_PROTOCOL))),
+        'modelName': model_name,
+        'modelLabels': ['not duplicate', 'duplicate'],
+        'modelOverride': 'true'
+    })
+    if is_error(res):
+        demisto.debug('Failed to store the model {}: {}'.format(model_name, get_error(res)))
+
+
+def complete_candidates_missing_values(model_data, candidates_features_x):
+    """Completes the missing candidates features with the means of the features over the training and the candidates
+    features, like union_complete_missing_values, using the statistics of the training features of the model.
+    """
+    columns = pd.concat([pd.DataFrame(columns=model_data['columns']), candidates_features_x]).columns
+    candidates_features_x = candidates_features_x.reindex(columns=columns).astype(float)
+    means = (model_data['columns_sums'].reindex(columns).fillna(0) + candidates_features_x.sum()) / \
+        (model_data['rows_count'] + candidates_features_x.count())
+    return candidates_features_x.fillna(means)
+
+
 def get_result_record(incident, probabilty):
     occured_time = incident[TIME_FIELD]
     try:
@@ -648,6 +742,44 @@ def load_compressed_features(features_str):
     return pickle.loads(zlib.decompress(features_str))
 
 
+def get_blocking_tokens(incident):
+    """Gets the tokens which are compared by the features of an incident: its indicators, the words of its email
+    labels, its other labels and its custom fields.
+    """
+    tokens = set()
+    for indicator_type in INDICATORS_FOR_JACCARD:
+        tokens.update((indicator_type, value) for value in incident['indicators'].get(indicator_type, []))
+    for label, value in Utils.get_incident_labels_map(incident['labels']).items():
+        if not isinstance(value, STRING_OBJ_TYPES):
+            continue
+        if 'email' in label.lower():
+            tokens.update((label, word) for word in value.lower().split())
+        elif label not in LABELS_BLACKLIST:
+            tokens.add((label, value))
+    tokens.update(Utils.get_hashable_from_dict(incident.get('CustomFields') or {}))
+    return tokens
+
+
+def filter_candidates_by_blocking(incident, candidates, threshold):
+    """Removes the candidates which are obviously not duplicates of the incident - the candidates which the Jaccard
+    similarity of their blocking tokens to the tokens of the incident is not above the threshold - so the features
+    are calculated only for the remaining candidates.
+    """
+    incident_tokens = get_blocking_tokens(incident)
+    if not incident_tokens:
+        return candidates
+    remaining_candidates = {}
+    for candidate_id, candidate in candidates.items():
+        candidate_tokens = get_blocking_tokens(candidate)
+        # candidates without tokens can not be compared, so they are kept
+        if not candidate_tokens or \
+                len(incident_tokens & candidate_tokens) / float(len(incident_tokens | candidate_tokens)) > threshold:
+            remaining_candidates[candidate_id] = candidate
+    demisto.debug('Blocking removed {} of {} candidates'.format(len(candidates) - len(remaining_candidates),
+                                                                len(candidates)))
+    return remaining_candidates
+
+
 def get_incident_email_labels(incident):
     labels_map = Utils.get_incident_labels_map(incident['labels'])
     labels_map = Utils.complete_email_missing_labels(labels_map)
@@ -687,6 +819,7 @@ def main():
     MAX_INDICATORS = MAX_INCIDENTS * 100
     THRESHOLD = float(demisto.args().get('threshold', 0.5))
     TIME_FIELD = demisto.args().get('timeField', 'created')
+    BLOCKING_THRESHOLD = demisto.args().get('candidatesBlockingThreshold')
 
     incident = enrich_incidents_by_indicators(demisto.incidents(), MAX_INDICATORS).values()[0]
 
@@ -698,26 +831,13 @@ def main():
 
     use_features = set(FEATURES).union(email_features).union(indicators_features)
 
-    if len(email_features) > 0:
-        features_df = load_compressed_features(FEATURES_PHISHING_STRING)
-    else:
-        features_df = load_compressed_features(FEATURES_OTHERS_STRING)
-
-    use_features = set(features_df.columns).intersection(use_features)
-    if USE_MY_DUPLICATES_X_DAYS_AGO > 0:
-        my_tagged_data_features = get_my_duplicate_incidents_features(incident['type'], USE_MY_DUPLICATES_X_DAYS_AGO,
-                                                                      MAX_INCIDENTS, MAX_INDICATORS)
-        features_df = union_complete_missing_values(features_df, my_tagged_data_features).reset_index()
-
-    X = filter_features(features_df, use_features)
-    Y = features_df[DUPLICATE_COL]
-    model = get_ml_model()
-    model.fit(X, Y)
     candidates = enrich_incidents_by_indicators(get_incidents_by_time_diff(incident.get('id'),
                                                                            incident[TIME_FIELD],
                                                                            IGNORE_CLOSED_INCIDENTS,
                                                                            MAX_INCIDENTS, TIME_DIFF_HOURS), MAX_INDICATORS)
     candidates.pop(incident['id'], None)
+    if BLOCKING_THRESHOLD:
+        candidates = filter_candidates_by_blocking(incident, candidates, float(BLOCKING_THRESHOLD))
 
     candidates_features_list = []
     for candidate in candidates.values():
@@ -728,10 +848,37 @@ def main():
         demisto.results('Did not find any duplicate incidents candidates')
         return
 
+    # the model is trained only when its inputs changed since it was stored
+    features_set_name = 'phishing' if len(email_features) > 0 else 'others'
+    my_duplicate_incidents = None
+    if USE_MY_DUPLICATES_X_DAYS_AGO > 0:
+        my_duplicate_incidents = get_my_duplicate_incidents(incident['type'], USE_MY_DUPLICATES_X_DAYS_AGO,
+                                                            MAX_INCIDENTS)
+    signature = get_model_signature(features_set_name, use_features, my_duplicate_incidents)
+    model_name = get_model_name(features_set_name, use_features,
+                                incident['type'] if USE_MY_DUPLICATES_X_DAYS_AGO > 0 else None)
+    model_data = load_stored_model(model_name, signature)
+    if model_data is None:
+        if len(email_features) > 0:
+            features_df = load_compressed_features(FEATURES_PHISHING_STRING)
+        else:
+            features_df = load_compressed_features(FEATURES_OTHERS_STRING)
+
+        if USE_MY_DUPLICATES_X_DAYS_AGO > 0:
+            my_tagged_data_features = get_my_duplicate_incidents_features(incident['type'], USE_MY_DUPLICATES_X_DAYS_AGO,
+                                                                          MAX_INCIDENTS, MAX_INDICATORS,
+                                                                          my_duplicate_incidents)
+            features_df = union_complete_missing_values(features_df, my_tagged_data_features).reset_index()
+
+        model_data = train_model(features_df, use_features, signature)
+        store_model(model_name, model_data)
+    model = model_data['model']
+    use_features = model_data['use_features']
+
     candidates_features = pd.DataFrame.from_dict(candidates_features_list)
     candidates_features = candidates_features.dropna(axis=0, thresh=(len(use_features) * (1 - CANDIDATES_FEATURES_NA_RATIO)))
     candidates_features_x = filter_features(candidates_features, use_features)
-    candidates_features_x = union_complete_missing_values(X, candidates_features_x, ['features', 'candidates']).loc['candidates']
+    candidates_features_x = complete_candidates_missing_values(model_data, candidates_features_x)
     predications_prob = model.predict_proba(candidates_features_x)
     predications = model.predict(candidates_features_x)
     result = []
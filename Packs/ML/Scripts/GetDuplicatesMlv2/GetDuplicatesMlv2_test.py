@@ -42,3 +42,46 @@ def test_extract_domain_from_url():
     assert res == 'google.com'
     res = Utils.extract_domain_from_url("https://www.google.co.il")  # disable-secrets-detection
     assert res == 'google.co.il'
+
+
+def test_filter_candidates_by_blocking(mocker):
+    import GetDuplicatesMlv2
+    from GetDuplicatesMlv2 import filter_candidates_by_blocking
+    mocker.patch.object(GetDuplicatesMlv2, 'INDICATORS_FOR_JACCARD', ['IP'])
+    incident = {'indicators': {'IP': ['1.1.1.1']}, 'labels': [{'type': 'Email/headers/Subject', 'value': 'Hello'}]}
+    candidates = {
+        'similar': {'indicators': {'IP': ['1.1.1.1']}, 'labels': []},
+        'different': {'indicators': {'IP': ['2.2.2.2']}, 'labels': [{'type': 'Email/headers/Subject', 'value': 'Bye'}]},
+        'empty': {'indicators': {}, 'labels': []}
+    }
+    assert sorted(filter_candidates_by_blocking(incident, candidates, 0).keys()) == ['empty', 'similar']
+    assert sorted(filter_candidates_by_blocking(incident, candidates, 0.5).keys()) == ['empty']
+
+
+def test_complete_candidates_missing_values():
+    import pandas as pd
+    from GetDuplicatesMlv2 import complete_candidates_missing_values, union_complete_missing_values
+    X = pd.DataFrame({'b': [1.0, 2.0, 3.0], 'a': [0.0, 1.0, 0.0]}, columns=['b', 'a'])
+    candidates_x = pd.DataFrame({'a': [None, 1.0], 'b': [5.0, None]})
+    model_data = {'columns': list(X.columns), 'columns_sums': X.sum(), 'rows_count': len(X)}
+    expected = union_complete_missing_values(X, candidates_x, ['features', 'candidates']).loc['candidates']
+    assert complete_candidates_missing_values(model_data, candidates_x).values.tolist() == expected.values.tolist()
+
+
+def test_get_model_signature():
+    from GetDuplicatesMlv2 import get_model_signature
+    duplicates = [{'id': '1', 'modified': '2020-01-01', 'linkedIncidents': ['2']}]
+    signature = get_model_signature('phishing', {'a', 'b'}, duplicates)
+    assert get_model_signature('phishing', {'b', 'a'}, list(duplicates)) == signature
+    assert get_model_signature('others', {'a', 'b'}, duplicates) != signature
+    assert get_model_signature('phishing', {'a', 'b'}, duplicates + [{'id': '2', 'linkedIncidents': ['1']}]) != signature
+
+
+def test_get_model_name():
+    from GetDuplicatesMlv2 import get_model_name
+    model_name = get_model_name('phishing', {'a', 'b'}, 'Phishing')
+    assert model_name.startswith('GetDuplicatesMlv2_phishing_')
+    assert get_model_name('phishing', {'b', 'a'}, 'Phishing') == model_name
+    assert get_model_name('phishing', {'a', 'b', 'c'}, 'Phishing') != model_name
+    assert get_model_name('phishing', {'a', 'b'}, 'Malware') != model_name
+    assert get_model_name('phishing', {'a', 'b'}) != model_name
@@ -759,15 +759,8 @@ def find_indicators_loop(indicator_query: str):
         Indicator query results from Demisto.
     """
     iocs: List[dict] = []
-    total_fetched = 0
-    next_page = 0
-    last_found_len = PAGE_SIZE
-    while last_found_len == PAGE_SIZE:
-        fetched_iocs = demisto.searchIndicators(query=indicator_query, page=next_page, size=PAGE_SIZE).get('iocs')
+    for fetched_iocs in IndicatorsSearcher(query=indicator_query, size=PAGE_SIZE):
         iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-        next_page += 1
     return iocs
 
 
@@ -566,7 +566,7 @@ def integrationInstance():
 def createIndicators(indicators_batch):
     return ""
 
-def searchIndicators(fromdate = '', query = '', size = 100, page = 0, todate = '', value = ''):
+def searchIndicators(fromdate = '', query = '', size = 100, page = 0, todate = '', value = '', searchAfter = None):
     return {}
 
 def getIndexHash():
@@ -0,0 +1,69 @@
+import json
+
+from Tests.test_dependencies import TestsQueue, get_test_units, get_tests_durations
+
+
+def test_tests_queue_takes_longest_units_first():
+    tests_queue = TestsQueue([['short'], ['long_1', 'long_2'], ['unknown']], [],
+                             {'short': 10, 'long_1': 100, 'long_2': 50})
+    assert tests_queue.default_test_duration == 160 / 3.0
+    assert tests_queue.get_next_unit(mockable=True) == ['long_1', 'long_2']
+    assert tests_queue.get_next_unit(mockable=True) == ['unknown']
+    assert tests_queue.get_next_unit(mockable=True) == ['short']
+    assert tests_queue.get_next_unit(mockable=True) is None
+
+
+def test_tests_queue_mockable_units():
+    tests_queue = TestsQueue([['unmockable'], ['mockable'], ['mixed', 'unmockable_2']], ['unmockable', 'unmockable_2'],
+                             {'unmockable': 100, 'mockable': 10, 'mixed': 20, 'unmockable_2': 20})
+    assert tests_queue.get_next_unit(mockable=True) == ['mixed', 'unmockable_2']
+    assert tests_queue.get_next_unit(mockable=True) == ['mockable']
+    assert tests_queue.get_next_unit(mockable=True) is None
+    assert tests_queue.get_next_unit(mockable=False) == ['unmockable']
+    assert tests_queue.get_next_unit(mockable=False) is None
+
+
+def test_tests_queue_balances_instances():
+    """
+    Given
+        - Tests with very different durations
+    When
+        - Simulating 3 instances which take the next unit whenever they are free
+    Then
+        - Ensure the instances finish close to each other
+    """
+    tests_durations = {'test_{}'.format(i): duration for i, duration in enumerate([300, 250, 200, 60, 50, 40, 30, 20, 10])}
+    tests_queue = TestsQueue([[test_name] for test_name in tests_durations], [], tests_durations)
+    instances_times = [0, 0, 0]
+    unit = tests_queue.get_next_unit(mockable=True)
+    while unit is not None:
+        free_instance = instances_times.index(min(instances_times))
+        instances_times[free_instance] += tests_queue.get_unit_duration(unit)
+        unit = tests_queue.get_next_unit(mockable=True)
+    assert sum(instances_times) == sum(tests_durations.values())
+    assert max(instances_times) - min(instances_times) <= 30
+
+
+def test_get_test_units(tmpdir):
+    conf = {
+        'tests': [
+            {'playbookID': 'test_1', 'integrations': ['integration_a']},
+            {'playbookID': 'test_2', 'integrations': ['integration_a', 'integration_b']},
+            {'playbookID': 'test_3', 'integrations': ['integration_b']},
+            {'playbookID': 'test_4', 'integrations': 'integration_c'},
+            {'playbookID': 'test_5'}
+        ]
+    }
+    conf_path = tmpdir.join('conf.json')
+    conf_path.write(json.dumps(conf))
+    units = get_test_units(str(conf_path))
+    assert sorted(sorted(unit) for unit in units) == [['test_1', 'test_2', 'test_3'], ['test_4'], ['test_5']]
+
+
+def test_get_tests_durations(tmpdir):
+    durations_path = tmpdir.join('tests_durations.json')
+    assert get_tests_durations(str(durations_path)) == {}
+    durations_path.write('not json')
+    assert get_tests_durations(str(durations_path)) == {}
+    durations_path.write(json.dumps({'test_1': 12.5}))
+    assert get_tests_durations(str(durations_path)) == {'test_1': 12.5}
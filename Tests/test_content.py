@@ -18,7 +18,7 @@ from slackclient import SlackClient
 
 from Tests.mock_server import MITMProxy, AMIConnection
 from Tests.test_integration import Docker, test_integration, disable_all_integrations
-from Tests.test_dependencies import get_used_integrations, get_tests_allocation_for_threads
+from Tests.test_dependencies import get_used_integrations, get_test_units, get_tests_durations, TestsQueue
 from demisto_sdk.commands.common.constants import RUN_ALL_TESTS_FORMAT, FILTER_CONF, PB_Status
 from demisto_sdk.commands.common.tools import print_color, print_error, print_warning, \
     LOG_COLORS, str2bool
@@ -37,6 +37,8 @@ SERVICE_RESTART_POLLING_INTERVAL = 5
 
 SLACK_MEM_CHANNEL_ID = 'CM55V7J8K'
 
+TESTS_DURATIONS_PATH = './Tests/tests_durations.json'
+
 
 def options_handler():
     parser = argparse.ArgumentParser(description='Utility for batch action on incidents')
@@ -142,6 +144,7 @@ class TestsDataKeeper:
         self.rerecorded_tests = []
         self.empty_files = []
         self.unmockable_integrations = {}
+        self.tests_durations = {}
 
     def add_tests_data(self, succeed_playbooks, failed_playbooks, skipped_tests, skipped_integration,
                        unmockable_integrations):
@@ -157,6 +160,10 @@ class TestsDataKeeper:
         for playbook_id, reason in unmockable_integrations.items():
             self.unmockable_integrations[playbook_id] = reason
 
+    def add_test_duration(self, playbook_id, duration):
+        # A playbook may have several test records, which are all run by the same thread
+        self.tests_durations[playbook_id] = self.tests_durations.get(playbook_id, 0) + duration
+
     def add_proxy_related_test_data(self, proxy):
         # Using multiple appends and not extend since append is guaranteed to be thread safe
         for playbook_id in proxy.rerecorded_tests:
@@ -462,6 +469,11 @@ def create_result_files(tests_data_keeper):
         skipped_tests_file.write('\n'.join(skipped_tests))
     with open('./Tests/skipped_integrations.txt', "w") as skipped_integrations_file:
         skipped_integrations_file.write('\n'.join(skipped_integration))
+    # the durations are kept across builds, and are used to schedule the tests of the next builds
+    tests_durations = get_tests_durations(TESTS_DURATIONS_PATH)
+    tests_durations.update(tests_data_keeper.tests_durations)
+    with open(TESTS_DURATIONS_PATH, "w") as tests_durations_file:
+        json.dump(tests_durations, tests_durations_file, indent=4, sort_keys=True)
 
 
 def set_integration_params(demisto_api_key, integrations, secret_params, instance_names, playbook_id,
@@ -682,8 +694,34 @@ def get_test_records_of_given_test_names(tests_settings, tests_names_to_search):
     return test_records_with_supplied_names
 
 
+def get_test_records_from_queue(tests_queue, tests_records, mockable, pending_unmockable_tests):
+    """
+    Yields the test records of the units which are taken from the tests queue, until there are no units left.
+
+    Args:
+        tests_queue (TestsQueue): The queue of tests shared by all the instances.
+        tests_records (dict): The test records of each playbook, in the order of conf.json.
+        mockable (bool): Whether to take units for their mockable tests. The unmockable tests of these units are added
+            to pending_unmockable_tests, to be run later on the same instance.
+        pending_unmockable_tests (list): The unmockable tests of the units which were taken for their mockable tests.
+    """
+    if not mockable:
+        for test_name in pending_unmockable_tests:
+            for test_record in tests_records.get(test_name, []):
+                yield test_record
+    unit = tests_queue.get_next_unit(mockable)
+    while unit is not None:
+        for test_name in unit:
+            if mockable and test_name in tests_queue.unmockable_tests:
+                pending_unmockable_tests.append(test_name)
+                continue
+            for test_record in tests_records.get(test_name, []):
+                yield test_record
+        unit = tests_queue.get_next_unit(mockable)
+
+
 def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_tests_names,
-                    tests_data_keeper, prints_manager, thread_index=0, is_ami=True):
+                    tests_data_keeper, prints_manager, thread_index=0, is_ami=True, tests_queue=None):
     server = SERVER_URL.format(server_ip)
     server_numeric_version = tests_settings.serverNumericVersion
     start_message = "Executing tests with the server {} - and the server ip {}".format(server, server_ip)
@@ -731,8 +769,17 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
 
     disable_all_integrations(demisto_api_key, server, prints_manager, thread_index=thread_index)
     prints_manager.execute_thread_prints(thread_index)
-    mockable_tests = get_test_records_of_given_test_names(tests_settings, mockable_tests_names)
-    unmockable_tests = get_test_records_of_given_test_names(tests_settings, unmockable_tests_names)
+    if tests_queue:
+        # the tests are taken from the queue as the instance becomes free, instead of a fixed list of tests
+        tests_records = {}  # type: dict
+        for test_record in tests:
+            tests_records.setdefault(test_record.get('playbookID'), []).append(test_record)
+        pending_unmockable_tests = []  # type: list
+        mockable_tests = get_test_records_from_queue(tests_queue, tests_records, True, pending_unmockable_tests)
+        unmockable_tests = get_test_records_from_queue(tests_queue, tests_records, False, pending_unmockable_tests)
+    else:
+        mockable_tests = get_test_records_of_given_test_names(tests_settings, mockable_tests_names)
+        unmockable_tests = get_test_records_of_given_test_names(tests_settings, unmockable_tests_names)
 
     if is_nightly and is_memory_check:
         mem_lim, err = get_docker_limit()
@@ -744,6 +791,7 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
     if is_ami and mockable_tests:
         proxy.configure_proxy_in_demisto(demisto_api_key, server, proxy.ami.docker_ip + ':' + proxy.PROXY_PORT)
         for t in mockable_tests:
+            test_start_time = time.time()
             run_test_scenario(tests_settings, t, proxy, default_test_timeout, skipped_tests_conf, nightly_integrations,
                               skipped_integrations_conf, skipped_integration, is_nightly, run_all_tests,
                               is_filter_configured, filtered_tests,
@@ -751,6 +799,7 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
                               unmockable_integrations, succeed_playbooks, slack, circle_ci, build_number, server,
                               build_name, server_numeric_version, demisto_api_key, prints_manager,
                               thread_index=thread_index)
+            tests_data_keeper.add_test_duration(t['playbookID'], time.time() - test_start_time)
         prints_manager.add_print_job("\nRunning mock-disabled tests", print, thread_index)
         proxy.configure_proxy_in_demisto(demisto_api_key, server, '')
         prints_manager.add_print_job('Resetting containers', print, thread_index)
@@ -764,6 +813,7 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
             sys.exit(1)
         sleep(10)
     for t in unmockable_tests:
+        test_start_time = time.time()
         run_test_scenario(tests_settings, t, proxy, default_test_timeout, skipped_tests_conf, nightly_integrations,
                           skipped_integrations_conf, skipped_integration, is_nightly, run_all_tests,
                           is_filter_configured,
@@ -771,6 +821,7 @@ def execute_testing(tests_settings, server_ip, mockable_tests_names, unmockable_
                           unmockable_integrations, succeed_playbooks, slack, circle_ci, build_number, server,
                           build_name, server_numeric_version, demisto_api_key,
                           prints_manager, thread_index, is_ami)
+        tests_data_keeper.add_test_duration(t['playbookID'], time.time() - test_start_time)
 
         prints_manager.execute_thread_prints(thread_index)
 
@@ -847,33 +898,30 @@ def manage_tests(tests_settings):
         # This is the way we run most tests, including running Circle for PRs and nightly.
         if is_nightly:
             # If the build is a nightly build, run tests in parallel.
-            test_allocation = get_tests_allocation_for_threads(number_of_instances, tests_settings.conf_path)
+            # All the instances take their tests from a shared queue, the longest tests first.
+            tests_queue = TestsQueue(get_test_units(tests_settings.conf_path), get_unmockable_tests(tests_settings),
+                                     get_tests_durations(TESTS_DURATIONS_PATH))
             current_thread_index = 0
-            all_unmockable_tests_list = get_unmockable_tests(tests_settings)
             threads_array = []
             for ami_instance_name, ami_instance_ip in instances_ips:
                 if ami_instance_name == tests_settings.serverVersion:  # Only run tests for given AMI Role
                     current_instance = ami_instance_ip
-                    tests_allocation_for_instance = test_allocation[current_thread_index]
-
-                    unmockable_tests = [test for test in all_unmockable_tests_list
-                                        if test in tests_allocation_for_instance]
-                    mockable_tests = [test for test in tests_allocation_for_instance if test not in unmockable_tests]
                     print_color("Starting tests for {}".format(ami_instance_name), LOG_COLORS.GREEN)
                     print("Starts tests with server url - https://{}".format(ami_instance_ip))
 
                     if number_of_instances == 1:
-                        execute_testing(tests_settings, current_instance, mockable_tests, unmockable_tests,
-                                        tests_data_keeper, prints_manager, thread_index=0, is_ami=True)
+                        execute_testing(tests_settings, current_instance, [], [], tests_data_keeper, prints_manager,
+                                        thread_index=0, is_ami=True, tests_queue=tests_queue)
                     else:
                         thread_kwargs = {
                             "tests_settings": tests_settings,
                             "server_ip": current_instance,
-                            "mockable_tests_names": mockable_tests,
-                            "unmockable_tests_names": unmockable_tests,
+                            "mockable_tests_names": [],
+                            "unmockable_tests_names": [],
                             "thread_index": current_thread_index,
                             "prints_manager": prints_manager,
-                            "tests_data_keeper": tests_data_keeper
+                            "tests_data_keeper": tests_data_keeper,
+                            "tests_queue": tests_queue
                         }
                         t = threading.Thread(target=execute_testing, kwargs=thread_kwargs)
                         threads_array.append(t)
@@ -1,5 +1,8 @@
 import json
-import math
+import os
+import threading
+
+DEFAULT_TEST_DURATION = 60  # The estimated duration in seconds of a test which has no durations history
 
 
 class TestVertex:
@@ -153,54 +156,84 @@ def get_dependent_integrations_clusters_data(tests_file_path, dependent_tests):
     return tests_graph.clusters
 
 
-def get_tests_allocation_for_threads(number_of_instances, tests_file_path):
+def get_tests_durations(durations_file_path):
+    """Loads the durations in seconds of the tests, as measured in previous builds.
+
+    Args:
+        durations_file_path (str): The path of the durations file, which is created by the previous builds.
+
+    Returns:
+        dict: The duration of each test, or an empty dict if there is no durations file.
+    """
+    if not os.path.isfile(durations_file_path):
+        return {}
+    with open(durations_file_path, 'r') as durations_file:
+        try:
+            return json.load(durations_file)
+        except ValueError:
+            return {}
+
+
+def get_test_units(tests_file_path):
+    """Groups the tests to the units which are scheduled to the instances.
+
+    Each cluster of tests which use mutual integrations is a single unit, as its tests need to be run sequentially on
+    the same instance. Each independent test is a unit of its own.
+
+    Args:
+        tests_file_path (str): The path of conf.json.
+
+    Returns:
+        list: The units, each of them is a list of test names.
+    """
     dependent_tests, independent_tests, all_tests = get_test_dependencies(tests_file_path)
     dependent_tests_clusters = get_dependent_integrations_clusters_data(tests_file_path, dependent_tests)
-    dependent_tests_clusters.sort(key=len, reverse=True)  # Sort the clusters from biggest to smallest
-    tests_allocation = []
-    number_of_tests_left = len(all_tests)
-    while number_of_tests_left > 0:
-        allocations_left = number_of_instances - len(tests_allocation)
-        desired_tests_per_allocation = math.ceil(number_of_tests_left / allocations_left)  # We prefer an equal division of tests.
-        current_allocation = []
-
-        # If we have one allocation left, add all tests to it and finish
-        if allocations_left == 1:
-            for tests_cluster in dependent_tests_clusters:
-                current_allocation.extend(tests_cluster)
-            for test_name in independent_tests:
-                current_allocation.append(test_name)
-            tests_allocation.append(current_allocation)
-            break
-
-        if len(dependent_tests_clusters) > 0:
-            # Even if the first cluster is bigger than the desired amount, we have to add it to the allocation.
-            # If we don't, it will not be added to any allocation.
-            first_cluster = dependent_tests_clusters.pop(0)
-            first_cluster_size = len(first_cluster)
-            current_allocation.extend(first_cluster)
-            number_of_tests_left -= first_cluster_size
-
-        if len(current_allocation) >= desired_tests_per_allocation:
-            tests_allocation.append(current_allocation)
-            continue
-
-        clusters_added = 0
-        for cluster in dependent_tests_clusters:
-            cluster_size = len(cluster)
-            if len(current_allocation) + cluster_size > desired_tests_per_allocation:
-                # Will fill the quota from the independent test lists.
-                break
-            current_allocation.extend(cluster)
-            number_of_tests_left -= cluster_size
-            clusters_added += 1
-
-        del dependent_tests_clusters[:clusters_added]
-
-        num_of_tests_to_add = int(desired_tests_per_allocation - len(current_allocation))
-        independent_tests_to_add = independent_tests[:num_of_tests_to_add]
-        current_allocation.extend(independent_tests_to_add)
-        del independent_tests[:num_of_tests_to_add]
-
-        tests_allocation.append(current_allocation)
-    return tests_allocation
+    return dependent_tests_clusters + [[test_name] for test_name in independent_tests if test_name]
+
+
+class TestsQueue:
+    """A queue of tests which is shared by the threads that run the tests on the instances.
+
+    Instead of dividing the tests between the instances before the run, each instance takes the longest unit of tests
+    which is left whenever it is done with its previous unit, so the instances which got short tests take more of
+    them, and all the instances finish at about the same time.
+
+    Attributes:
+        unmockable_tests (set): The names of the tests which can not be run with mocks.
+        tests_durations (dict): The estimated duration in seconds of each test, by the durations of previous builds.
+        default_test_duration (float): The estimated duration of a test with no durations history - the average
+            duration of the other tests.
+        units (list): The units of tests which were not taken yet, sorted from the longest to the shortest.
+
+    """
+    def __init__(self, test_units, unmockable_tests, tests_durations):
+        self.unmockable_tests = set(unmockable_tests)
+        self.tests_durations = tests_durations
+        if tests_durations:
+            self.default_test_duration = sum(tests_durations.values()) / float(len(tests_durations))
+        else:
+            self.default_test_duration = DEFAULT_TEST_DURATION
+        self.units = sorted(test_units, key=self.get_unit_duration, reverse=True)
+        self.lock = threading.Lock()
+
+    def get_unit_duration(self, unit):
+        return sum(self.tests_durations.get(test_name, self.default_test_duration) for test_name in unit)
+
+    def has_mockable_tests(self, unit):
+        return any(test_name not in self.unmockable_tests for test_name in unit)
+
+    def get_next_unit(self, mockable):
+        """Takes the longest unit of tests which is left.
+
+        Args:
+            mockable (bool): Whether to take only units which have mockable tests. The mockable tests of each
+                instance are run before its unmockable tests.
+
+        Returns:
+            list: The names of the tests of the unit, or None if there are no units left.
+        """
+        with self.lock:
+            for i, unit in enumerate(self.units):
+                if not mockable or self.has_mockable_tests(unit):
+                    return self.units.pop(i)
+        return None